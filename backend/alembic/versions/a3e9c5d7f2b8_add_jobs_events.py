@@ -0,0 +1,37 @@
+"""add jobs.events (append-only progress log)
+
+Background ingestion reports per-file progress by appending to this array;
+the upload SSE endpoint replays it from any offset, so a client that drops
+the connection can re-attach without losing events or the work itself.
+
+Revision ID: a3e9c5d7f2b8
+Revises: f6a1d3c8b2e7
+Create Date: 2026-10-17 00:00:00.000000
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision = "a3e9c5d7f2b8"
+down_revision = "f6a1d3c8b2e7"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "jobs",
+        sa.Column(
+            "events",
+            postgresql.JSONB(astext_type=sa.Text()),
+            nullable=False,
+            server_default=sa.text("'[]'::jsonb"),
+        ),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("jobs", "events")
@@ -0,0 +1,34 @@
+"""add a (session_id, files_id) btree on embeddings
+
+Every retrieval query, the per-file delete on re-upload and the keyword index
+refresh filter embeddings by session (and often file), but the table only had
+its primary key, the HNSW index and the GIN index, so each of them was a
+sequential scan over every session's chunks. The btree lets the `exact`
+vector-search plan (services/vector_search.py) read just one session's rows
+before sorting by distance.
+
+Revision ID: a6c2e9f4b1d8
+Revises: e4b8c2d7a1f3
+Create Date: 2026-10-17 00:00:00.000000
+"""
+from __future__ import annotations
+
+from alembic import op
+
+
+revision = "a6c2e9f4b1d8"
+down_revision = "e4b8c2d7a1f3"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "embeddings_session_files_idx",
+        "embeddings",
+        ["session_id", "files_id"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("embeddings_session_files_idx", table_name="embeddings")
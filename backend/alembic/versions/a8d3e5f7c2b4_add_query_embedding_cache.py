@@ -0,0 +1,51 @@
+"""add query_embedding_cache table
+
+Shared backing store for the in-process query-embedding cache
+(QUERY_EMBED_CACHE_SHARED=1), so repeated study-focus prompts skip the
+embedding round trip on every uvicorn worker, not just the one that saw them
+first. Keyed by a hash of backend, model, dimension and normalized text.
+
+Revision ID: a8d3e5f7c2b4
+Revises: f2a9c4e8b6d1
+Create Date: 2026-10-17 00:00:00.000000
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+from pgvector.sqlalchemy import Vector
+
+
+revision = "a8d3e5f7c2b4"
+down_revision = "f2a9c4e8b6d1"
+branch_labels = None
+depends_on = None
+
+VECTOR_DIM = 768
+
+
+def upgrade() -> None:
+    op.create_table(
+        "query_embedding_cache",
+        sa.Column("cache_key", sa.String(length=64), primary_key=True),
+        sa.Column("backend", sa.String(length=32), nullable=False),
+        sa.Column("model", sa.String(length=255), nullable=False),
+        sa.Column("dim", sa.Integer(), nullable=False),
+        sa.Column("embedding", Vector(VECTOR_DIM), nullable=False),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+    )
+    op.create_index(
+        "query_embedding_cache_created_at_idx",
+        "query_embedding_cache",
+        ["created_at"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("query_embedding_cache_created_at_idx", table_name="query_embedding_cache")
+    op.drop_table("query_embedding_cache")
@@ -0,0 +1,119 @@
+"""hash-partition embeddings by session_id
+
+Sessions are the tenant boundary: every read filters on session_id, re-upload
+deletes one session's file rows, and cleanup drops whole sessions. With one
+shared table each of those competes for the same heap, HNSW graph and vacuum
+cycle. Hash partitions keep each session in a single partition, so pruning
+limits reads, deletes and KNN to that partition, and vacuum / index
+maintenance run on partition-sized pieces.
+
+The table is rebuilt (copy into a partitioned twin, swap names), so run it in
+a maintenance window on a large table. The partition key has to be part of
+the primary key, which becomes (id, session_id); ids keep coming from the
+existing sequence. Indexes are declared on the parent and created on every
+partition:
+  EMBEDDING_PARTITIONS  (default 16)  number of hash partitions, fixed here
+  HNSW_M / HNSW_EF_CONSTRUCTION       as in e4b8c2d7a1f3
+
+Revision ID: b8e1d4a7c3f5
+Revises: a6c2e9f4b1d8
+Create Date: 2026-10-17 00:00:00.000000
+"""
+from __future__ import annotations
+
+import os
+
+from alembic import op
+
+
+revision = "b8e1d4a7c3f5"
+down_revision = "a6c2e9f4b1d8"
+branch_labels = None
+depends_on = None
+
+VECTOR_DIM = 768
+# Must match KEYWORD_TS_CONFIG in db/models.py.
+TS_CONFIG = "english"
+COLUMNS = "id, files_id, session_id, filename, content_type, chunk_index, content, embedding"
+
+
+def _create_table(name: str, *, partitions: int | None) -> None:
+    primary_key = "id, session_id" if partitions else "id"
+    op.execute(
+        f"""
+        CREATE TABLE {name} (
+            id integer NOT NULL DEFAULT nextval('embeddings_id_seq'),
+            files_id integer NOT NULL,
+            session_id uuid NOT NULL,
+            filename varchar(512) NOT NULL,
+            content_type varchar(255),
+            chunk_index integer NOT NULL,
+            content text NOT NULL,
+            embedding vector({VECTOR_DIM}) NOT NULL,
+            content_tsv tsvector
+                GENERATED ALWAYS AS (to_tsvector('{TS_CONFIG}', content)) STORED,
+            CONSTRAINT {name}_pkey PRIMARY KEY ({primary_key})
+        ){" PARTITION BY HASH (session_id)" if partitions else ""}
+        """
+    )
+    for remainder in range(partitions or 0):
+        op.execute(
+            f"CREATE TABLE embeddings_p{remainder} PARTITION OF {name} "
+            f"FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})"
+        )
+
+
+def _swap_in(name: str) -> None:
+    """Copy rows into ``name``, drop the old table and take over its name."""
+    op.execute(f"INSERT INTO {name} ({COLUMNS}) SELECT {COLUMNS} FROM embeddings")
+    # The old table owns the id sequence; hand it over before dropping it.
+    op.execute(f"ALTER SEQUENCE embeddings_id_seq OWNED BY {name}.id")
+    op.execute("DROP TABLE embeddings")
+    op.execute(f"ALTER TABLE {name} RENAME TO embeddings")
+    # Renames the backing index too.
+    op.execute(f"ALTER TABLE embeddings RENAME CONSTRAINT {name}_pkey TO embeddings_pkey")
+
+
+def _create_indexes_and_keys() -> None:
+    m = int(os.getenv("HNSW_M", "16"))
+    ef_construction = int(os.getenv("HNSW_EF_CONSTRUCTION", "64"))
+    op.create_foreign_key(
+        "embeddings_files_id_fkey", "embeddings", "notes", ["files_id"], ["id"]
+    )
+    op.create_foreign_key(
+        "embeddings_session_id_fkey", "embeddings", "sessions", ["session_id"], ["id"]
+    )
+    op.create_index(
+        "embeddings_embedding_hnsw_idx",
+        "embeddings",
+        ["embedding"],
+        postgresql_using="hnsw",
+        postgresql_ops={"embedding": "vector_cosine_ops"},
+        postgresql_with={"m": m, "ef_construction": ef_construction},
+    )
+    op.create_index(
+        "embeddings_content_tsv_idx",
+        "embeddings",
+        ["content_tsv"],
+        postgresql_using="gin",
+    )
+    op.create_index(
+        "embeddings_session_files_idx",
+        "embeddings",
+        ["session_id", "files_id"],
+    )
+
+
+def upgrade() -> None:
+    partitions = int(os.getenv("EMBEDDING_PARTITIONS", "16"))
+    if partitions < 1:
+        raise ValueError("EMBEDDING_PARTITIONS must be at least 1")
+    _create_table("embeddings_partitioned", partitions=partitions)
+    _swap_in("embeddings_partitioned")
+    _create_indexes_and_keys()
+
+
+def downgrade() -> None:
+    _create_table("embeddings_unpartitioned", partitions=None)
+    _swap_in("embeddings_unpartitioned")
+    _create_indexes_and_keys()
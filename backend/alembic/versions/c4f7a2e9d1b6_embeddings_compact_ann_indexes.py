@@ -0,0 +1,60 @@
+"""build the embedding ANN indexes on halfvec / binary-quantized expressions
+
+The full-precision HNSW index stores every 768-dim vector as float4 again
+(~3 KB per chunk plus graph), which is what crowds shared_buffers. It is
+replaced by two expression indexes over the same column:
+  embeddings_embedding_halfvec_idx  embedding::halfvec(768), halfvec_cosine_ops
+  embeddings_embedding_binary_idx   binary_quantize(embedding)::bit(768), bit_hamming_ops
+The query side (EMBEDDING_COARSE_SEARCH in services/embedding_service.py)
+shortlists on one of them and re-ranks the shortlist by exact cosine distance
+against the full-precision heap, which stays vector(768). Needs pgvector 0.7+.
+
+HNSW_M / HNSW_EF_CONSTRUCTION apply as in e4b8c2d7a1f3.
+
+Revision ID: c4f7a2e9d1b6
+Revises: b8e1d4a7c3f5
+Create Date: 2026-10-17 00:00:00.000000
+"""
+from __future__ import annotations
+
+import os
+
+from alembic import op
+
+
+revision = "c4f7a2e9d1b6"
+down_revision = "b8e1d4a7c3f5"
+branch_labels = None
+depends_on = None
+
+VECTOR_DIM = 768
+FULL_INDEX = "embeddings_embedding_hnsw_idx"
+HALFVEC_INDEX = "embeddings_embedding_halfvec_idx"
+BINARY_INDEX = "embeddings_embedding_binary_idx"
+
+
+def _with() -> str:
+    m = int(os.getenv("HNSW_M", "16"))
+    ef_construction = int(os.getenv("HNSW_EF_CONSTRUCTION", "64"))
+    return f"WITH (m = {m}, ef_construction = {ef_construction})"
+
+
+def upgrade() -> None:
+    op.execute(f"DROP INDEX IF EXISTS {FULL_INDEX}")
+    op.execute(
+        f"CREATE INDEX {HALFVEC_INDEX} ON embeddings USING hnsw "
+        f"((embedding::halfvec({VECTOR_DIM})) halfvec_cosine_ops) {_with()}"
+    )
+    op.execute(
+        f"CREATE INDEX {BINARY_INDEX} ON embeddings USING hnsw "
+        f"((binary_quantize(embedding)::bit({VECTOR_DIM})) bit_hamming_ops) {_with()}"
+    )
+
+
+def downgrade() -> None:
+    op.execute(f"DROP INDEX IF EXISTS {BINARY_INDEX}")
+    op.execute(f"DROP INDEX IF EXISTS {HALFVEC_INDEX}")
+    op.execute(
+        f"CREATE INDEX {FULL_INDEX} ON embeddings USING hnsw "
+        f"(embedding vector_cosine_ops) {_with()}"
+    )
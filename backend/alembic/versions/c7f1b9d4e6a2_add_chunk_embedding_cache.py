@@ -0,0 +1,83 @@
+"""add chunk_embedding_cache (content-addressed chunk vectors)
+
+Maps sha256(chunk text) -> vector, scoped by embedding backend, model and
+dimension. The upload pipeline and `_ensure_embeddings` consult it before
+calling the embedding backend, so re-uploading a vault with one edited note —
+or re-embedding after a reset like b4d1f8a05c37 — only embeds new text.
+
+The cache is seeded from the existing `embeddings` rows, attributed to the
+backend/model this deployment is configured with (same env vars the API
+reads). Set CHUNK_EMBED_CACHE_SEED=0 to skip seeding if the stored vectors
+came from a different model than the one configured now.
+
+Revision ID: c7f1b9d4e6a2
+Revises: a8d3e5f7c2b4
+Create Date: 2026-10-17 00:00:00.000000
+"""
+from __future__ import annotations
+
+import os
+
+from alembic import op
+import sqlalchemy as sa
+from pgvector.sqlalchemy import Vector
+
+
+revision = "c7f1b9d4e6a2"
+down_revision = "a8d3e5f7c2b4"
+branch_labels = None
+depends_on = None
+
+VECTOR_DIM = 768
+
+
+def _configured_backend_and_model() -> tuple[str, str]:
+    env = os.getenv("ENV", "DEV").upper()
+    backend = os.getenv(
+        "EMBEDDING_BACKEND",
+        "ollama" if env in {"DEV", "DEVELOPMENT"} else "openrouter",
+    ).lower()
+    if backend == "ollama":
+        return backend, os.getenv("OLLAMA_EMBED_MODEL", "nomic-embed-text")
+    return backend, os.getenv("OPENROUTER_EMBED_MODEL", "openai/text-embedding-3-small")
+
+
+def upgrade() -> None:
+    op.create_table(
+        "chunk_embedding_cache",
+        sa.Column("content_hash", sa.String(length=64), nullable=False),
+        sa.Column("backend", sa.String(length=32), nullable=False),
+        sa.Column("model", sa.String(length=255), nullable=False),
+        sa.Column("dim", sa.Integer(), nullable=False),
+        sa.Column("embedding", Vector(VECTOR_DIM), nullable=False),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.PrimaryKeyConstraint("content_hash", "backend", "model", "dim"),
+    )
+
+    if os.getenv("CHUNK_EMBED_CACHE_SEED", "1").strip().lower() in {"0", "false", "no"}:
+        return
+    backend, model = _configured_backend_and_model()
+    op.get_bind().execute(
+        sa.text(
+            """
+            INSERT INTO chunk_embedding_cache (content_hash, backend, model, dim, embedding)
+            SELECT DISTINCT ON (content_hash) content_hash, :backend, :model, :dim, embedding
+            FROM (
+                SELECT encode(sha256(convert_to(content, 'UTF8')), 'hex') AS content_hash,
+                       embedding
+                FROM embeddings
+            ) hashed
+            ON CONFLICT DO NOTHING
+            """
+        ),
+        {"backend": backend, "model": model, "dim": VECTOR_DIM},
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("chunk_embedding_cache")
@@ -0,0 +1,38 @@
+"""add notes.content_hash / notes.embedding_hash for incremental re-upload
+
+`content_hash` is sha256(raw_content) and lets the upload pipeline skip
+byte-identical notes. `embedding_hash` is sha256 of the text the stored
+embeddings were built from (content plus baked-in backlinks), so unchanged
+notes whose backlink set moved can be found and re-embedded on their own.
+
+Existing rows get `content_hash` backfilled; `embedding_hash` stays NULL, so
+the first re-upload after this migration re-embeds each note once.
+
+Revision ID: d3a6b2f9e8c5
+Revises: c7f1b9d4e6a2
+Create Date: 2026-10-17 00:00:00.000000
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "d3a6b2f9e8c5"
+down_revision = "c7f1b9d4e6a2"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("notes", sa.Column("content_hash", sa.String(length=64), nullable=True))
+    op.add_column("notes", sa.Column("embedding_hash", sa.String(length=64), nullable=True))
+    op.execute(
+        "UPDATE notes SET content_hash = encode(sha256(raw_content), 'hex') "
+        "WHERE raw_content IS NOT NULL"
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("notes", "embedding_hash")
+    op.drop_column("notes", "content_hash")
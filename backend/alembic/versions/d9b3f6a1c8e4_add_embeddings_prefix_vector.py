@@ -0,0 +1,54 @@
+"""add a generated 256-dim prefix vector to embeddings + HNSW index
+
+Both embedding models are Matryoshka-trained, so the first 256 dims of each
+768-dim vector are a usable low-resolution embedding. Storing that prefix as a
+generated column gives coarse-to-fine search (FLASHCARD_COARSE_TO_FINE, or
+EMBEDDING_COARSE_SEARCH=prefix) a third-size HNSW graph to shortlist on, with
+the re-rank done on the full vector. Being generated, it covers existing rows
+and needs no change to the write paths (the COPY writer names its columns).
+
+Adding a stored generated column rewrites the table; run it in the same kind
+of maintenance window as b8e1d4a7c3f5. Needs pgvector 0.7+ for subvector().
+
+Revision ID: d9b3f6a1c8e4
+Revises: c4f7a2e9d1b6
+Create Date: 2026-10-17 00:00:00.000000
+"""
+from __future__ import annotations
+
+import os
+
+from alembic import op
+
+
+revision = "d9b3f6a1c8e4"
+down_revision = "c4f7a2e9d1b6"
+branch_labels = None
+depends_on = None
+
+# Must match EMBEDDING_PREFIX_DIM in services/embedding_service.py.
+PREFIX_DIM = 256
+PREFIX_INDEX = "embeddings_embedding_prefix_hnsw_idx"
+
+
+def upgrade() -> None:
+    m = int(os.getenv("HNSW_M", "16"))
+    ef_construction = int(os.getenv("HNSW_EF_CONSTRUCTION", "64"))
+    op.execute(
+        f"ALTER TABLE embeddings ADD COLUMN embedding_prefix vector({PREFIX_DIM}) "
+        f"GENERATED ALWAYS AS (subvector(embedding, 1, {PREFIX_DIM})::vector({PREFIX_DIM})) "
+        "STORED"
+    )
+    op.create_index(
+        PREFIX_INDEX,
+        "embeddings",
+        ["embedding_prefix"],
+        postgresql_using="hnsw",
+        postgresql_ops={"embedding_prefix": "vector_cosine_ops"},
+        postgresql_with={"m": m, "ef_construction": ef_construction},
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(PREFIX_INDEX, table_name="embeddings")
+    op.drop_column("embeddings", "embedding_prefix")
@@ -0,0 +1,57 @@
+"""replace the ivfflat embedding index with HNSW
+
+The ivfflat index from 3c2e7e6f1a9b was built on an empty table, so its
+lists=100 centroids are meaningless, and it was never retrained after
+b4d1f8a05c37 reloaded the data. HNSW needs no training step, stays accurate
+as rows are added, and is tuned at query time with `hnsw.ef_search`
+(HNSW_EF_SEARCH in services/vector_search.py).
+
+Build parameters come from the environment so they can be tuned with
+`benchmarks/ann_recall.py` before migrating prod:
+  HNSW_M                (default 16)  graph degree; more = better recall, bigger index
+  HNSW_EF_CONSTRUCTION  (default 64)  build-time candidate list; more = slower build
+
+Revision ID: e4b8c2d7a1f3
+Revises: d3a6b2f9e8c5
+Create Date: 2026-10-17 00:00:00.000000
+"""
+from __future__ import annotations
+
+import os
+
+from alembic import op
+
+
+revision = "e4b8c2d7a1f3"
+down_revision = "d3a6b2f9e8c5"
+branch_labels = None
+depends_on = None
+
+HNSW_INDEX = "embeddings_embedding_hnsw_idx"
+IVFFLAT_INDEX = "embeddings_embedding_idx"
+
+
+def upgrade() -> None:
+    m = int(os.getenv("HNSW_M", "16"))
+    ef_construction = int(os.getenv("HNSW_EF_CONSTRUCTION", "64"))
+    op.execute(f"DROP INDEX IF EXISTS {IVFFLAT_INDEX}")
+    op.create_index(
+        HNSW_INDEX,
+        "embeddings",
+        ["embedding"],
+        postgresql_using="hnsw",
+        postgresql_ops={"embedding": "vector_cosine_ops"},
+        postgresql_with={"m": m, "ef_construction": ef_construction},
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(HNSW_INDEX, table_name="embeddings")
+    op.create_index(
+        IVFFLAT_INDEX,
+        "embeddings",
+        ["embedding"],
+        postgresql_using="ivfflat",
+        postgresql_ops={"embedding": "vector_cosine_ops"},
+        postgresql_with={"lists": 100},
+    )
@@ -0,0 +1,41 @@
+"""add embeddings.content_tsv full-text column + GIN index
+
+Backs the `postgres` keyword retrieval backend (FLASHCARD_KEYWORD_BACKEND):
+keyword ranking runs in the database with `ts_rank_cd` instead of shipping
+chunk text to the API process for rank_bm25. The column is generated, so every
+existing and future row is covered without touching the write paths.
+
+Revision ID: f2a9c4e8b6d1
+Revises: b4d1f8a05c37
+Create Date: 2026-10-17 00:00:00.000000
+"""
+from __future__ import annotations
+
+from alembic import op
+
+
+revision = "f2a9c4e8b6d1"
+down_revision = "b4d1f8a05c37"
+branch_labels = None
+depends_on = None
+
+# Must match KEYWORD_TS_CONFIG in db/models.py.
+TS_CONFIG = "english"
+
+
+def upgrade() -> None:
+    op.execute(
+        "ALTER TABLE embeddings ADD COLUMN content_tsv tsvector "
+        f"GENERATED ALWAYS AS (to_tsvector('{TS_CONFIG}', content)) STORED"
+    )
+    op.create_index(
+        "embeddings_content_tsv_idx",
+        "embeddings",
+        ["content_tsv"],
+        postgresql_using="gin",
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("embeddings_content_tsv_idx", table_name="embeddings")
+    op.drop_column("embeddings", "content_tsv")
@@ -0,0 +1,178 @@
+"""Pick HNSW parameters from recall@k vs. latency against exact search.
+
+For each dataset prompt this embeds the query once, computes the exact top-k
+(index scans disabled, so Postgres does a full distance sort) and then runs the
+app's two-stage ANN search — shortlist on a compact HNSW index, re-rank by
+exact distance — for each coarse representation (``halfvec``, ``binary``,
+``prefix``) and ``hnsw.ef_search`` value. Recall@k is the overlap between the
+ANN and exact id sets. No LLM calls.
+
+What to look for:
+  - ``recall@k`` : fraction of the exact top-k the search returned — want ≥ 0.95.
+  - ``p50_ms`` / ``p95_ms`` : KNN latency (shortlist + re-rank).
+Pick the coarse mode and the smallest ef_search that reach the recall target
+and set EMBEDDING_COARSE_SEARCH / HNSW_EF_SEARCH. ``binary`` usually needs a
+larger ``--rerank`` (EMBEDDING_RERANK_MULTIPLIER) to get there. If nothing
+does, rebuild the indexes with a larger HNSW_M / HNSW_EF_CONSTRUCTION (see
+migration c4f7a2e9d1b6).
+
+``--scope global`` searches the whole table (what the index is built for);
+``--scope session`` adds the eval-session filter the app uses, which shows
+post-filtering losses on a shared table.
+
+Usage (from backend/, with DATABASE_URL pointing at a DB with real data):
+  python -m benchmarks.ann_recall --profile dev --k 10 --ef-search 20 40 80 160
+  python -m benchmarks.ann_recall --profile dev --coarse binary --rerank 4 8 16
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from pathlib import Path
+
+from benchmarks.config import EVAL_SESSION_ID, apply_profile
+
+DATASET = Path(__file__).parent / "dataset.jsonl"
+DEFAULT_EF_SEARCH = [10, 20, 40, 80, 160, 320]
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--profile", default="dev")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--ef-search", type=int, nargs="+", default=DEFAULT_EF_SEARCH)
+    parser.add_argument("--scope", choices=["global", "session"], default="global")
+    parser.add_argument(
+        "--coarse",
+        nargs="+",
+        choices=["halfvec", "binary", "prefix"],
+        default=["halfvec", "binary", "prefix"],
+    )
+    parser.add_argument(
+        "--rerank", type=int, nargs="+", default=None,
+        help="shortlist multipliers (default: each mode's EMBEDDING_RERANK_MULTIPLIER)",
+    )
+    parser.add_argument("--repeats", type=int, default=3, help="timed runs per query")
+    args = parser.parse_args()
+    apply_profile(args.profile)
+
+    # Imported after apply_profile so backend constants pick up the profile env.
+    from sqlalchemy import text as sql_text
+
+    from db.session import SessionLocal
+    from services.embedding_service import (
+        EMBEDDING_TABLE,
+        coarse_distance_sql,
+        embed_query_sync,
+        rerank_multiplier,
+    )
+    from services.vector_search import HNSW_EF_SEARCH_MAX
+
+    where = "WHERE session_id = :sid " if args.scope == "session" else ""
+    exact_knn = sql_text(
+        f"SELECT id FROM {EMBEDDING_TABLE} {where}"
+        "ORDER BY embedding <=> (:qvec)::vector LIMIT :k"
+    )
+
+    def two_stage_knn(mode: str):
+        # Same shape as services/vector_search.py's `ann` plan.
+        return sql_text(
+            "WITH shortlist AS MATERIALIZED ("
+            f"SELECT id, embedding FROM {EMBEDDING_TABLE} {where}"
+            f"ORDER BY {coarse_distance_sql('(:qvec)::vector', mode)} LIMIT :shortlist) "
+            "SELECT id FROM shortlist ORDER BY embedding <=> (:qvec)::vector LIMIT :k"
+        )
+
+
+    prompts = [
+        json.loads(line).get("prompt")
+        for line in DATASET.read_text().splitlines()
+        if line.strip() and not line.startswith("#")
+    ]
+    prompts = [p for p in prompts if p]
+    if not prompts:
+        raise SystemExit("Dataset has no prompts.")
+
+    db = SessionLocal()
+    try:
+        total = db.execute(sql_text(f"SELECT count(*) FROM {EMBEDDING_TABLE}")).scalar()
+        print(f"{EMBEDDING_TABLE}: {total} rows, scope={args.scope}, k={args.k}, {len(prompts)} queries")
+
+        queries = []
+        for prompt in prompts:
+            params = {"qvec": embed_query_sync(prompt).tolist(), "k": args.k, "sid": EVAL_SESSION_ID}
+            # Exact baseline: no index scans, so every row is scored.
+            db.execute(sql_text("SET LOCAL enable_indexscan = off"))
+            db.execute(sql_text("SET LOCAL enable_bitmapscan = off"))
+            started = time.perf_counter()
+            exact = {row.id for row in db.execute(exact_knn, params).fetchall()}
+            exact_ms = (time.perf_counter() - started) * 1000
+            db.rollback()
+            queries.append((params, exact, exact_ms))
+
+        exact_latencies = [ms for _, _, ms in queries]
+        print(
+            f"  exact        p50={_percentile(exact_latencies, 50):7.2f}ms "
+            f"p95={_percentile(exact_latencies, 95):7.2f}ms"
+        )
+        print(
+            f"  {'coarse':>7} {'rerank':>6} {'ef_search':>9} "
+            f"{'recall@k':>9} {'p50_ms':>8} {'p95_ms':>8}"
+        )
+        for mode in args.coarse:
+            knn = two_stage_knn(mode)
+            for multiplier in args.rerank or [rerank_multiplier(mode)]:
+                shortlist = args.k * max(1, multiplier)
+                for ef_search in args.ef_search:
+                    recalls: list[float] = []
+                    latencies: list[float] = []
+                    for params, exact, _ in queries:
+                        # Mirror the app: ef_search never below the shortlist size.
+                        db.execute(
+                            sql_text(
+                                "SELECT set_config('hnsw.ef_search', :ef, true), "
+                                "set_config('hnsw.iterative_scan', 'strict_order', true)"
+                            ),
+                            {"ef": str(min(HNSW_EF_SEARCH_MAX, max(ef_search, shortlist)))},
+                        )
+                        found: set[int] = set()
+                        for _ in range(max(1, args.repeats)):
+                            started = time.perf_counter()
+                            found = {
+                                row.id
+                                for row in db.execute(
+                                    knn, {**params, "shortlist": shortlist}
+                                ).fetchall()
+                            }
+                            latencies.append((time.perf_counter() - started) * 1000)
+                        db.rollback()
+                        if exact:
+                            recalls.append(len(found & exact) / len(exact))
+                    recall = sum(recalls) / len(recalls) if recalls else 0.0
+                    print(
+                        f"  {mode:>7} {multiplier:>6} {ef_search:>9} {recall:>9.3f} "
+                        f"{_percentile(latencies, 50):>8.2f} "
+                        f"{_percentile(latencies, 95):>8.2f}"
+                    )
+    finally:
+        db.close()
+
+    print(
+        "\nSet EMBEDDING_COARSE_SEARCH / EMBEDDING_RERANK_MULTIPLIER / HNSW_EF_SEARCH "
+        "to the cheapest row meeting your recall target, "
+        "then run the benchmark to confirm end-to-end quality."
+    )
+
+
+if __name__ == "__main__":
+    main()
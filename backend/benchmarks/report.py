@@ -75,6 +75,7 @@ def main() -> None:
 
     rows = []
     recalls, mrrs, hits, format_pass, latencies = [], [], [], [], []
+    retrieval_latencies, embed_calls = [], []
     for rec in records:
         ret = retrieval_scorer.score(rec)
         fmt = format_scorer.score(rec)
@@ -87,6 +88,12 @@ def main() -> None:
         format_pass.append(1.0 if fmt["passed"] else 0.0)
         if rec.get("error") is None:
             latencies.append(rec["latency_s"])
+            timings = rec.get("timings") or {}
+            if isinstance(timings.get("retrieval_s"), (int, float)):
+                retrieval_latencies.append(float(timings["retrieval_s"]))
+            stats = rec.get("retrieval_stats") or {}
+            if isinstance(stats.get("embed_calls"), int):
+                embed_calls.append(stats["embed_calls"])
 
         rows.append(
             {
@@ -130,6 +137,18 @@ def main() -> None:
             if latencies else 0.0
         ),
     }
+    # Retrieval-only latency (no LLM), so retrieval backends can be compared
+    # without generation noise. Older runs without timings simply omit it.
+    if retrieval_latencies:
+        summary["retrieval_p50"] = statistics.median(retrieval_latencies)
+        summary["retrieval_p95"] = sorted(retrieval_latencies)[
+            max(0, int(len(retrieval_latencies) * 0.95) - 1)
+        ]
+    # Query embeddings per generation; should never exceed 1 (see RetrievalContext).
+    if embed_calls:
+        summary["embed_calls_max"] = max(embed_calls)
+    if meta.get("keyword_backend"):
+        summary["keyword_backend"] = meta["keyword_backend"]
     # Opt-in, paid, non-deterministic LLM-judge tier. Prod profile only — dev/
     # dev-prodllm retrieval isn't prod-faithful (see the Benchmarking section in
     # the root README), so judging their grounding would be misleading. Never
@@ -6,6 +6,11 @@ results are written before scoring so the (paid) LLM output can be re-scored
 without re-running generation.
 
 Usage (from backend/):  python -m benchmarks.runner --profile dev
+
+Compare keyword retrieval backends by running once per backend and diffing the
+``retrieval_p50`` / ``retrieval_p95`` and retrieval scores in each summary.json:
+  python -m benchmarks.runner --profile dev --keyword-backend bm25
+  python -m benchmarks.runner --profile dev --keyword-backend postgres
 """
 
 from __future__ import annotations
@@ -14,6 +19,7 @@ import argparse
 import asyncio
 import contextlib
 import json
+import os
 import time
 from datetime import datetime, timezone
 from pathlib import Path
@@ -40,10 +46,10 @@ def load_cases() -> list[dict]:
 
 async def run_case(case: dict, *, lf=None, profile: str | None = None, sha: str | None = None) -> dict:
     # Imported lazily so apply_profile() has already set the backends.
-    from db.session import SessionLocal
+    from db.session import AsyncSessionLocal
     from services.flashcards_service import generate_flashcards
 
-    db = SessionLocal()
+    db = AsyncSessionLocal()
     t0 = time.perf_counter()
     error = None
     result = None
@@ -70,7 +76,7 @@ async def run_case(case: dict, *, lf=None, profile: str | None = None, sha: str
         except Exception as exc:  # noqa: BLE001 - record any failure as a result
             error = f"{type(exc).__name__}: {exc}"
         finally:
-            db.close()
+            await db.close()
         latency_s = time.perf_counter() - t0
 
         record = {
@@ -82,6 +88,8 @@ async def run_case(case: dict, *, lf=None, profile: str | None = None, sha: str
             "sources": (result or {}).get("sources"),
             "raw": (result or {}).get("raw"),
             "model_used": (result or {}).get("model_used"),
+            "timings": (result or {}).get("timings"),
+            "retrieval_stats": (result or {}).get("retrieval_stats"),
         }
 
         if lf is not None:
@@ -110,7 +118,12 @@ async def main_async(profile: str, *, lf=None) -> Path:
 
     (run_dir / "meta.json").write_text(
         json.dumps(
-            {"profile": profile, "n_cases": len(cases), **({"git_sha": sha} if sha else {})},
+            {
+                "profile": profile,
+                "n_cases": len(cases),
+                "keyword_backend": os.getenv("FLASHCARD_KEYWORD_BACKEND", "bm25"),
+                **({"git_sha": sha} if sha else {}),
+            },
             indent=2,
         )
     )
@@ -129,8 +142,16 @@ def main() -> None:
         action="store_true",
         help="export one trace per case to Langfuse Cloud (opt-in); needs LANGFUSE_* env",
     )
+    parser.add_argument(
+        "--keyword-backend",
+        choices=("bm25", "postgres"),
+        default=None,
+        help="override FLASHCARD_KEYWORD_BACKEND for this run (in-process BM25 vs Postgres full-text)",
+    )
     args = parser.parse_args()
     apply_profile(args.profile)
+    if args.keyword_backend:
+        os.environ["FLASHCARD_KEYWORD_BACKEND"] = args.keyword_backend
     lf = langfuse_export.get_client() if args.langfuse else None
     asyncio.run(main_async(args.profile, lf=lf))
 
@@ -0,0 +1,19 @@
+import asyncio
+import weakref
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# An AsyncSession (one connection) can't run two statements at once. Code that
+# fans out with asyncio.gather — concurrent embedding batches, the hybrid
+# retrievers — takes this lock around each DB call on a shared session.
+_session_locks: "weakref.WeakKeyDictionary[AsyncSession, asyncio.Lock]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def session_lock(db: AsyncSession) -> asyncio.Lock:
+    lock = _session_locks.get(db)
+    if lock is None:
+        lock = asyncio.Lock()
+        _session_locks[db] = lock
+    return lock
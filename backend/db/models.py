@@ -1,14 +1,19 @@
 import uuid
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, LargeBinary, DateTime
+from sqlalchemy import Column, Computed, Integer, String, Text, ForeignKey, LargeBinary, DateTime
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.sql import func
-from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR
 from sqlalchemy.orm import declarative_base
 from pgvector.sqlalchemy import Vector
 
 Base = declarative_base()
 
 VECTOR_DIM = 768
+# Matryoshka prefix kept alongside the full vector for coarse search.
+PREFIX_VECTOR_DIM = 256
+# Text search config baked into embeddings.content_tsv; keyword queries must
+# use the same one. Migrations f2a9c4e8b6d1 and b8e1d4a7c3f5 hard-code it too.
+KEYWORD_TS_CONFIG = "english"
 
 class Sessions(Base):
     __tablename__ = "sessions"
@@ -26,19 +31,42 @@ class Files(Base):
     filename = Column(String(512), nullable=True)
     content_type = Column(String(255), nullable=True)
     raw_content = Column(LargeBinary, nullable=True)
+    # sha256 of raw_content; lets a vault re-upload skip byte-identical notes.
+    content_hash = Column(String(64), nullable=True)
+    # sha256 of the text the stored embeddings were built from (raw content
+    # plus baked-in backlinks). Differs from the current text when backlinks move.
+    embedding_hash = Column(String(64), nullable=True)
 
 # Consider Partial Indexing for Speedup    
 class Embeddings(Base):
     __tablename__ = "embeddings"
-    id = Column(Integer, primary_key=True, index=True)
+    # Hash-partitioned by session so per-session reads, deletes and KNN touch
+    # one partition; the partition key has to be part of the primary key.
+    __table_args__ = {"postgresql_partition_by": "HASH (session_id)"}
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
     files_id = Column(Integer, ForeignKey("notes.id"), nullable=False)
-    session_id = Column(UUID(as_uuid=True), ForeignKey("sessions.id"), nullable=False)
+    session_id = Column(
+        UUID(as_uuid=True), ForeignKey("sessions.id"), primary_key=True, nullable=False
+    )
 
     filename = Column(String(512), nullable=False)
     content_type = Column(String(255), nullable=True)
     chunk_index = Column(Integer, nullable=False)
     content = Column(Text, nullable=False)
     embedding = Column(Vector(VECTOR_DIM), nullable=False)
+    # Generated by Postgres: the leading dims of `embedding`, for coarse-to-fine search.
+    embedding_prefix = Column(
+        Vector(PREFIX_VECTOR_DIM),
+        Computed(
+            f"subvector(embedding, 1, {PREFIX_VECTOR_DIM})::vector({PREFIX_VECTOR_DIM})",
+            persisted=True,
+        ),
+    )
+    # Generated by Postgres; feeds the `postgres` keyword retrieval backend.
+    content_tsv = Column(
+        TSVECTOR,
+        Computed(f"to_tsvector('{KEYWORD_TS_CONFIG}', content)", persisted=True),
+    )
 
 
 class Flashcard(Base):
@@ -75,3 +103,54 @@ class FlashcardDecks(Base):
     card_count = Column(Integer, nullable=False, default=0)
     note_count = Column(Integer, nullable=False, default=0)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+
+class QueryEmbeddingCache(Base):
+    __tablename__ = "query_embedding_cache"
+    # sha256 of backend, model, dimension and normalized query text.
+    cache_key = Column(String(64), primary_key=True)
+    backend = Column(String(32), nullable=False)
+    model = Column(String(255), nullable=False)
+    dim = Column(Integer, nullable=False)
+    embedding = Column(Vector(VECTOR_DIM), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False, index=True)
+
+
+class ChunkEmbeddingCache(Base):
+    __tablename__ = "chunk_embedding_cache"
+    # sha256 of the chunk text; vectors are only reusable for the same
+    # backend, model and dimension.
+    content_hash = Column(String(64), primary_key=True)
+    backend = Column(String(32), primary_key=True)
+    model = Column(String(255), primary_key=True)
+    dim = Column(Integer, primary_key=True)
+    embedding = Column(Vector(VECTOR_DIM), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+
+class Jobs(Base):
+    __tablename__ = "jobs"
+    # Durable work queue shared by API and worker processes. Workers claim
+    # queued rows with FOR UPDATE SKIP LOCKED; `kind` selects the handler.
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    kind = Column(String(64), nullable=False)
+    # queued | running | succeeded | failed
+    status = Column(String(16), nullable=False, default="queued")
+    session_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("sessions.id", ondelete="CASCADE", onupdate="CASCADE"),
+        nullable=True,
+        index=True,
+    )
+    payload = Column(JSONB, nullable=False, default=dict)
+    result = Column(JSONB, nullable=True)
+    error = Column(Text, nullable=True)
+    # Append-only progress events, replayed to (re-)attached subscribers.
+    events = Column(JSONB, nullable=False, default=list)
+    attempts = Column(Integer, nullable=False, default=0)
+    worker_id = Column(String(128), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    # Bumped by the running worker's heartbeat; a stale running job is reclaimed.
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
@@ -1,10 +1,198 @@
 import os
-from sqlalchemy import create_engine
+import threading
+import time
+from sqlalchemy import create_engine, event
+from sqlalchemy import exc as sa_exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise RuntimeError("DATABASE_URL environment variable is not set")
 
-engine = create_engine(DATABASE_URL, pool_pre_ping=True)
+# --- Pool sizing ---
+# Per engine, per worker process: with N uvicorn workers the database sees up to
+# N * 2 * (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections (sync + async engine).
+# Keep that under the server's (or Neon pooler's) connection limit.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+# Seconds before a connection is replaced; Neon drops idle connections when
+# compute suspends (5 minutes idle by default), so recycle below that. -1 disables.
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "240"))
+# Seconds a checkout waits for a free connection before raising.
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Pre-ping runs a liveness round trip on every checkout. Turn it off and set
+# DB_POOL_VALIDATE_INTERVAL to only validate connections idle that long.
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1").strip().lower() not in {
+    "0",
+    "false",
+    "no",
+}
+DB_POOL_VALIDATE_INTERVAL = float(os.getenv("DB_POOL_VALIDATE_INTERVAL", "0"))
+
+
+class _PoolStatsMixin:
+    """Counts checkouts, waits, timeouts and overflow use for /metrics."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "wait_s_total": 0.0,
+            "wait_s_max": 0.0,
+            "timeouts": 0,
+            "overflow_checkouts": 0,
+            "peak_checked_out": 0,
+            "validations": 0,
+            "invalidated": 0,
+        }
+
+    def _do_get(self):
+        # Pool exhausted: no idle connection and no overflow headroom left.
+        must_wait = self.checkedin() == 0 and (
+            self._max_overflow > -1 and self.overflow() >= self._max_overflow
+        )
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except sa_exc.TimeoutError:
+            with self._stats_lock:
+                self._stats["timeouts"] += 1
+            raise
+        waited = time.perf_counter() - started
+        with self._stats_lock:
+            stats = self._stats
+            stats["checkouts"] += 1
+            if must_wait:
+                stats["waits"] += 1
+                stats["wait_s_total"] += waited
+                stats["wait_s_max"] = max(stats["wait_s_max"], waited)
+            if self.overflow() > 0:
+                stats["overflow_checkouts"] += 1
+            stats["peak_checked_out"] = max(stats["peak_checked_out"], self.checkedout())
+        return connection
+
+    def bump(self, counter: str) -> None:
+        with self._stats_lock:
+            self._stats[counter] += 1
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            counters = dict(self._stats)
+        return {
+            "size": self.size(),
+            "max_overflow": self._max_overflow,
+            "checked_in": self.checkedin(),
+            "checked_out": self.checkedout(),
+            "overflow": self.overflow(),
+            **counters,
+        }
+
+
+class InstrumentedQueuePool(_PoolStatsMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(_PoolStatsMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def _pool_kwargs(pool_class) -> dict:
+    return {
+        "poolclass": pool_class,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+def _install_periodic_validation(sync_engine) -> None:
+    """Validate a connection on checkout only if it sat idle past the interval."""
+    if DB_POOL_PRE_PING or DB_POOL_VALIDATE_INTERVAL <= 0:
+        return
+
+    @event.listens_for(sync_engine, "checkin")
+    def _stamp_checkin(dbapi_connection, connection_record):
+        connection_record.info["idle_since"] = time.monotonic()
+
+    @event.listens_for(sync_engine, "checkout")
+    def _validate_idle(dbapi_connection, connection_record, connection_proxy):
+        idle_since = connection_record.info.get("idle_since")
+        if idle_since is None or time.monotonic() - idle_since < DB_POOL_VALIDATE_INTERVAL:
+            return
+        pool = sync_engine.pool
+        pool.bump("validations")
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute("SELECT 1")
+        except Exception as exc:
+            pool.bump("invalidated")
+            # The pool discards this connection and retries with a fresh one.
+            raise sa_exc.DisconnectionError(str(exc)) from exc
+        finally:
+            try:
+                cursor.close()
+            except Exception:
+                pass
+
+
+# Sync engine: alembic, scripts, benchmarks seeding and the plain `def` routes
+# (FastAPI runs those in its threadpool).
+engine = create_engine(DATABASE_URL, **_pool_kwargs(InstrumentedQueuePool))
+_install_periodic_validation(engine)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def _async_url_and_connect_args(url: str) -> tuple[str, dict]:
+    """Derive an asyncpg URL from DATABASE_URL.
+
+    asyncpg rejects libpq-only query params (`sslmode`, `channel_binding`), so
+    they are dropped and `sslmode` is mapped onto asyncpg's `ssl` argument.
+    """
+    parsed = make_url(url)
+    query = dict(parsed.query)
+    sslmode = query.pop("sslmode", None)
+    query.pop("channel_binding", None)
+    parsed = parsed.set(drivername="postgresql+asyncpg", query=query)
+    connect_args: dict = {}
+    if sslmode and sslmode != "disable":
+        connect_args["ssl"] = "require" if sslmode in {"allow", "prefer", "require"} else sslmode
+    return parsed.render_as_string(hide_password=False), connect_args
+
+
+ASYNC_DATABASE_URL, _async_connect_args = _async_url_and_connect_args(DATABASE_URL)
+# Async engine for the async request paths (/llm, /upload-files), so a slow
+# pgvector query awaits instead of blocking the event loop.
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    connect_args=_async_connect_args,
+    **_pool_kwargs(InstrumentedAsyncQueuePool),
+)
+_install_periodic_validation(async_engine.sync_engine)
+AsyncSessionLocal = async_sessionmaker(
+    async_engine,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
+
+def pool_stats() -> dict:
+    """Checkout/wait/overflow counters for both engines in this worker."""
+    return {
+        "sync": engine.pool.stats(),
+        "async": async_engine.sync_engine.pool.stats(),
+        "settings": {
+            "pool_size": DB_POOL_SIZE,
+            "max_overflow": DB_MAX_OVERFLOW,
+            "pool_recycle": DB_POOL_RECYCLE,
+            "pool_timeout": DB_POOL_TIMEOUT,
+            "pre_ping": DB_POOL_PRE_PING,
+            "validate_interval": DB_POOL_VALIDATE_INTERVAL,
+        },
+    }
@@ -1,4 +1,5 @@
 import os
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
@@ -6,8 +7,30 @@ from routers.health import router as health_router
 from routers.sessions import router as sessions_router
 from routers.uploads import router as uploads_router
 from routers.flashcards import router as flashcards_router
+from routers.metrics import router as metrics_router
+from db.session import async_engine
+from services.embedding_service import EMBEDDING_BACKEND
+from services.flashcards_service import USE_OPENROUTER
+from services.http_client import close_http_clients
+from services.jobs import JOB_WORKERS_IN_PROCESS, start_job_workers, stop_job_workers
+from services.ollama_client import close_ollama_clients, init_ollama_clients
 
-fastapi_app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    if EMBEDDING_BACKEND.lower() == "ollama" or not USE_OPENROUTER:
+        init_ollama_clients()
+    # One pool per job kind, so queued generations never hold up ingestion.
+    job_workers = start_job_workers() if JOB_WORKERS_IN_PROCESS else []
+    yield
+    await stop_job_workers(job_workers)
+    # Drain pooled keep-alive connections on shutdown.
+    await close_http_clients()
+    await close_ollama_clients()
+    await async_engine.dispose()
+
+
+fastapi_app = FastAPI(lifespan=lifespan)
 
 is_dev = os.getenv("ENV", "DEV").upper() == "DEV"
 local_origin_regex = r"^https?://(localhost|127\\.0\\.0\\.1|\\[::1\\])(:\\d+)?$"
@@ -27,6 +50,7 @@ fastapi_app.include_router(health_router)
 fastapi_app.include_router(sessions_router)
 fastapi_app.include_router(uploads_router)
 fastapi_app.include_router(flashcards_router)
+fastapi_app.include_router(metrics_router)
 
 # Wrap the whole app so CORS headers are still present on unexpected 500s.
 app = CORSMiddleware(
@@ -2,13 +2,17 @@ import traceback
 from uuid import UUID
 from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from db.deps import get_db
+from db.deps import get_async_db, get_db
 from services.flashcards_service import (
+    enqueue_flashcard_generation,
     generate_flashcards,
+    get_generation_job,
     get_flashcard_decks,
     get_flashcards,
     get_files,
+    stream_flashcard_generation,
 )
 
 router = APIRouter()
@@ -31,7 +35,7 @@ async def _run_flashcard_generation(
     file_ids: list[int] | None,
     replace: bool,
     flashcard_amount: str | None,
-    db: Session,
+    db: AsyncSession,
 ):
     try:
         return await generate_flashcards(
@@ -61,7 +65,7 @@ async def llm_flashcards(
     file_ids: list[int] | None = Query(None),
     replace: bool = Query(False),
     flashcard_amount: str | None = Query(None),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     return await _run_flashcard_generation(
         prompt=prompt,
@@ -77,7 +81,7 @@ async def llm_flashcards(
 @router.post("/llm")
 async def llm_flashcards_post(
     payload: FlashcardGenerationRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     return await _run_flashcard_generation(
         prompt=payload.prompt,
@@ -90,6 +94,43 @@ async def llm_flashcards_post(
     )
 
 
+@router.post("/llm/stream")
+async def llm_flashcards_stream(payload: FlashcardGenerationRequest):
+    """Server-sent events: each card is sent (and saved) as soon as it is generated."""
+    return stream_flashcard_generation(
+        prompt=payload.prompt,
+        k=payload.k,
+        session_id=payload.session_id,
+        file_ids=payload.file_ids,
+        flashcard_amount=payload.flashcard_amount,
+    )
+
+
+@router.post("/llm/jobs", status_code=202)
+async def llm_flashcards_job(
+    payload: FlashcardGenerationRequest,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Queue a generation and return its job id at once; poll GET /llm/jobs/{id}."""
+    return await enqueue_flashcard_generation(
+        prompt=payload.prompt,
+        k=payload.k,
+        session_id=payload.session_id,
+        file_ids=payload.file_ids,
+        replace=payload.replace,
+        flashcard_amount=payload.flashcard_amount,
+        db=db,
+    )
+
+
+@router.get("/llm/jobs/{job_id}")
+async def llm_flashcards_job_status(
+    job_id: UUID,
+    db: AsyncSession = Depends(get_async_db),
+):
+    return await get_generation_job(job_id=job_id, db=db)
+
+
 @router.get("/flashcards")
 def fetch_flashcards(
     session_id: UUID = Query(...),
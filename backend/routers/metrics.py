@@ -0,0 +1,30 @@
+from fastapi import APIRouter
+from db.session import pool_stats
+from services.embedding_service import (
+    chunk_embedding_cache_stats,
+    embedding_concurrency_stats,
+    query_embedding_cache_stats,
+)
+from services.generation_cache import generation_cache_stats
+from services.jobs import job_stats
+from services.llm_scheduler import llm_scheduler_stats
+from services.ollama_client import ollama_client_stats
+from services.vector_search import vector_search_stats
+
+router = APIRouter()
+
+
+@router.get("/metrics")
+def metrics():
+    """Per-worker runtime counters, for sizing caches and pools."""
+    return {
+        "query_embedding_cache": query_embedding_cache_stats(),
+        "chunk_embedding_cache": chunk_embedding_cache_stats(),
+        "embedding_requests": embedding_concurrency_stats(),
+        "ollama": ollama_client_stats(),
+        "db_pool": pool_stats(),
+        "vector_search": vector_search_stats(),
+        "generation_cache": generation_cache_stats(),
+        "jobs": job_stats(),
+        "llm_scheduler": llm_scheduler_stats(),
+    }
@@ -1,7 +1,7 @@
 from typing import List
 from uuid import UUID
 from fastapi import APIRouter, File, Query, UploadFile
-from services.upload_service import stream_document_upload
+from services.upload_service import stream_document_upload, stream_ingestion_progress
 
 router = APIRouter()
 
@@ -14,3 +14,12 @@ async def document_upload(
     ),
 ):
     return await stream_document_upload(files, session_id)
+
+
+@router.get("/upload-files/{job_id}/events")
+async def document_upload_events(
+    job_id: UUID,
+    after: int = Query(0, ge=0, description="Number of events already received"),
+):
+    """Re-attach to an upload's progress stream (e.g. after a dropped connection)."""
+    return await stream_ingestion_progress(job_id, after)
@@ -0,0 +1,135 @@
+import asyncio
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator
+
+import numpy as np
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from services.embedding_service import (
+    EMBEDDING_BATCH_MAX_CHARS,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_MAX_CONCURRENCY,
+    embed_chunks_cached,
+)
+
+# Packs chunks from many files into size- and character-bounded embedding
+# requests. A vault of small notes becomes a handful of requests instead of one
+# per note, and a giant note is spread over several bounded ones. Files are
+# handed back as soon as all of their chunks have vectors, so callers can keep
+# emitting per-file progress. Up to EMBEDDING_MAX_CONCURRENCY batches are in
+# flight at once; results are applied in submission order.
+
+
+@dataclass
+class BatchedFile:
+    key: Any
+    chunks: list[str]
+    vectors: list[np.ndarray | None] = field(default_factory=list)
+    remaining: int = 0
+    error: Exception | None = None
+
+    def result(self) -> np.ndarray:
+        return np.stack(self.vectors).astype(np.float32)
+
+
+class EmbeddingBatcher:
+    """Queue per-file chunk lists and embed them in cross-file batches."""
+
+    def __init__(
+        self,
+        db: AsyncSession,
+        *,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+        max_chars: int = EMBEDDING_BATCH_MAX_CHARS,
+        max_in_flight: int = EMBEDDING_MAX_CONCURRENCY,
+    ) -> None:
+        self._db = db
+        self._batch_size = max(1, batch_size)
+        self._max_chars = max(1, max_chars)
+        self._max_in_flight = max(1, max_in_flight)
+        # (file, chunk position) in submission order.
+        self._pending: deque[tuple[BatchedFile, int]] = deque()
+        self._pending_chars = 0
+        self._open: deque[BatchedFile] = deque()
+
+    def add(self, key: Any, chunks: list[str]) -> None:
+        entry = BatchedFile(key=key, chunks=chunks, vectors=[None] * len(chunks))
+        entry.remaining = len(chunks)
+        self._open.append(entry)
+        for position, chunk in enumerate(chunks):
+            self._pending.append((entry, position))
+            self._pending_chars += len(chunk)
+
+    def has_full_batch(self) -> bool:
+        return (
+            len(self._pending) >= self._batch_size
+            or self._pending_chars >= self._max_chars
+        )
+
+    def _take_batch(self) -> list[tuple[BatchedFile, int]]:
+        batch: list[tuple[BatchedFile, int]] = []
+        chars = 0
+        while self._pending:
+            entry, position = self._pending[0]
+            size = len(entry.chunks[position])
+            if batch and (len(batch) >= self._batch_size or chars + size > self._max_chars):
+                break
+            self._pending.popleft()
+            self._pending_chars -= size
+            if entry.error is not None:
+                continue
+            batch.append((entry, position))
+            chars += size
+        return batch
+
+    def _pop_finished(self) -> list[BatchedFile]:
+        # Hand files back in submission order so progress events stay ordered.
+        finished: list[BatchedFile] = []
+        while self._open and (self._open[0].remaining == 0 or self._open[0].error is not None):
+            finished.append(self._open.popleft())
+        return finished
+
+    async def drain(self, *, final: bool = False) -> AsyncIterator[BatchedFile]:
+        """Embed queued chunks and yield files whose vectors are complete.
+
+        Without ``final`` only full batches are sent, leaving a partial tail
+        queued for later files to top up. A failed request marks every file
+        with a chunk in that batch as failed (``error`` set) and drops the
+        rest of their chunks.
+        """
+        for entry in self._pop_finished():
+            yield entry
+        while self._pending and (final or self.has_full_batch()):
+            batches: list[list[tuple[BatchedFile, int]]] = []
+            while (
+                len(batches) < self._max_in_flight
+                and self._pending
+                and (final or self.has_full_batch())
+            ):
+                batch = self._take_batch()
+                if batch:
+                    batches.append(batch)
+            if not batches:
+                continue
+            results = await asyncio.gather(
+                *(
+                    embed_chunks_cached(
+                        self._db,
+                        [entry.chunks[position] for entry, position in batch],
+                    )
+                    for batch in batches
+                ),
+                return_exceptions=True,
+            )
+            for batch, result in zip(batches, results):
+                if isinstance(result, BaseException):
+                    for entry, _ in batch:
+                        if entry.error is None:
+                            entry.error = result
+                    continue
+                for (entry, position), vector in zip(batch, result):
+                    entry.vectors[position] = vector
+                    entry.remaining -= 1
+            for entry in self._pop_finished():
+                yield entry
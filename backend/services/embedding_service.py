@@ -1,17 +1,35 @@
+import asyncio
+import hashlib
 import json
 import os
-from urllib import request as urlrequest
-from urllib.error import HTTPError, URLError
+import threading
+import weakref
 
+import httpx
 import numpy as np
+from pgvector.sqlalchemy import Vector
+from sqlalchemy import text as sql_text
 from starlette.concurrency import run_in_threadpool
 
+from services.http_client import get_async_client, get_sync_client
+from services.ollama_client import (
+    get_ollama_async_client,
+    get_ollama_client,
+    track_ollama_call,
+)
+from utils.lru import TTLCache
+
 # Single embedding space for the whole app. 768 is the native output of
 # nomic-embed-text (the Ollama dev model); OpenRouter is asked for the same
 # width via the `dimensions` parameter, so dev and prod vectors stay
 # interchangeable and one table serves both.
 EMBEDDING_DIM = 768
 EMBEDDING_TABLE = "embeddings"
+# Both models are Matryoshka-trained (nomic-embed-text v1.5, text-embedding-3-*),
+# so the leading dims of a vector are a usable lower-resolution embedding.
+# `embeddings.embedding_prefix` stores the first EMBEDDING_PREFIX_DIM of them
+# (a generated column, migration d9b3f6a1c8e4); must match that migration.
+EMBEDDING_PREFIX_DIM = 256
 
 # --- Backend selection ---
 ENV = os.getenv("ENV", "DEV").upper()
@@ -21,54 +39,156 @@ EMBEDDING_BACKEND = os.getenv(
 )
 
 # --- Ollama config (local dev) ---
-OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+# Host and client pooling live in services.ollama_client.
 OLLAMA_EMBED_MODEL = os.getenv("OLLAMA_EMBED_MODEL", "nomic-embed-text")
 
 # --- OpenRouter config (prod) ---
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY", "").strip()
 OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
 OPENROUTER_EMBED_MODEL = os.getenv("OPENROUTER_EMBED_MODEL", "openai/text-embedding-3-small")
+OPENROUTER_EMBED_TIMEOUT_SECONDS = 30
+
+# --- Query embedding cache ---
+# Students send the same study-focus prompts over and over; cache their vectors
+# in-process (LRU + TTL). 0 entries disables it.
+QUERY_EMBED_CACHE_SIZE = int(os.getenv("QUERY_EMBED_CACHE_SIZE", "1024"))
+QUERY_EMBED_CACHE_TTL_SECONDS = float(os.getenv("QUERY_EMBED_CACHE_TTL_SECONDS", "86400"))
+# Optionally back the in-process cache with the `query_embedding_cache` table so
+# every uvicorn worker (and replica) shares hits.
+QUERY_EMBED_CACHE_SHARED = os.getenv("QUERY_EMBED_CACHE_SHARED", "").strip().lower() in {
+    "1",
+    "true",
+    "yes",
+}
+QUERY_EMBED_CACHE_TABLE = "query_embedding_cache"
+# Expired shared rows are ignored on read and swept every this many writes.
+_QUERY_EMBED_CACHE_PRUNE_EVERY = 200
+
+# --- Chunk embedding cache ---
+# Content-addressed chunk vectors (sha256 of the chunk text, scoped by backend,
+# model and EMBEDDING_DIM), consulted before embed_chunks so re-uploads and
+# re-embeds only pay for text that actually changed.
+CHUNK_EMBED_CACHE_ENABLED = os.getenv("CHUNK_EMBED_CACHE", "1").strip().lower() not in {
+    "0",
+    "false",
+    "no",
+}
+CHUNK_EMBED_CACHE_TABLE = "chunk_embedding_cache"
+
+# --- Request batching ---
+# Upper bounds for a single embedding request: chunk count, and total characters
+# as a cheap stand-in for tokens (~4 chars/token keeps the default well under
+# provider input limits). The upload batcher packs chunks from many files up to
+# these limits; embed_chunks splits anything larger.
+EMBEDDING_BATCH_SIZE = max(1, int(os.getenv("EMBEDDING_BATCH_SIZE", "64")))
+EMBEDDING_BATCH_MAX_CHARS = max(1, int(os.getenv("EMBEDDING_BATCH_MAX_CHARS", "32000")))
+
+# --- Request concurrency ---
+# Max embedding requests in flight per process. Extra batches wait on a
+# semaphore instead of piling onto the backend; local Ollama gains little past
+# a couple of parallel requests, the hosted API tolerates more.
+_DEFAULT_EMBEDDING_CONCURRENCY = {"ollama": 2, "openrouter": 4}
+EMBEDDING_MAX_CONCURRENCY = max(
+    1,
+    int(
+        os.getenv(
+            "EMBEDDING_MAX_CONCURRENCY",
+            str(_DEFAULT_EMBEDDING_CONCURRENCY.get(EMBEDDING_BACKEND.lower(), 2)),
+        )
+    ),
+)
+
+# --- Compact ANN representation ---
+# The heap keeps full-precision vector(768) rows (exact re-ranking, the binary
+# COPY writer and the chunk cache all rely on them); the HNSW indexes are built
+# on compact expressions instead (migration c4f7a2e9d1b6):
+#   halfvec - embedding::halfvec, half the index size, near-identical ordering
+#   binary  - binary_quantize(embedding)::bit, ~32x smaller, Hamming distance;
+#             coarse, so it needs a wider re-rank pool
+#   prefix  - the stored EMBEDDING_PREFIX_DIM-dim prefix vector, a third of the
+#             index and of the per-candidate distance work
+# ANN search shortlists EMBEDDING_RERANK_MULTIPLIER x k candidates on the
+# compact index, then re-ranks them by exact cosine distance.
+EMBEDDING_COARSE_SEARCH = os.getenv("EMBEDDING_COARSE_SEARCH", "halfvec").strip().lower()
+COARSE_SEARCH_MODES = ("halfvec", "binary", "prefix")
+if EMBEDDING_COARSE_SEARCH not in COARSE_SEARCH_MODES:
+    EMBEDDING_COARSE_SEARCH = "halfvec"
+_DEFAULT_RERANK_MULTIPLIER = {"halfvec": 2, "binary": 8, "prefix": 4}
+_RERANK_MULTIPLIER_OVERRIDE = os.getenv("EMBEDDING_RERANK_MULTIPLIER", "").strip()
+
+
+def rerank_multiplier(mode: str = EMBEDDING_COARSE_SEARCH) -> int:
+    if _RERANK_MULTIPLIER_OVERRIDE:
+        return max(1, int(_RERANK_MULTIPLIER_OVERRIDE))
+    return _DEFAULT_RERANK_MULTIPLIER[mode]
+
+
+EMBEDDING_RERANK_MULTIPLIER = rerank_multiplier()
+
+
+def coarse_distance_sql(qvec_sql: str, mode: str = EMBEDDING_COARSE_SEARCH) -> str:
+    """ORDER BY expression matching the compact HNSW index for ``mode``.
+
+    ``qvec_sql`` is a SQL expression of type vector (e.g. ``(:qvec)::vector``).
+    """
+    if mode == "binary":
+        return (
+            f"binary_quantize(embedding)::bit({EMBEDDING_DIM}) "
+            f"<~> binary_quantize({qvec_sql})"
+        )
+    if mode == "prefix":
+        # Cosine distance is scale-invariant, so the prefix needs no re-normalizing.
+        return (
+            f"embedding_prefix <=> "
+            f"subvector({qvec_sql}, 1, {EMBEDDING_PREFIX_DIM})::vector({EMBEDDING_PREFIX_DIM})"
+        )
+    return (
+        f"embedding::halfvec({EMBEDDING_DIM}) "
+        f"<=> ({qvec_sql})::halfvec({EMBEDDING_DIM})"
+    )
 
 
 def _ollama_embed_sync(texts: list[str]) -> np.ndarray:
-    import ollama as _ollama
+    with track_ollama_call("embed"):
+        response = get_ollama_client().embed(model=OLLAMA_EMBED_MODEL, input=texts)
+    return np.array(response.embeddings, dtype=np.float32)
+
 
-    client = _ollama.Client(host=OLLAMA_HOST)
-    response = client.embed(model=OLLAMA_EMBED_MODEL, input=texts)
+async def _ollama_embed(texts: list[str]) -> np.ndarray:
+    with track_ollama_call("embed"):
+        response = await get_ollama_async_client().embed(
+            model=OLLAMA_EMBED_MODEL,
+            input=texts,
+        )
     return np.array(response.embeddings, dtype=np.float32)
 
 
-def _openrouter_embed_sync(texts: list[str]) -> np.ndarray:
+def _openrouter_embed_request() -> tuple[str, dict[str, str]]:
     if not OPENROUTER_API_KEY:
         raise RuntimeError(
             "OPENROUTER_API_KEY is not set. Cannot use openrouter embedding backend."
         )
-
     url = OPENROUTER_BASE_URL.rstrip("/") + "/embeddings"
-    payload: dict = {
+    headers = {
+        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
+        "Content-Type": "application/json",
+    }
+    return url, headers
+
+
+def _openrouter_embed_payload(texts: list[str]) -> dict:
+    return {
         "model": OPENROUTER_EMBED_MODEL,
         "input": texts,
         "dimensions": EMBEDDING_DIM,
     }
-    data = json.dumps(payload).encode("utf-8")
-    req = urlrequest.Request(
-        url,
-        data=data,
-        headers={
-            "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-            "Content-Type": "application/json",
-        },
-        method="POST",
-    )
+
+
+def _openrouter_embed_parse(response: httpx.Response) -> np.ndarray:
+    if response.status_code >= 400:
+        raise RuntimeError(f"OpenRouter embedding request failed: {response.text}")
     try:
-        with urlrequest.urlopen(req, timeout=30) as resp:
-            raw = resp.read().decode("utf-8")
-        body = json.loads(raw)
-    except HTTPError as exc:
-        detail = exc.read().decode("utf-8", errors="replace")
-        raise RuntimeError(f"OpenRouter embedding request failed: {detail}") from exc
-    except URLError as exc:
-        raise RuntimeError(f"OpenRouter embedding connection error: {exc.reason}") from exc
+        body = response.json()
     except json.JSONDecodeError as exc:
         raise RuntimeError("OpenRouter embedding returned malformed JSON.") from exc
 
@@ -76,6 +196,36 @@ def _openrouter_embed_sync(texts: list[str]) -> np.ndarray:
     return np.array(embeddings, dtype=np.float32)
 
 
+def _openrouter_embed_sync(texts: list[str]) -> np.ndarray:
+    url, headers = _openrouter_embed_request()
+    try:
+        response = get_sync_client().post(
+            url,
+            json=_openrouter_embed_payload(texts),
+            headers=headers,
+            timeout=OPENROUTER_EMBED_TIMEOUT_SECONDS,
+        )
+    except httpx.TransportError as exc:
+        raise RuntimeError(f"OpenRouter embedding connection error: {exc}") from exc
+    return _openrouter_embed_parse(response)
+
+
+async def _openrouter_embed(texts: list[str]) -> np.ndarray:
+    # Native async on the shared pooled client: no thread hop, no per-call
+    # TCP/TLS handshake.
+    url, headers = _openrouter_embed_request()
+    try:
+        response = await get_async_client().post(
+            url,
+            json=_openrouter_embed_payload(texts),
+            headers=headers,
+            timeout=OPENROUTER_EMBED_TIMEOUT_SECONDS,
+        )
+    except httpx.TransportError as exc:
+        raise RuntimeError(f"OpenRouter embedding connection error: {exc}") from exc
+    return _openrouter_embed_parse(response)
+
+
 def _embed_sync(texts: list[str]) -> np.ndarray:
     backend = EMBEDDING_BACKEND.lower()
     if backend == "ollama":
@@ -87,13 +237,348 @@ def _embed_sync(texts: list[str]) -> np.ndarray:
     )
 
 
+def embedding_model_name() -> str:
+    backend = EMBEDDING_BACKEND.lower()
+    if backend == "ollama":
+        return OLLAMA_EMBED_MODEL
+    if backend == "openrouter":
+        return OPENROUTER_EMBED_MODEL
+    return backend
+
+
+def normalize_query_text(prompt: str) -> str:
+    # Whitespace only: case and punctuation can change the vector, so they
+    # stay part of the key.
+    return " ".join(prompt.split())
+
+
+_query_cache = TTLCache(QUERY_EMBED_CACHE_SIZE, QUERY_EMBED_CACHE_TTL_SECONDS)
+_shared_stats_lock = threading.Lock()
+_shared_stats = {"hits": 0, "misses": 0, "writes": 0, "errors": 0}
+
+
+def _bump_shared(counter: str) -> None:
+    with _shared_stats_lock:
+        _shared_stats[counter] += 1
+
+
+def _query_cache_key(text: str) -> str:
+    raw = "\x1f".join(
+        [EMBEDDING_BACKEND.lower(), embedding_model_name(), str(EMBEDDING_DIM), text]
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _shared_cache_get(cache_key: str) -> np.ndarray | None:
+    from db.session import SessionLocal  # lazy: scripts import this module without a DB
+
+    try:
+        with SessionLocal() as db:
+            row = db.execute(
+                sql_text(
+                    f"SELECT embedding FROM {QUERY_EMBED_CACHE_TABLE} "
+                    "WHERE cache_key = :key "
+                    "AND (:ttl <= 0 OR created_at > now() - make_interval(secs => :ttl))"
+                ).columns(embedding=Vector(EMBEDDING_DIM)),
+                {"key": cache_key, "ttl": QUERY_EMBED_CACHE_TTL_SECONDS},
+            ).fetchone()
+    except Exception as exc:
+        _bump_shared("errors")
+        print(f"[Embedding Cache] shared lookup failed: {exc}")
+        return None
+    if row is None:
+        _bump_shared("misses")
+        return None
+    _bump_shared("hits")
+    return np.asarray(row.embedding, dtype=np.float32)
+
+
+def _shared_cache_put(cache_key: str, vector: np.ndarray) -> None:
+    from db.session import SessionLocal
+
+    try:
+        with SessionLocal() as db:
+            db.execute(
+                sql_text(
+                    f"INSERT INTO {QUERY_EMBED_CACHE_TABLE} "
+                    "(cache_key, backend, model, dim, embedding, created_at) "
+                    "VALUES (:key, :backend, :model, :dim, (:vec)::vector, now()) "
+                    "ON CONFLICT (cache_key) DO UPDATE "
+                    "SET embedding = EXCLUDED.embedding, created_at = EXCLUDED.created_at"
+                ),
+                {
+                    "key": cache_key,
+                    "backend": EMBEDDING_BACKEND.lower(),
+                    "model": embedding_model_name(),
+                    "dim": EMBEDDING_DIM,
+                    "vec": vector.tolist(),
+                },
+            )
+            with _shared_stats_lock:
+                prune = (_shared_stats["writes"] + 1) % _QUERY_EMBED_CACHE_PRUNE_EVERY == 0
+            if prune and QUERY_EMBED_CACHE_TTL_SECONDS > 0:
+                db.execute(
+                    sql_text(
+                        f"DELETE FROM {QUERY_EMBED_CACHE_TABLE} "
+                        "WHERE created_at < now() - make_interval(secs => :ttl)"
+                    ),
+                    {"ttl": QUERY_EMBED_CACHE_TTL_SECONDS},
+                )
+            db.commit()
+        _bump_shared("writes")
+    except Exception as exc:
+        _bump_shared("errors")
+        print(f"[Embedding Cache] shared write failed: {exc}")
+
+
+def _embed_query_cached_sync(prompt: str) -> np.ndarray:
+    text = normalize_query_text(prompt)
+    cache_key = _query_cache_key(text)
+    vector = _query_cache.get(cache_key)
+    if vector is not None:
+        return vector
+    if QUERY_EMBED_CACHE_SHARED:
+        vector = _shared_cache_get(cache_key)
+        if vector is not None:
+            _query_cache.set(cache_key, vector)
+            return vector
+    vector = _embed_sync([text])[0]
+    # Cached arrays are shared between requests; make accidental writes loud.
+    vector.setflags(write=False)
+    _query_cache.set(cache_key, vector)
+    if QUERY_EMBED_CACHE_SHARED:
+        _shared_cache_put(cache_key, vector)
+    return vector
+
+
+def query_embedding_cache_stats() -> dict:
+    stats: dict = {"local": _query_cache.stats(), "shared_enabled": QUERY_EMBED_CACHE_SHARED}
+    if QUERY_EMBED_CACHE_SHARED:
+        with _shared_stats_lock:
+            stats["shared"] = dict(_shared_stats)
+    return stats
+
+
+def split_batches(texts: list[str]) -> list[list[str]]:
+    """Split texts into request-sized batches, preserving order."""
+    batches: list[list[str]] = []
+    current: list[str] = []
+    current_chars = 0
+    for text in texts:
+        if current and (
+            len(current) >= EMBEDDING_BATCH_SIZE
+            or current_chars + len(text) > EMBEDDING_BATCH_MAX_CHARS
+        ):
+            batches.append(current)
+            current, current_chars = [], 0
+        current.append(text)
+        current_chars += len(text)
+    if current:
+        batches.append(current)
+    return batches
+
+
+_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = (
+    weakref.WeakKeyDictionary()
+)
+_inflight_lock = threading.Lock()
+_inflight_stats = {"in_flight": 0, "peak_in_flight": 0, "waits": 0, "requests": 0}
+
+
+def _embedding_semaphore() -> asyncio.Semaphore:
+    # asyncio primitives belong to one loop; scripts and tests may run several.
+    loop = asyncio.get_running_loop()
+    semaphore = _semaphores.get(loop)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(EMBEDDING_MAX_CONCURRENCY)
+        _semaphores[loop] = semaphore
+    return semaphore
+
+
+async def _embed_limited(texts: list[str]) -> np.ndarray:
+    """One embedding request, gated by the per-backend concurrency limit."""
+    semaphore = _embedding_semaphore()
+    if semaphore.locked():
+        with _inflight_lock:
+            _inflight_stats["waits"] += 1
+    async with semaphore:
+        with _inflight_lock:
+            _inflight_stats["requests"] += 1
+            _inflight_stats["in_flight"] += 1
+            _inflight_stats["peak_in_flight"] = max(
+                _inflight_stats["peak_in_flight"], _inflight_stats["in_flight"]
+            )
+        try:
+            backend = EMBEDDING_BACKEND.lower()
+            if backend == "openrouter":
+                return await _openrouter_embed(texts)
+            if backend == "ollama":
+                return await _ollama_embed(texts)
+            return await run_in_threadpool(_embed_sync, texts)
+        finally:
+            with _inflight_lock:
+                _inflight_stats["in_flight"] -= 1
+
+
+async def embed_batches(batches: list[list[str]]) -> list[np.ndarray]:
+    """Embed several request-sized batches concurrently; results keep input order."""
+    return list(await asyncio.gather(*(_embed_limited(batch) for batch in batches)))
+
+
+def embedding_concurrency_stats() -> dict:
+    with _inflight_lock:
+        stats = dict(_inflight_stats)
+    stats["backend"] = EMBEDDING_BACKEND.lower()
+    stats["max_concurrency"] = EMBEDDING_MAX_CONCURRENCY
+    return stats
+
+
 async def embed_chunks(chunks: list[str]) -> np.ndarray:
-    return await run_in_threadpool(_embed_sync, chunks)
+    if not chunks:
+        return np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+    parts = await embed_batches(split_batches(chunks))
+    if len(parts) == 1:
+        return parts[0]
+    return np.concatenate(parts).astype(np.float32)
+
+
+def vector_literal(vector) -> str:
+    """pgvector text form ('[1,2,3]') for binding as ``(:param)::vector``.
+
+    asyncpg has no codec for the vector type and sends it as text, so vectors
+    are bound as literals rather than Python lists.
+    """
+    return "[" + ",".join(str(float(x)) for x in np.asarray(vector).ravel()) + "]"
+
+
+def chunk_content_hash(chunk: str) -> str:
+    # Matches encode(sha256(convert_to(content, 'UTF8')), 'hex') in Postgres.
+    return hashlib.sha256(chunk.encode("utf-8")).hexdigest()
+
+
+_chunk_stats_lock = threading.Lock()
+_chunk_stats = {"hits": 0, "misses": 0, "errors": 0}
+
+
+def _bump_chunk(counter: str, amount: int = 1) -> None:
+    with _chunk_stats_lock:
+        _chunk_stats[counter] += amount
+
+
+def _chunk_cache_scope() -> dict[str, object]:
+    return {
+        "backend": EMBEDDING_BACKEND.lower(),
+        "model": embedding_model_name(),
+        "dim": EMBEDDING_DIM,
+    }
+
+
+def _lookup_chunk_vectors(db, hashes: list[str]) -> dict[str, np.ndarray]:
+    rows = db.execute(
+        sql_text(
+            f"SELECT content_hash, embedding FROM {CHUNK_EMBED_CACHE_TABLE} "
+            "WHERE backend = :backend AND model = :model AND dim = :dim "
+            "AND content_hash = ANY(:hashes)"
+        ).columns(embedding=Vector(EMBEDDING_DIM)),
+        {**_chunk_cache_scope(), "hashes": hashes},
+    ).fetchall()
+    return {row.content_hash: np.asarray(row.embedding, dtype=np.float32) for row in rows}
+
+
+def _store_chunk_vectors(db, vectors: dict[str, np.ndarray]) -> None:
+    scope = _chunk_cache_scope()
+    db.execute(
+        sql_text(
+            f"INSERT INTO {CHUNK_EMBED_CACHE_TABLE} "
+            "(content_hash, backend, model, dim, embedding) "
+            "VALUES (:content_hash, :backend, :model, :dim, (:vec)::vector) "
+            "ON CONFLICT DO NOTHING"
+        ),
+        [
+            {**scope, "content_hash": content_hash, "vec": vector_literal(vec)}
+            for content_hash, vec in vectors.items()
+        ],
+    )
+
+
+async def embed_chunks_cached(db, chunks: list[str]) -> np.ndarray:
+    """``embed_chunks`` that skips chunks whose exact text was embedded before.
+
+    ``db`` is the caller's AsyncSession. Cache reads/writes run in a savepoint
+    on it, so a missing table or a failed write never rolls back the caller's
+    pending rows — it just degrades to embedding everything.
+    """
+    if not chunks:
+        return np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+    if not CHUNK_EMBED_CACHE_ENABLED:
+        return await embed_chunks(chunks)
+
+    from db.locks import session_lock  # lazy: keeps this module import-light for scripts
+
+    hashes = [chunk_content_hash(chunk) for chunk in chunks]
+    cached: dict[str, np.ndarray] = {}
+    try:
+        async with session_lock(db):
+            async with db.begin_nested():
+                cached = await db.run_sync(_lookup_chunk_vectors, sorted(set(hashes)))
+    except Exception as exc:
+        _bump_chunk("errors")
+        print(f"[Embedding Cache] chunk lookup failed: {exc}")
+
+    missing: dict[str, str] = {}
+    for content_hash, chunk in zip(hashes, chunks):
+        if content_hash not in cached and content_hash not in missing:
+            missing[content_hash] = chunk
+    miss_count = sum(1 for content_hash in hashes if content_hash in missing)
+    _bump_chunk("hits", len(chunks) - miss_count)
+    _bump_chunk("misses", miss_count)
+
+    if missing:
+        fresh_vectors = await embed_chunks(list(missing.values()))
+        fresh = dict(zip(missing.keys(), fresh_vectors))
+        try:
+            async with session_lock(db):
+                async with db.begin_nested():
+                    await db.run_sync(_store_chunk_vectors, fresh)
+        except Exception as exc:
+            _bump_chunk("errors")
+            print(f"[Embedding Cache] chunk write failed: {exc}")
+        cached.update(fresh)
+
+    return np.stack([cached[content_hash] for content_hash in hashes]).astype(np.float32)
+
+
+def chunk_embedding_cache_stats() -> dict:
+    with _chunk_stats_lock:
+        stats = dict(_chunk_stats)
+    lookups = stats["hits"] + stats["misses"]
+    stats["enabled"] = CHUNK_EMBED_CACHE_ENABLED
+    stats["hit_rate"] = (stats["hits"] / lookups) if lookups else 0.0
+    return stats
 
 
 async def embed_query(prompt: str) -> np.ndarray:
-    return (await run_in_threadpool(_embed_sync, [prompt]))[0]
+    if EMBEDDING_BACKEND.lower() not in {"openrouter", "ollama"}:
+        return await run_in_threadpool(_embed_query_cached_sync, prompt)
+    # Same flow as _embed_query_cached_sync, but the miss goes out on the
+    # shared async client; only the optional shared-cache I/O needs a thread.
+    text = normalize_query_text(prompt)
+    cache_key = _query_cache_key(text)
+    vector = _query_cache.get(cache_key)
+    if vector is not None:
+        return vector
+    if QUERY_EMBED_CACHE_SHARED:
+        vector = await run_in_threadpool(_shared_cache_get, cache_key)
+        if vector is not None:
+            _query_cache.set(cache_key, vector)
+            return vector
+    vector = (await _embed_limited([text]))[0]
+    vector.setflags(write=False)
+    _query_cache.set(cache_key, vector)
+    if QUERY_EMBED_CACHE_SHARED:
+        await run_in_threadpool(_shared_cache_put, cache_key, vector)
+    return vector
 
 
 def embed_query_sync(prompt: str) -> np.ndarray:
-    return _embed_sync([prompt])[0]
+    return _embed_query_cached_sync(prompt)
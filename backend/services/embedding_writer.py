@@ -0,0 +1,181 @@
+import io
+import os
+import struct
+from uuid import UUID
+
+import numpy as np
+from sqlalchemy import text as sql_text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.models import Embeddings
+from services.embedding_service import EMBEDDING_DIM, EMBEDDING_TABLE
+
+# Bulk path for chunk rows: one binary `COPY ... FROM STDIN` per file, with
+# vectors encoded straight from the numpy array in pgvector's binary format,
+# instead of one ORM object + Python-list literal per chunk. Runs on asyncpg's
+# copy_to_table; falls back to the ORM path when the driver has no COPY support
+# or the COPY fails.
+EMBEDDING_COPY_WRITES = os.getenv("EMBEDDING_COPY_WRITES", "1").strip().lower() not in {
+    "0",
+    "false",
+    "no",
+}
+
+# Explicit column list: `id` comes from its sequence and `content_tsv` is
+# generated, so neither may appear in the COPY.
+_COPY_COLUMNS = (
+    "files_id",
+    "session_id",
+    "filename",
+    "content_type",
+    "chunk_index",
+    "content",
+    "embedding",
+)
+_PGCOPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0)
+_PGCOPY_TRAILER = struct.pack("!h", -1)
+
+
+def _text_field(value: str) -> bytes:
+    data = value.encode("utf-8")
+    return struct.pack("!i", len(data)) + data
+
+
+def encode_copy_rows(
+    *,
+    files_id: int,
+    session_id: UUID,
+    filename: str,
+    content_type: str,
+    chunks: list[str],
+    vectors: np.ndarray,
+) -> bytes:
+    """Encode chunk rows as a complete binary COPY stream for `_COPY_COLUMNS`."""
+    vectors = np.ascontiguousarray(vectors, dtype=">f4")
+    dim = vectors.shape[1] if vectors.ndim == 2 else EMBEDDING_DIM
+    # pgvector binary recv: int16 dim, int16 unused, then dim big-endian float4s.
+    vector_prefix = struct.pack("!ihh", 4 + 4 * dim, dim, 0)
+    row_prefix = (
+        struct.pack("!h", len(_COPY_COLUMNS))
+        + struct.pack("!ii", 4, files_id)
+        + struct.pack("!i", 16)
+        + session_id.bytes
+        + _text_field(filename)
+        + _text_field(content_type)
+    )
+    buffer = io.BytesIO()
+    buffer.write(_PGCOPY_HEADER)
+    for chunk_index, (chunk, vector) in enumerate(zip(chunks, vectors)):
+        buffer.write(row_prefix)
+        buffer.write(struct.pack("!ii", 4, chunk_index))
+        buffer.write(_text_field(chunk))
+        buffer.write(vector_prefix)
+        buffer.write(vector.tobytes())
+    buffer.write(_PGCOPY_TRAILER)
+    return buffer.getvalue()
+
+
+async def _copy_file_embeddings(db: AsyncSession, payload: bytes) -> None:
+    # Flush pending ORM writes first so they precede the COPY in the transaction.
+    await db.flush()
+    connection = await db.connection()
+    raw_connection = await connection.get_raw_connection()
+    driver_connection = raw_connection.driver_connection
+    if not hasattr(driver_connection, "copy_to_table"):
+        raise RuntimeError("database driver has no COPY support")
+    # asyncpg treats bytes as a file path; the payload must be a file-like object.
+    await driver_connection.copy_to_table(
+        EMBEDDING_TABLE,
+        source=io.BytesIO(payload),
+        columns=list(_COPY_COLUMNS),
+        format="binary",
+    )
+
+
+async def _add_file_embeddings(
+    db: AsyncSession,
+    *,
+    session_id: UUID,
+    files_id: int,
+    filename: str,
+    content_type: str,
+    chunks: list[str],
+    vectors: np.ndarray,
+) -> list[tuple[int, str, int, str]]:
+    embedding_rows = [
+        Embeddings(
+            files_id=files_id,
+            session_id=session_id,
+            filename=filename,
+            content_type=content_type,
+            chunk_index=i,
+            content=chunk,
+            embedding=vec.tolist(),
+        )
+        for i, (chunk, vec) in enumerate(zip(chunks, vectors))
+    ]
+    db.add_all(embedding_rows)
+    # Flush so the rows carry ids for the keyword index fingerprint.
+    await db.flush()
+    return [
+        (row.id, row.filename, row.chunk_index, row.content)
+        for row in embedding_rows
+    ]
+
+
+async def write_file_embeddings(
+    db: AsyncSession,
+    *,
+    session_id: UUID,
+    files_id: int,
+    filename: str,
+    content_type: str | None,
+    chunks: list[str],
+    vectors: np.ndarray,
+) -> list[tuple[int, str, int, str]]:
+    """Insert one file's chunk rows in the caller's transaction.
+
+    The file must have no embedding rows left (callers delete stale ones
+    first). Returns (id, filename, chunk_index, content) rows for the keyword
+    index. Does not commit.
+    """
+    content_type = content_type or "text/plain"
+    if not chunks:
+        return []
+    if EMBEDDING_COPY_WRITES:
+        payload = encode_copy_rows(
+            files_id=files_id,
+            session_id=session_id,
+            filename=filename,
+            content_type=content_type,
+            chunks=chunks,
+            vectors=vectors,
+        )
+        try:
+            async with db.begin_nested():
+                await _copy_file_embeddings(db, payload)
+        except Exception as exc:
+            print(f"[Embeddings] COPY failed, falling back to ORM insert: {exc}")
+        else:
+            # COPY returns no ids; read them back for the keyword index.
+            result = await db.execute(
+                sql_text(
+                    f"SELECT id, chunk_index FROM {EMBEDDING_TABLE} "
+                    "WHERE session_id = :sid AND files_id = :fid"
+                ),
+                {"sid": session_id, "fid": files_id},
+            )
+            ids = {row.chunk_index: row.id for row in result.fetchall()}
+            return [
+                (ids[chunk_index], filename, chunk_index, chunk)
+                for chunk_index, chunk in enumerate(chunks)
+            ]
+    return await _add_file_embeddings(
+        db,
+        session_id=session_id,
+        files_id=files_id,
+        filename=filename,
+        content_type=content_type,
+        chunks=chunks,
+        vectors=vectors,
+    )
@@ -1,41 +1,72 @@
+import asyncio
+import hashlib
 import importlib.util
 import json
 import math
 import os
 import re
+import time
+import traceback
 from asyncio import TimeoutError as AsyncTimeoutError, wait_for
+from dataclasses import dataclass
 from datetime import datetime, timezone
+from typing import AsyncIterator
 from uuid import UUID
-from urllib import request as urlrequest
-from urllib.error import HTTPError, URLError
+import httpx
 from starlette.concurrency import run_in_threadpool
 from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
 from langchain_core.retrievers import BaseRetriever
 from langchain_community.retrievers import BM25Retriever
-try:
-    from langchain_community.retrievers import EnsembleRetriever
-except (ImportError, ModuleNotFoundError):
-    try:
-        from langchain.retrievers import EnsembleRetriever
-    except (ImportError, ModuleNotFoundError):
-        from langchain.retrievers.ensemble import EnsembleRetriever
+from sqlalchemy import select
 from sqlalchemy import text as sql_text
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from db.locks import session_lock
+from db.session import AsyncSessionLocal
 from db.models import (
-    Embeddings,
+    KEYWORD_TS_CONFIG,
     Files,
     Flashcard,
     FlashcardDecks,
     Sessions,
 )
 from prompt import FLASHCARD_PROMPT
+from services.embedding_batcher import EmbeddingBatcher
 from services.embedding_service import (
     EMBEDDING_TABLE,
-    embed_chunks,
     embed_query,
-    embed_query_sync,
+    vector_literal,
+)
+from services.embedding_writer import write_file_embeddings
+from services.generation_cache import (
+    generation_cache_key,
+    get_cached_generation,
+    invalidate_session_generations,
+    store_generation,
+)
+from services.generation_shards import Shard, build_shards, merge_shard_cards
+from services.http_client import get_async_client
+from services.jobs import (
+    enqueue_job,
+    get_job,
+    job_payload,
+    queue_position,
+    register_job_handler,
+)
+from services.keyword_index import (
+    SessionKeywordIndex,
+    get_session_index,
+    index_file_chunks,
+)
+from services.llm_scheduler import llm_slot
+from services.ollama_client import get_ollama_async_client, track_ollama_call
+from services.vector_search import (
+    build_embedding_filters,
+    choose_vector_search,
+    scoped_cte,
 )
 from services.obsidian_service import split_text_with_context
 from utils.obsidian import format_context_content_for_llm, is_code_block_content
@@ -44,6 +75,9 @@ FLASHCARD_CHARS_PER_CARD = 500
 FLASHCARD_MIN_COUNT = 1
 FLASHCARD_CHUNKS_PER_CARD = 2
 FLASHCARD_DEFAULT_RETRIEVAL_K = 40
+# Upper bound on a requested k. The packed context holds far fewer chunks
+# (FLASHCARD_MAX_CONTEXT_CHARS), and candidate pools scale with k.
+FLASHCARD_MAX_RETRIEVAL_K = 200
 FLASHCARD_BM25_CANDIDATE_MULTIPLIER = 6
 FLASHCARD_BM25_CANDIDATE_MAX = 600
 FLASHCARD_MAX_CONTEXT_CHARS = 24000
@@ -51,6 +85,27 @@ FLASHCARD_MIN_CODE_CARDS = 1
 FLASHCARD_MAX_CODE_BLOCKS_IN_CONTEXT = 3
 HYBRID_VECTOR_WEIGHT = 0.6
 HYBRID_KEYWORD_WEIGHT = 0.4
+# Keyword half of hybrid retrieval: "bm25" scores in-process with the
+# per-session index; "postgres" ranks in the DB with ts_rank_cd over the
+# generated `embeddings.content_tsv` column (needs migration f2a9c4e8b6d1).
+FLASHCARD_KEYWORD_BACKEND = os.getenv("FLASHCARD_KEYWORD_BACKEND", "bm25").strip().lower()
+# "ensemble" fuses the keyword + vector retrievers in Python (weighted RRF, as
+# LangChain's EnsembleRetriever scores it). "sql" does vector KNN, full-text ranking, weighted RRF and
+# the relevance floor in one statement (needs content_tsv, migration f2a9c4e8b6d1),
+# so a prompt costs one embedding call and one DB round trip before the LLM.
+FLASHCARD_HYBRID_ENGINE = os.getenv("FLASHCARD_HYBRID_ENGINE", "ensemble").strip().lower()
+# Each side of the SQL fusion ranks this many times k candidates.
+FLASHCARD_HYBRID_CANDIDATE_MULTIPLIER = 2
+# Coarse-to-fine vector retrieval (ensemble engine): large sessions shortlist on
+# the 256-dim `embedding_prefix` HNSW index (migration d9b3f6a1c8e4) and re-rank
+# on the full vector, regardless of EMBEDDING_COARSE_SEARCH.
+FLASHCARD_COARSE_TO_FINE = os.getenv("FLASHCARD_COARSE_TO_FINE", "").strip().lower() in {
+    "1",
+    "true",
+    "yes",
+}
+# RRF damping constant; same default as LangChain's EnsembleRetriever.
+HYBRID_RRF_C = 60
 # Post-retrieval relevance floor: drop retrieved chunks whose cosine distance
 # (pgvector `<=>`, 0=identical … 2=opposite) to the query exceeds this, so a
 # focused query stops dragging in off-topic chunks and a query matching nothing
@@ -66,6 +121,13 @@ FLASHCARD_MAX_TOKENS_PER_CARD = int(os.getenv("FLASHCARD_MAX_TOKENS_PER_CARD", "
 FLASHCARD_LLM_MAX_TOKENS = int(os.getenv("FLASHCARD_LLM_MAX_TOKENS", "1800"))
 # Sampling temperature for generation. Pin to 0 in benchmarks for reproducibility.
 FLASHCARD_LLM_TEMPERATURE = float(os.getenv("FLASHCARD_LLM_TEMPERATURE", "0.2"))
+# "single" asks for the whole deck in one completion. "map_reduce" splits a
+# context larger than FLASHCARD_SHARD_MAX_CHARS into file-local shards, runs
+# one completion per shard (FLASHCARD_SHARD_CONCURRENCY at a time) and merges
+# the cards, so big decks take about one shard's latency and each completion
+# stays well under FLASHCARD_LLM_MAX_TOKENS.
+FLASHCARD_GENERATION_MODE = os.getenv("FLASHCARD_GENERATION_MODE", "single").strip().lower()
+FLASHCARD_SHARD_MAX_CHARS = max(1000, int(os.getenv("FLASHCARD_SHARD_MAX_CHARS", "6000")))
 ENV = os.getenv("ENV", "DEV").upper()
 # LLM backend is decoupled from ENV so benchmarks can route generation to the
 # prod LLM (OpenRouter) while keeping dev embeddings/DB. Falls back to ENV.
@@ -76,11 +138,18 @@ elif _FLASHCARD_LLM_BACKEND in {"ollama", "local", "dev"}:
     USE_OPENROUTER = False
 else:
     USE_OPENROUTER = ENV in {"PROD", "PRODUCTION"}
+LLM_BACKEND = "openrouter" if USE_OPENROUTER else "ollama"
 OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY", "").strip()
 OPENROUTER_MODEL = os.getenv("OPENROUTER_MODEL", "deepseek/deepseek-chat-v3-0324")
 OPENROUTER_REFERER = os.getenv("OPENROUTER_REFERER", "").strip()
 OPENROUTER_TITLE = os.getenv("OPENROUTER_TITLE", "").strip()
+# Local Ollama serves a couple of requests in parallel at best; the hosted API
+# takes more.
+FLASHCARD_SHARD_CONCURRENCY = max(
+    1,
+    int(os.getenv("FLASHCARD_SHARD_CONCURRENCY", "4" if USE_OPENROUTER else "2")),
+)
 
 FLASHCARD_AMOUNT_MULTIPLIERS = {
     "small": 0.6,
@@ -94,44 +163,53 @@ except Exception:  # pragma: no cover - pydantic v1 fallback
     ConfigDict = None
 
 
-def _build_embedding_filters(session_id: UUID | None, file_ids: list[int] | None):
-    clauses: list[str] = []
-    params: dict[str, object] = {}
-    if session_id is not None:
-        clauses.append("session_id = :sid")
-        params["sid"] = session_id
-    if file_ids:
-        clauses.append("files_id = ANY(:file_ids)")
-        params["file_ids"] = file_ids
-    return clauses, params
-
-
-def _fetch_embedding_rows(
-    db: Session,
+async def _fetch_embedding_rows(
+    db: AsyncSession,
     session_id: UUID | None,
     file_ids: list[int] | None,
     *,
     order_by: str | None = None,
     limit: int | None = None,
     qvec: object | None = None,
+    coarse: str | None = None,
 ):
-    base_query = f"SELECT filename, chunk_index, content FROM {EMBEDDING_TABLE} "
-    clauses, params = _build_embedding_filters(session_id, file_ids)
-    if clauses:
-        base_query += "WHERE " + " AND ".join(clauses) + " "
+    columns = "filename, chunk_index, content"
+    clauses, params = build_embedding_filters(session_id, file_ids)
     if qvec is not None:
-        params["qvec"] = qvec.tolist()
-        base_query += "ORDER BY embedding <=> (:qvec)::vector "
-    elif order_by:
-        base_query += f"ORDER BY {order_by} "
+        strategy = await choose_vector_search(
+            db, session_id, file_ids, limit=limit, coarse=coarse
+        )
+        cte, source = scoped_cte(
+            strategy,
+            clauses,
+            f"{columns}, embedding",
+            qvec_sql="(:qvec)::vector",
+            limit=limit,
+            coarse=coarse,
+        )
+        # Vector searches also return the distance so the relevance floor can
+        # reuse it instead of re-querying.
+        base_query = (
+            f"WITH {cte} "
+            f"SELECT {columns}, (embedding <=> (:qvec)::vector) AS distance "
+            f"FROM {source} ORDER BY embedding <=> (:qvec)::vector "
+        )
+        params["qvec"] = vector_literal(qvec)
+    else:
+        base_query = f"SELECT {columns} FROM {EMBEDDING_TABLE} "
+        if clauses:
+            base_query += "WHERE " + " AND ".join(clauses) + " "
+        if order_by:
+            base_query += f"ORDER BY {order_by} "
     if limit is not None:
         base_query += "LIMIT :k"
         params["k"] = limit
-    return db.execute(sql_text(base_query), params).fetchall()
+    result = await db.execute(sql_text(base_query), params)
+    return result.fetchall()
 
 
-def _relevance_distances(
-    db: Session,
+async def _relevance_distances(
+    db: AsyncSession,
     session_id: UUID | None,
     file_ids: list[int] | None,
     *,
@@ -145,16 +223,147 @@ def _relevance_distances(
     """
     if not keys:
         return {}
-    clauses, params = _build_embedding_filters(session_id, file_ids)
+    clauses, params = build_embedding_filters(session_id, file_ids)
     clauses.append("filename = ANY(:fns)")
     params["fns"] = sorted({fn for fn, _ in keys})
-    params["qvec"] = qvec.tolist()
+    params["qvec"] = vector_literal(qvec)
     query = (
         "SELECT filename, chunk_index, (embedding <=> (:qvec)::vector) AS distance "
         f"FROM {EMBEDDING_TABLE} WHERE " + " AND ".join(clauses)
     )
-    rows = db.execute(sql_text(query), params).fetchall()
-    return {(row.filename, row.chunk_index): float(row.distance) for row in rows}
+    result = await db.execute(sql_text(query), params)
+    return {(row.filename, row.chunk_index): float(row.distance) for row in result.fetchall()}
+
+
+async def _fetch_fulltext_rows(
+    db: AsyncSession,
+    session_id: UUID | None,
+    file_ids: list[int] | None,
+    *,
+    query: str,
+    limit: int,
+):
+    """Rank chunks with Postgres full-text search (GIN on content_tsv).
+
+    plainto_tsquery ANDs every term, which is far too strict for a study-focus
+    prompt, so its lexemes are OR-ed back together; ts_rank_cd then rewards
+    chunks matching more (and closer) terms, which is what BM25 gave us.
+    """
+    clauses, params = build_embedding_filters(session_id, file_ids)
+    clauses.append("content_tsv @@ q.query")
+    params["query"] = query
+    params["k"] = limit
+    sql = (
+        "WITH q AS (SELECT replace("
+        f"plainto_tsquery('{KEYWORD_TS_CONFIG}', :query)::text, '&', '|'"
+        ")::tsquery AS query) "
+        f"SELECT filename, chunk_index, content FROM {EMBEDDING_TABLE}, q "
+        "WHERE " + " AND ".join(clauses) + " "
+        "ORDER BY ts_rank_cd(content_tsv, q.query) DESC, chunk_index "
+        "LIMIT :k"
+    )
+    result = await db.execute(sql_text(sql), params)
+    return result.fetchall()
+
+
+async def _fetch_hybrid_rows(
+    db: AsyncSession,
+    session_id: UUID | None,
+    file_ids: list[int] | None,
+    *,
+    qvec: object,
+    query: str,
+    limit: int,
+    max_distance: float,
+):
+    """Vector KNN + full-text rank fused with weighted RRF, in one statement.
+
+    Each side ranks ``limit * FLASHCARD_HYBRID_CANDIDATE_MULTIPLIER`` candidates;
+    fused rows carry their cosine distance so the relevance floor is applied
+    here rather than in a follow-up query. ``max_distance <= 0`` disables it.
+    """
+    clauses, params = build_embedding_filters(session_id, file_ids)
+    candidates = max(limit, limit * FLASHCARD_HYBRID_CANDIDATE_MULTIPLIER)
+    strategy = await choose_vector_search(db, session_id, file_ids, limit=candidates)
+    cte, source = scoped_cte(
+        strategy,
+        clauses,
+        "id, embedding",
+        qvec_sql="(:qvec)::vector",
+        limit=candidates,
+    )
+    keyword_where = "WHERE " + " AND ".join([*clauses, "content_tsv @@ q.query"]) + " "
+    params.update(
+        {
+            "qvec": vector_literal(qvec),
+            "query": query,
+            "candidates": candidates,
+            "k": limit,
+            "wv": HYBRID_VECTOR_WEIGHT,
+            "wk": HYBRID_KEYWORD_WEIGHT,
+            "rrf_c": HYBRID_RRF_C,
+            "max_distance": max_distance,
+        }
+    )
+    sql = (
+        f"WITH {cte}, q AS ("
+        "SELECT (:qvec)::vector AS qvec, replace("
+        f"plainto_tsquery('{KEYWORD_TS_CONFIG}', :query)::text, '&', '|'"
+        ")::tsquery AS query), "
+        "vector_hits AS ("
+        "SELECT id, row_number() OVER (ORDER BY distance) AS rank FROM ("
+        "SELECT id, embedding <=> q.qvec AS distance "
+        f"FROM {source}, q "
+        "ORDER BY embedding <=> q.qvec LIMIT :candidates) v), "
+        "keyword_hits AS ("
+        "SELECT id, row_number() OVER (ORDER BY score DESC, chunk_index) AS rank FROM ("
+        "SELECT id, chunk_index, ts_rank_cd(content_tsv, q.query) AS score "
+        f"FROM {EMBEDDING_TABLE}, q {keyword_where}"
+        "ORDER BY score DESC, chunk_index LIMIT :candidates) kw), "
+        "fused AS ("
+        "SELECT COALESCE(v.id, kw.id) AS id, "
+        "COALESCE(CAST(:wv AS float8) / (CAST(:rrf_c AS float8) + v.rank), 0) "
+        "+ COALESCE(CAST(:wk AS float8) / (CAST(:rrf_c AS float8) + kw.rank), 0) AS score "
+        "FROM vector_hits v FULL OUTER JOIN keyword_hits kw ON kw.id = v.id) "
+        "SELECT e.filename, e.chunk_index, e.content, "
+        "(e.embedding <=> q.qvec) AS distance "
+        f"FROM fused f JOIN {EMBEDDING_TABLE} e ON e.id = f.id, q "
+        "WHERE CAST(:max_distance AS float8) <= 0 "
+        "OR (e.embedding <=> q.qvec) <= CAST(:max_distance AS float8) "
+        "ORDER BY f.score DESC, distance "
+        "LIMIT :k"
+    )
+    result = await db.execute(sql_text(sql), params)
+    return result.fetchall()
+
+
+async def _retrieve_sql_hybrid(
+    db: AsyncSession,
+    session_id: UUID | None,
+    file_ids: list[int] | None,
+    retrieval: "RetrievalContext",
+    *,
+    limit: int,
+) -> list[tuple[str, int, str]] | None:
+    """Run the single-statement hybrid search; None means "use the ensemble path"."""
+    try:
+        qvec = await retrieval.query_vector()
+        rows = await _fetch_hybrid_rows(
+            db,
+            session_id,
+            file_ids,
+            qvec=qvec,
+            query=retrieval.query,
+            limit=limit,
+            max_distance=FLASHCARD_MAX_RETRIEVAL_DISTANCE,
+        )
+    except Exception as exc:
+        # A failed statement aborts the transaction; clear it before falling back.
+        await db.rollback()
+        print(f"[Hybrid Retrieval] SQL engine failed; falling back to ensemble: {exc}")
+        return None
+    retrieval.record_distances(rows)
+    return [(row.filename, row.chunk_index, row.content) for row in rows]
 
 
 def _rows_to_documents(rows) -> list[Document]:
@@ -197,17 +406,45 @@ def _build_bm25_retriever(
     return retriever
 
 
-async def _retrieve_bm25_row_items(
-    documents: list[Document],
-    query: str,
+async def _build_keyword_retriever(
+    db: AsyncSession,
+    session_id: UUID | None,
+    file_ids: list[int] | None,
     *,
     limit: int,
-) -> list[tuple[str, int, str]]:
-    retriever = _build_bm25_retriever(documents, limit=limit)
-    if retriever is None:
-        return []
-    docs = await _ainvoke_retriever(retriever, query)
-    return _documents_to_row_items(docs)
+) -> "BaseRetriever | PgFullTextRetriever | None":
+    """Keyword half of the hybrid retriever.
+
+    FLASHCARD_KEYWORD_BACKEND=postgres ranks in the database. Otherwise
+    sessions use the persistent per-session index (whole vault, no rebuild).
+    Session-less requests keep the legacy path: BM25 over the first
+    FLASHCARD_BM25_CANDIDATE_MAX chunks, rebuilt per call.
+    """
+    if FLASHCARD_KEYWORD_BACKEND == "postgres":
+        return PgFullTextRetriever(
+            db=db,
+            session_id=session_id,
+            file_ids=file_ids,
+            k=limit,
+        )
+    if session_id is not None:
+        # Reconciliation is plain sync SQLAlchemy; run it on the async connection.
+        index = await db.run_sync(get_session_index, session_id)
+        if not len(index):
+            return None
+        return SessionKeywordRetriever(index=index, file_ids=file_ids, k=limit)
+    candidate_limit = min(
+        FLASHCARD_BM25_CANDIDATE_MAX,
+        max(limit * FLASHCARD_BM25_CANDIDATE_MULTIPLIER, limit),
+    )
+    rows = await _fetch_embedding_rows(
+        db,
+        session_id,
+        file_ids,
+        order_by="chunk_index",
+        limit=candidate_limit,
+    )
+    return _build_bm25_retriever(_rows_to_documents(rows), limit=limit)
 
 
 def _clean_filename(value: str) -> str:
@@ -224,10 +461,7 @@ def _clean_filename(value: str) -> str:
 _AUTH_ERROR_CODES = {401, 403}
 
 
-def _openrouter_chat(
-    prompt: str,
-    target_tokens: int,
-) -> tuple[str, str]:
+def _openrouter_request() -> tuple[str, dict[str, str]]:
     if not OPENROUTER_API_KEY:
         raise HTTPException(
             status_code=500,
@@ -242,54 +476,73 @@ def _openrouter_chat(
         headers["HTTP-Referer"] = OPENROUTER_REFERER
     if OPENROUTER_TITLE:
         headers["X-Title"] = OPENROUTER_TITLE
+    return url, headers
 
-    print(f"[OpenRouter] Trying model: {OPENROUTER_MODEL}")
-    payload = {
+
+def _openrouter_payload(prompt: str, target_tokens: int) -> dict:
+    return {
         "model": OPENROUTER_MODEL,
         "messages": [{"role": "user", "content": prompt}],
         "max_tokens": target_tokens,
         "temperature": FLASHCARD_LLM_TEMPERATURE,
     }
-    data = json.dumps(payload).encode("utf-8")
-    request = urlrequest.Request(url, data=data, headers=headers, method="POST")
-    try:
-        with urlrequest.urlopen(request, timeout=FLASHCARD_LLM_TIMEOUT_SECONDS) as resp:
-            body = resp.read()
-    except HTTPError as exc:
-        try:
-            error_body = exc.read().decode("utf-8")
-        except Exception:
-            error_body = ""
-        if exc.code in _AUTH_ERROR_CODES:
-            raise HTTPException(
-                status_code=401,
-                detail="OpenRouter authentication failed. Check your API key.",
-            ) from exc
-        try:
-            err_json = json.loads(error_body)
-            inner = err_json.get("error") if isinstance(err_json, dict) else None
-            reason = (inner.get("message") if isinstance(inner, dict) else None) or error_body
-        except (json.JSONDecodeError, AttributeError):
-            reason = error_body or f"HTTP {exc.code}"
+
+
+def _raise_openrouter_status(status_code: int, error_body: str) -> None:
+    if status_code in _AUTH_ERROR_CODES:
         raise HTTPException(
-            status_code=503,
-            detail=f"OpenRouter request failed: {reason or f'HTTP {exc.code}'}",
-        ) from exc
-    except URLError as exc:
+            status_code=401,
+            detail="OpenRouter authentication failed. Check your API key.",
+        )
+    try:
+        err_json = json.loads(error_body)
+        inner = err_json.get("error") if isinstance(err_json, dict) else None
+        reason = (inner.get("message") if isinstance(inner, dict) else None) or error_body
+    except (json.JSONDecodeError, AttributeError):
+        reason = error_body or f"HTTP {status_code}"
+    raise HTTPException(
+        status_code=503,
+        detail=f"OpenRouter request failed: {reason or f'HTTP {status_code}'}",
+    )
+
+
+def _raise_openrouter_error(response: dict) -> None:
+    if isinstance(response, dict) and response.get("error"):
+        error = response["error"]
+        reason = error.get("message") if isinstance(error, dict) else str(error)
+        raise HTTPException(status_code=503, detail=f"OpenRouter error: {reason or 'unknown'}")
+
+
+async def _openrouter_chat(
+    prompt: str,
+    target_tokens: int,
+) -> tuple[str, str]:
+    url, headers = _openrouter_request()
+    print(f"[OpenRouter] Trying model: {OPENROUTER_MODEL}")
+    try:
+        resp = await get_async_client().post(
+            url,
+            json=_openrouter_payload(prompt, target_tokens),
+            headers=headers,
+            timeout=FLASHCARD_LLM_TIMEOUT_SECONDS,
+        )
+    except httpx.TimeoutException as exc:
+        raise AsyncTimeoutError() from exc
+    except httpx.TransportError as exc:
         raise HTTPException(
             status_code=502,
             detail="Could not connect to OpenRouter. Check your network.",
         ) from exc
+    body = resp.content
+    if resp.status_code >= 400:
+        _raise_openrouter_status(resp.status_code, resp.text)
 
     try:
         response = json.loads(body.decode("utf-8"))
     except json.JSONDecodeError as exc:
         raise HTTPException(status_code=503, detail="OpenRouter returned malformed JSON.") from exc
 
-    if isinstance(response, dict) and response.get("error"):
-        error = response["error"]
-        reason = error.get("message") if isinstance(error, dict) else str(error)
-        raise HTTPException(status_code=503, detail=f"OpenRouter error: {reason or 'unknown'}")
+    _raise_openrouter_error(response)
 
     choices = response.get("choices")
     if not isinstance(choices, list) or not choices:
@@ -310,6 +563,55 @@ def _openrouter_chat(
     return content, actual_model
 
 
+async def _openrouter_chat_stream(
+    prompt: str,
+    target_tokens: int,
+) -> AsyncIterator[tuple[str, str | None]]:
+    """Stream a chat completion as (text delta, model) pairs from OpenRouter's SSE API."""
+    url, headers = _openrouter_request()
+    print(f"[OpenRouter] Streaming model: {OPENROUTER_MODEL}")
+    payload = {**_openrouter_payload(prompt, target_tokens), "stream": True}
+    try:
+        async with get_async_client().stream(
+            "POST",
+            url,
+            json=payload,
+            headers=headers,
+            timeout=FLASHCARD_LLM_TIMEOUT_SECONDS,
+        ) as resp:
+            if resp.status_code >= 400:
+                await resp.aread()
+                _raise_openrouter_status(resp.status_code, resp.text)
+            async for line in resp.aiter_lines():
+                # Skip blank separators and ": OPENROUTER PROCESSING" keep-alives.
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                try:
+                    chunk = json.loads(data)
+                except json.JSONDecodeError:
+                    continue
+                _raise_openrouter_error(chunk)
+                choices = chunk.get("choices") if isinstance(chunk, dict) else None
+                first = choices[0] if isinstance(choices, list) and choices else None
+                delta = first.get("delta") if isinstance(first, dict) else None
+                text = delta.get("content") if isinstance(delta, dict) else None
+                raw_model = chunk.get("model") if isinstance(chunk, dict) else None
+                yield (
+                    text if isinstance(text, str) else "",
+                    raw_model if isinstance(raw_model, str) else None,
+                )
+    except httpx.TimeoutException as exc:
+        raise AsyncTimeoutError() from exc
+    except httpx.TransportError as exc:
+        raise HTTPException(
+            status_code=502,
+            detail="Could not connect to OpenRouter. Check your network.",
+        ) from exc
+
+
 def _build_deck_title(filenames: list[str]) -> str:
     cleaned = [_clean_filename(name) for name in filenames if isinstance(name, str)]
     cleaned = [name for name in cleaned if name]
@@ -321,13 +623,12 @@ def _build_deck_title(filenames: list[str]) -> str:
     return f"{first} + {len(cleaned) - 1} more"
 
 
-def _fetch_source_files(
-    db: Session,
+async def _fetch_source_files(
+    db: AsyncSession,
     session_id: UUID,
     file_ids: list[int] | None,
     fallback_filenames: list[str],
 ) -> list[dict]:
-    rows = []
     filename_filter: list[str] = []
     seen_names: set[str] = set()
     for name in fallback_filenames:
@@ -339,7 +640,7 @@ def _fetch_source_files(
         seen_names.add(trimmed)
         filename_filter.append(trimmed)
     if file_ids:
-        rows = db.execute(
+        result = await db.execute(
             sql_text(
                 "SELECT id, filename "
                 "FROM notes "
@@ -347,9 +648,9 @@ def _fetch_source_files(
                 "ORDER BY id"
             ),
             {"sid": session_id, "file_ids": file_ids},
-        ).fetchall()
+        )
     elif filename_filter:
-        rows = db.execute(
+        result = await db.execute(
             sql_text(
                 "SELECT id, filename "
                 "FROM notes "
@@ -357,9 +658,9 @@ def _fetch_source_files(
                 "ORDER BY id"
             ),
             {"sid": session_id, "filenames": filename_filter},
-        ).fetchall()
+        )
     else:
-        rows = db.execute(
+        result = await db.execute(
             sql_text(
                 "SELECT id, filename "
                 "FROM notes "
@@ -367,8 +668,9 @@ def _fetch_source_files(
                 "ORDER BY id"
             ),
             {"sid": session_id},
-        ).fetchall()
+        )
 
+    rows = result.fetchall()
     sources: list[dict] = []
     seen = set()
     for row in rows:
@@ -394,8 +696,8 @@ def _fetch_source_files(
     return sources
 
 
-def _persist_flashcard_deck(
-    db: Session,
+async def _persist_flashcard_deck(
+    db: AsyncSession,
     session_id: UUID,
     source_files: list[dict],
     source_chunks: list[dict],
@@ -419,16 +721,107 @@ def _persist_flashcard_deck(
         created_at=datetime.now(timezone.utc),
     )
     db.add(deck)
-    db.commit()
-    db.refresh(deck)
+    await db.commit()
+    await db.refresh(deck)
     return deck
 
 
-class PgVectorRetriever(BaseRetriever):
-    db: Session
+class RetrievalContext:
+    """Request-scoped retrieval state for one generate_flashcards call.
+
+    Carries the query vector (embedded at most once, on first use) and every
+    query↔chunk cosine distance seen so far, so vector retrieval, the relevance
+    floor and code-chunk recovery share them instead of re-embedding or
+    re-querying. ``embed_calls`` is reported back in ``retrieval_stats``.
+    """
+
+    def __init__(self, query: str) -> None:
+        self.query = query
+        self.distances: dict[tuple[str, int], float] = {}
+        self.embed_calls = 0
+        self._qvec = None
+
+    @property
+    def cached_vector(self):
+        return self._qvec
+
+    async def query_vector(self):
+        if self._qvec is None:
+            self.embed_calls += 1
+            self._qvec = await embed_query(self.query)
+        return self._qvec
+
+    def record_distances(self, rows) -> None:
+        for row in rows:
+            distance = getattr(row, "distance", None)
+            if distance is not None:
+                self.distances[(row.filename, row.chunk_index)] = float(distance)
+
+
+@dataclass
+class PgVectorRetriever:
+    """Vector KNN over the session's chunks.
+
+    Not a LangChain ``BaseRetriever``: it holds an AsyncSession and has no
+    sync path, so it only offers ``ainvoke`` and is fused by
+    ``_ensemble_retrieve``. With ``coarse_to_fine`` an index-backed search
+    shortlists on the prefix vector and re-ranks on the full one.
+    """
+
+    db: AsyncSession
     session_id: UUID | None
     file_ids: list[int] | None
     k: int | None
+    context: RetrievalContext | None = None
+    coarse_to_fine: bool = FLASHCARD_COARSE_TO_FINE
+
+    def _context_for(self, query: str) -> RetrievalContext:
+        if self.context is not None and self.context.query == query:
+            return self.context
+        return RetrievalContext(query=query)
+
+    async def ainvoke(self, query: str) -> list[Document]:
+        context = self._context_for(query)
+        qvec = await context.query_vector()
+        # One session, one statement at a time.
+        async with session_lock(self.db):
+            rows = await _fetch_embedding_rows(
+                self.db,
+                self.session_id,
+                self.file_ids,
+                qvec=qvec,
+                limit=self.k,
+                coarse="prefix" if self.coarse_to_fine else None,
+            )
+        context.record_distances(rows)
+        return _rows_to_documents(rows)
+
+
+@dataclass
+class PgFullTextRetriever:
+    """Full-text ranking in Postgres; async-only like ``PgVectorRetriever``."""
+
+    db: AsyncSession
+    session_id: UUID | None
+    file_ids: list[int] | None
+    k: int
+
+    async def ainvoke(self, query: str) -> list[Document]:
+        async with session_lock(self.db):
+            rows = await _fetch_fulltext_rows(
+                self.db,
+                self.session_id,
+                self.file_ids,
+                query=query,
+                limit=self.k,
+            )
+        return _rows_to_documents(rows)
+
+
+class SessionKeywordRetriever(BaseRetriever):
+    index: SessionKeywordIndex
+    file_ids: list[int] | None
+    k: int
 
     if ConfigDict is not None:
         model_config = ConfigDict(arbitrary_types_allowed=True)
@@ -437,26 +830,16 @@ class PgVectorRetriever(BaseRetriever):
             arbitrary_types_allowed = True
 
     def _get_relevant_documents(self, query: str, *, run_manager=None) -> list[Document]:
-        qvec = embed_query_sync(query)
-        rows = _fetch_embedding_rows(
-            self.db,
-            self.session_id,
-            self.file_ids,
-            qvec=qvec,
-            limit=self.k,
-        )
-        return _rows_to_documents(rows)
-
-    async def _aget_relevant_documents(self, query: str, *, run_manager=None) -> list[Document]:
-        qvec = await embed_query(query)
-        rows = _fetch_embedding_rows(
-            self.db,
-            self.session_id,
-            self.file_ids,
-            qvec=qvec,
-            limit=self.k,
-        )
-        return _rows_to_documents(rows)
+        return [
+            Document(
+                page_content=chunk.content,
+                metadata={
+                    "filename": chunk.filename,
+                    "chunk_index": chunk.chunk_index,
+                },
+            )
+            for chunk in self.index.search(query, limit=self.k, file_ids=self.file_ids)
+        ]
 
 
 async def _ainvoke_retriever(retriever, query: str):
@@ -467,8 +850,29 @@ async def _ainvoke_retriever(retriever, query: str):
     return retriever.get_relevant_documents(query)
 
 
+async def _ensemble_retrieve(retrievers: list, weights: list[float], query: str) -> list[Document]:
+    """Fuse the retrievers' results with weighted reciprocal rank fusion.
+
+    Scores like LangChain's EnsembleRetriever (documents keyed by content,
+    ``HYBRID_RRF_C`` damping) but awaits each retriever itself, so the
+    async-only Postgres retrievers take part. They share one session, so
+    they run one after another.
+    """
+    scores: dict[str, float] = {}
+    docs_by_content: dict[str, Document] = {}
+    for retriever, weight in zip(retrievers, weights):
+        docs = await _ainvoke_retriever(retriever, query)
+        for rank, doc in enumerate(docs, start=1):
+            docs_by_content.setdefault(doc.page_content, doc)
+            scores[doc.page_content] = scores.get(doc.page_content, 0.0) + weight / (
+                rank + HYBRID_RRF_C
+            )
+    ranked = sorted(scores, key=scores.__getitem__, reverse=True)
+    return [docs_by_content[content] for content in ranked]
+
+
 async def _ensure_embeddings(
-    db: Session,
+    db: AsyncSession,
     *,
     session_id: UUID | None,
     file_ids: list[int] | None,
@@ -477,10 +881,11 @@ async def _ensure_embeddings(
     if session_id is None:
         return
 
-    notes_query = db.query(Files).filter(Files.session_id == session_id)
+    notes_query = select(Files).where(Files.session_id == session_id)
     if file_ids:
-        notes_query = notes_query.filter(Files.id.in_(file_ids))
-    note_rows = notes_query.order_by(Files.id.asc()).all()
+        notes_query = notes_query.where(Files.id.in_(file_ids))
+    notes_result = await db.execute(notes_query.order_by(Files.id.asc()))
+    note_rows = notes_result.scalars().all()
     if not note_rows:
         return
 
@@ -492,16 +897,17 @@ async def _ensure_embeddings(
     if file_ids:
         existing_query += " AND files_id = ANY(:file_ids)"
         params["file_ids"] = file_ids
-    existing_ids = {
-        row.files_id
-        for row in db.execute(sql_text(existing_query), params).fetchall()
-    }
+    existing_result = await db.execute(sql_text(existing_query), params)
+    existing_ids = {row.files_id for row in existing_result.fetchall()}
 
     missing_rows = [row for row in note_rows if row.id not in existing_ids]
     if not missing_rows:
         return
 
     splitter = RecursiveCharacterTextSplitter(chunk_size=512)
+    written: dict[int, list[tuple[int, str, int, str]]] = {}
+    # Missing notes are embedded in shared cross-note batches.
+    batcher = EmbeddingBatcher(db)
     try:
         for note_row in missing_rows:
             raw_content = note_row.raw_content or b""
@@ -521,26 +927,34 @@ async def _ensure_embeddings(
             )
             if not chunks:
                 continue
-
-            vectors = await embed_chunks(chunks)
-            db.add_all(
-                [
-                    Embeddings(
-                        files_id=note_row.id,
-                        session_id=session_id,
-                        filename=filename,
-                        content_type=note_row.content_type or "text/plain",
-                        chunk_index=i,
-                        content=chunk,
-                        embedding=vec.tolist(),
-                    )
-                    for i, (chunk, vec) in enumerate(zip(chunks, vectors))
-                ]
+            # Raw text, no backlinks: the next vault upload sees the hash
+            # mismatch and re-embeds this note with its backlinks baked in.
+            note_row.embedding_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+            if note_row.content_hash is None:
+                note_row.content_hash = hashlib.sha256(raw_content).hexdigest()
+            batcher.add((note_row, filename), chunks)
+
+        async for done in batcher.drain(final=True):
+            if done.error is not None:
+                raise done.error
+            note_row, filename = done.key
+            written[note_row.id] = await write_file_embeddings(
+                db,
+                session_id=session_id,
+                files_id=note_row.id,
+                filename=filename,
+                content_type=note_row.content_type,
+                chunks=done.chunks,
+                vectors=done.result(),
             )
-        db.commit()
+        await db.commit()
     except Exception:
-        db.rollback()
+        await db.rollback()
         raise
+    for files_id, rows in written.items():
+        index_file_chunks(session_id, files_id, rows)
+    if written:
+        invalidate_session_generations(session_id)
 
 
 def _normalize_obsidian_latex(text: str) -> str:
@@ -601,57 +1015,73 @@ def _normalize_card(item: object) -> dict | None:
     }
 
 
-def _parse_qa_blocks(text: str) -> list[dict]:
-    cleaned = text.replace("```json", "")  # keep inner code fences; only drop a ```json wrapper marker
-    cards: list[dict] = []
-    current_q: str | None = None
-    current_a: list[str] = []
-    current_source: int | None = None
-    in_answer = False
-    in_code_fence = False
-
-    def flush_current():
-        nonlocal current_q, current_a, current_source, in_answer, in_code_fence
-        if current_q and current_a:
+_INLINE_QA_RE = re.compile(
+    r"^(?:\d+[\).\s]+)?(?:Q|Question)\s*[:\-]\s*(.+?)\s+(?:A|Answer)\s*[:\-]\s*(.+)$",
+    re.IGNORECASE,
+)
+_QUESTION_RE = re.compile(r"^(?:\d+[\).\s]+)?(?:Q|Question)\s*[:\-]\s*(.+)$", re.IGNORECASE)
+_ANSWER_RE = re.compile(r"^(?:A|Answer)\s*[:\-]\s*(.*)$", re.IGNORECASE)
+_SOURCE_RE = re.compile(r"^(?:Source|Source Tag)\s*[:\-]\s*(.+)$", re.IGNORECASE)
+
+
+class _QABlockParser:
+    """Line-at-a-time parser for the Q:/A:/Source: card format.
+
+    ``feed_line`` returns the cards a line completes, so the same parser serves
+    whole completions (``_parse_qa_blocks``) and token streams. With
+    ``emit_on_source`` a card is complete as soon as its ``Source:`` line
+    arrives (the prompt puts it last) instead of when the next card starts.
+    """
+
+    def __init__(self, *, emit_on_source: bool = False) -> None:
+        self.emit_on_source = emit_on_source
+        self.current_q: str | None = None
+        self.current_a: list[str] = []
+        self.current_source: int | None = None
+        self.in_answer = False
+        self.in_code_fence = False
+
+    def _flush(self) -> list[dict]:
+        cards: list[dict] = []
+        if self.current_q and self.current_a:
             cards.append(
                 {
-                    "question": current_q.strip(),
-                    "answer": "\n".join(current_a).strip(),
-                    "source_tag": current_source,
+                    "question": self.current_q.strip(),
+                    "answer": "\n".join(self.current_a).strip(),
+                    "source_tag": self.current_source,
                 }
             )
-        current_q = None
-        current_a = []
-        current_source = None
-        in_answer = False
-        in_code_fence = False
+        self.current_q = None
+        self.current_a = []
+        self.current_source = None
+        self.in_answer = False
+        self.in_code_fence = False
+        return cards
 
-    for raw_line in cleaned.splitlines():
+    def feed_line(self, raw_line: str) -> list[dict]:
+        # keep inner code fences; only drop a ```json wrapper marker
+        raw_line = raw_line.replace("```json", "")
         stripped = raw_line.strip()
 
         # Inside (or entering/leaving) a fenced code block, preserve the line
         # verbatim — keep indentation, don't strip, and don't misparse code as a
         # Q/A/Source label. Only trailing whitespace (markdown "  " breaks) is cut.
         is_fence = stripped.startswith("```")
-        if in_code_fence or is_fence:
-            if in_answer and current_q:
-                current_a.append(raw_line.rstrip())
+        if self.in_code_fence or is_fence:
+            if self.in_answer and self.current_q:
+                self.current_a.append(raw_line.rstrip())
             if is_fence:
-                in_code_fence = not in_code_fence
-            continue
+                self.in_code_fence = not self.in_code_fence
+            return []
 
         line = stripped
         if not line:
-            continue
+            return []
         line = re.sub(r"^\s*[-*•]\s*", "", line)
 
-        inline = re.match(
-            r"^(?:\d+[\).\s]+)?(?:Q|Question)\s*[:\-]\s*(.+?)\s+(?:A|Answer)\s*[:\-]\s*(.+)$",
-            line,
-            re.IGNORECASE,
-        )
+        inline = _INLINE_QA_RE.match(line)
         if inline:
-            flush_current()
+            cards = self._flush()
             cards.append(
                 {
                     "question": _normalize_obsidian_latex(inline.group(1).strip()),
@@ -659,43 +1089,67 @@ def _parse_qa_blocks(text: str) -> list[dict]:
                     "source_tag": None,
                 }
             )
-            continue
+            return cards
 
-        q_match = re.match(
-            r"^(?:\d+[\).\s]+)?(?:Q|Question)\s*[:\-]\s*(.+)$",
-            line,
-            re.IGNORECASE,
-        )
+        q_match = _QUESTION_RE.match(line)
         if q_match:
-            flush_current()
-            current_q = _normalize_obsidian_latex(q_match.group(1).strip())
-            continue
+            cards = self._flush()
+            self.current_q = _normalize_obsidian_latex(q_match.group(1).strip())
+            return cards
 
-        a_match = re.match(r"^(?:A|Answer)\s*[:\-]\s*(.*)$", line, re.IGNORECASE)
-        if a_match and current_q:
-            in_answer = True
+        a_match = _ANSWER_RE.match(line)
+        if a_match and self.current_q:
+            self.in_answer = True
             # ".*" so a bare "A:" (answer body, e.g. a code block, on following
             # lines) still opens answer mode instead of dropping the card.
             inline_answer = a_match.group(1).strip()
             if inline_answer:
-                current_a.append(_normalize_obsidian_latex(inline_answer))
-            continue
+                self.current_a.append(_normalize_obsidian_latex(inline_answer))
+            return []
 
-        source_match = re.match(
-            r"^(?:Source|Source Tag)\s*[:\-]\s*(.+)$",
-            line,
-            re.IGNORECASE,
-        )
-        if source_match and current_q:
+        source_match = _SOURCE_RE.match(line)
+        if source_match and self.current_q:
             tag_str = source_match.group(1)
             match = re.search(r"\d+", tag_str)
-            current_source = int(match.group(0)) if match else None
-            continue
+            self.current_source = int(match.group(0)) if match else None
+            return self._flush() if self.emit_on_source else []
+
+        if self.in_answer and self.current_q:
+            self.current_a.append(_normalize_obsidian_latex(line))
+        return []
+
+    def finish(self) -> list[dict]:
+        return self._flush()
+
+
+class _FlashcardStreamParser:
+    """Feed raw completion text in arbitrary pieces; get cards back as they complete."""
+
+    def __init__(self) -> None:
+        self._parser = _QABlockParser(emit_on_source=True)
+        self._buffer = ""
+
+    def feed(self, text: str) -> list[dict]:
+        self._buffer += text
+        *lines, self._buffer = self._buffer.split("\n")
+        cards: list[dict] = []
+        for line in lines:
+            cards.extend(self._parser.feed_line(line))
+        return cards
 
-        if in_answer and current_q:
-            current_a.append(_normalize_obsidian_latex(line))
+    def finish(self) -> list[dict]:
+        cards = self._parser.feed_line(self._buffer) if self._buffer else []
+        self._buffer = ""
+        return cards + self._parser.finish()
 
-    flush_current()
+
+def _parse_qa_blocks(text: str) -> list[dict]:
+    cleaned = text.replace("```json", "")  # keep inner code fences; only drop a ```json wrapper marker
+    parser = _QABlockParser()
+    cards: list[dict] = []
+    for raw_line in cleaned.splitlines():
+        cards.extend(parser.feed_line(raw_line))
+    cards.extend(parser.finish())
 
     if cards:
         return cards
@@ -769,111 +1223,125 @@ def _is_code_intent_query(prompt: str | None) -> bool:
     return bool(prompt and _CODE_INTENT_RE.search(prompt))
 
 
-async def generate_flashcards(
-    prompt: str | None,
-    k: int | None,
-    session_id: UUID | None,
-    file_ids: list[int] | None,
-    replace: bool,
-    flashcard_amount: str | None,
-    db: Session,
-    persist: bool = True,
-    include_context: bool = False,
-):
-    """
-    Retrieve chunks via hybrid BM25 + pgvector and ask llm to generate flashcards.
+@dataclass
+class _GenerationPlan:
+    """Everything retrieval decides before the LLM is called."""
 
-    When ``persist`` is False the generated deck/flashcards are not written to the
-    database (used by the benchmark harness so runs don't pollute the DB). The
-    full result — flashcards, sources, raw output, model_used — is still returned.
+    prompt: str | None
+    session_id: UUID | None
+    sources: list[dict]
+    # (filename, chunk_index, content) behind each source, by tag.
+    packed_items: list[tuple[str, int, str]]
+    source_files: list[dict]
+    n_flashcards: int
+    llm_prompt: str
+    target_tokens: int
+    retrieval_s: float
+    retrieval_stats: dict
+
+    @property
+    def source_chunks(self) -> list[dict]:
+        return [
+            {
+                "tag": source.get("tag"),
+                "filename": source.get("filename"),
+                "chunk_index": source.get("chunk_index"),
+            }
+            for source in self.sources
+        ]
 
-    When ``include_context`` is True each ``sources`` entry also carries the raw
-    chunk ``content``. Off by default so the production API payload stays lean;
-    the benchmark harness turns it on so LLM-judge scorers (e.g. RAGAS
-    faithfulness) can see the context the cards were generated from.
-    """
 
+def _require_prompt_or_session(prompt: str | None, session_id: UUID | None) -> None:
     if not prompt and session_id is None:
         raise HTTPException(
             status_code=400,
             detail="prompt is required unless session_id is provided",
         )
 
+
+async def _prepare_generation(
+    *,
+    prompt: str | None,
+    k: int | None,
+    session_id: UUID | None,
+    file_ids: list[int] | None,
+    flashcard_amount: str | None,
+    db: AsyncSession,
+    include_context: bool,
+) -> _GenerationPlan:
+    """Retrieve and pack context, size the deck and build the LLM prompt."""
+    _require_prompt_or_session(prompt, session_id)
+
     session_row = None
     if session_id is not None:
-        session_row = db.get(Sessions, session_id)
+        session_row = await db.get(Sessions, session_id)
         if session_row is None:
             raise HTTPException(status_code=404, detail="session_id not found")
 
     await _ensure_embeddings(db=db, session_id=session_id, file_ids=file_ids)
 
+    retrieval_started = time.perf_counter()
     effective_k = k
     if effective_k is None:
         # Prevent unbounded retrieval/context for session-wide generation.
         effective_k = 5 if session_id is None else FLASHCARD_DEFAULT_RETRIEVAL_K
+    effective_k = max(1, min(effective_k, FLASHCARD_MAX_RETRIEVAL_K))
 
     row_items: list[tuple[str, int, str]] = []
-    if prompt:
+    retrieval = RetrievalContext(query=prompt) if prompt else None
+    sql_hybrid = None
+    if retrieval is not None and FLASHCARD_HYBRID_ENGINE == "sql":
+        sql_hybrid = await _retrieve_sql_hybrid(
+            db,
+            session_id,
+            file_ids,
+            retrieval,
+            limit=effective_k,
+        )
+    if sql_hybrid is not None:
+        # Already fused, floored and cut to k in SQL.
+        row_items = sql_hybrid
+    elif prompt:
         try:
-            bm25_limit = min(
-                FLASHCARD_BM25_CANDIDATE_MAX,
-                max(
-                    effective_k * FLASHCARD_BM25_CANDIDATE_MULTIPLIER,
-                    effective_k,
-                ),
+            vector_retriever = PgVectorRetriever(
+                db=db,
+                session_id=session_id,
+                file_ids=file_ids,
+                k=effective_k,
+                context=retrieval,
             )
-            bm25_rows = _fetch_embedding_rows(
+            keyword_retriever = await _build_keyword_retriever(
                 db,
                 session_id,
                 file_ids,
-                order_by="chunk_index",
-                limit=bm25_limit,
+                limit=effective_k,
             )
-            bm25_documents = _rows_to_documents(bm25_rows)
-            if bm25_documents:
-                bm25_k = effective_k if effective_k is not None else len(bm25_documents)
-                vector_retriever = PgVectorRetriever(
-                    db=db,
-                    session_id=session_id,
-                    file_ids=file_ids,
-                    k=effective_k,
-                )
-                bm25_retriever = _build_bm25_retriever(bm25_documents, limit=bm25_k)
-                if bm25_retriever is None:
-                    print("[Hybrid Retrieval] rank_bm25 unavailable; using vector-only retrieval.")
+            if keyword_retriever is None:
+                print("[Hybrid Retrieval] No keyword index available; using vector-only retrieval.")
+                vector_docs = await _ainvoke_retriever(vector_retriever, prompt)
+                row_items = _documents_to_row_items(vector_docs)
+            else:
+                try:
+                    hybrid_docs = await _ensemble_retrieve(
+                        [keyword_retriever, vector_retriever],
+                        [HYBRID_KEYWORD_WEIGHT, HYBRID_VECTOR_WEIGHT],
+                        prompt,
+                    )
+                    row_items = _documents_to_row_items(hybrid_docs)
+                except Exception as exc:
+                    print(f"[Hybrid Retrieval] Falling back to vector-only retrieval: {exc}")
                     try:
                         vector_docs = await _ainvoke_retriever(vector_retriever, prompt)
                         row_items = _documents_to_row_items(vector_docs)
                     except Exception as vector_exc:
-                        print(f"[Hybrid Retrieval] Vector-only retrieval failed: {vector_exc}")
-                        row_items = _documents_to_row_items(bm25_documents[:bm25_k])
-                else:
-                    ensemble = EnsembleRetriever(
-                        retrievers=[bm25_retriever, vector_retriever],
-                        weights=[HYBRID_KEYWORD_WEIGHT, HYBRID_VECTOR_WEIGHT],
-                    )
-                    try:
-                        hybrid_docs = await _ainvoke_retriever(ensemble, prompt)
-                        row_items = _documents_to_row_items(hybrid_docs)
-                    except Exception as exc:
-                        print(f"[Hybrid Retrieval] Falling back to vector-only retrieval: {exc}")
-                        try:
-                            vector_docs = await _ainvoke_retriever(vector_retriever, prompt)
-                            row_items = _documents_to_row_items(vector_docs)
-                        except Exception as vector_exc:
-                            print(f"[Hybrid Retrieval] Vector fallback failed: {vector_exc}")
-                            try:
-                                row_items = await _retrieve_bm25_row_items(
-                                    bm25_documents,
-                                    prompt,
-                                    limit=bm25_k,
-                                )
-                            except Exception as bm25_exc:
-                                print(f"[Hybrid Retrieval] BM25 fallback failed: {bm25_exc}")
-                                row_items = _documents_to_row_items(bm25_documents[:bm25_k])
+                        print(f"[Hybrid Retrieval] Vector fallback failed: {vector_exc}")
+                        keyword_docs = await _ainvoke_retriever(keyword_retriever, prompt)
+                        row_items = _documents_to_row_items(keyword_docs)
         except Exception as retrieval_exc:
             print(f"[Hybrid Retrieval] Prompt path failed; falling back to chunk order: {retrieval_exc}")
-            rows = _fetch_embedding_rows(
+            # Clear a possibly aborted transaction before the fallback query.
+            await db.rollback()
+            rows = await _fetch_embedding_rows(
                 db,
                 session_id,
                 file_ids,
@@ -882,7 +1350,7 @@ async def generate_flashcards(
             )
             row_items = [(row.filename, row.chunk_index, row.content) for row in rows]
     else:
-        rows = _fetch_embedding_rows(
+        rows = await _fetch_embedding_rows(
             db,
             session_id,
             file_ids,
@@ -908,15 +1376,24 @@ async def generate_flashcards(
     # threshold. Keeps focused queries on-topic, and lets an off-topic query
     # ("capital of France") fall through to an empty context → no cards. Applied
     # before code recovery so code-intent queries can still get a code chunk back.
-    if prompt and FLASHCARD_MAX_RETRIEVAL_DISTANCE > 0 and row_items:
-        qvec = await embed_query(prompt)
-        distances = _relevance_distances(
-            db,
-            session_id,
-            file_ids,
-            qvec=qvec,
-            keys=[(fn, ci) for fn, ci, _ in row_items],
-        )
+    # The SQL hybrid engine has already applied it in the retrieval statement.
+    if retrieval is not None and FLASHCARD_MAX_RETRIEVAL_DISTANCE > 0 and row_items and sql_hybrid is None:
+        # Vector hits already carry a distance; only keyword-only hits need one,
+        # and that lookup reuses the request's query vector.
+        missing = [
+            (fn, ci) for fn, ci, _ in row_items if (fn, ci) not in retrieval.distances
+        ]
+        if missing:
+            retrieval.distances.update(
+                await _relevance_distances(
+                    db,
+                    session_id,
+                    file_ids,
+                    qvec=await retrieval.query_vector(),
+                    keys=missing,
+                )
+            )
+        distances = retrieval.distances
         kept = [
             item
             for item in row_items
@@ -951,16 +1428,27 @@ async def generate_flashcards(
         if file_ids:
             where += " AND files_id = ANY(:file_ids)"
             code_params["file_ids"] = file_ids
-        order = "ORDER BY chunk_index"
+        columns = "filename, chunk_index, content"
+        tiebreak = "chunk_index"
+        qvec = retrieval.cached_vector if retrieval is not None else None
+        if qvec is not None:
+            # Reuse the request's query vector: closest code first, no re-embed.
+            code_params["qvec"] = vector_literal(qvec)
+            columns += ", (embedding <=> (:qvec)::vector) AS distance"
+            tiebreak = "embedding <=> (:qvec)::vector"
+        order = f"ORDER BY {tiebreak}"
         if retrieved_files:
             # Prefer on-topic code (from files already retrieved) before anything else.
             code_params["pref_files"] = retrieved_files
-            order = "ORDER BY (filename = ANY(:pref_files)) DESC, chunk_index"
+            order = f"ORDER BY (filename = ANY(:pref_files)) DESC, {tiebreak}"
         code_query = (
-            "SELECT filename, chunk_index, content "
+            f"SELECT {columns} "
             f"FROM {EMBEDDING_TABLE} WHERE {where} {order} LIMIT :k"
         )
-        extra_rows = db.execute(sql_text(code_query), code_params).fetchall()
+        code_result = await db.execute(sql_text(code_query), code_params)
+        extra_rows = code_result.fetchall()
+        if retrieval is not None:
+            retrieval.record_distances(extra_rows)
         for row in extra_rows:
             key = (row.filename, row.chunk_index)
             if key in seen_keys:
@@ -1013,28 +1501,77 @@ async def generate_flashcards(
                 len(bounded_code_items),
             )
     llm_prompt = FLASHCARD_PROMPT.format(context=context, n_flashcards=n_flashcards)
-    target_tokens = min(
-        FLASHCARD_LLM_MAX_TOKENS,
-        max(128, n_flashcards * FLASHCARD_MAX_TOKENS_PER_CARD),
+    target_tokens = _target_tokens(n_flashcards)
+
+    retrieval_s = time.perf_counter() - retrieval_started
+    retrieval_stats = {
+        "embed_calls": retrieval.embed_calls if retrieval is not None else 0,
+        "distances_known": len(retrieval.distances) if retrieval is not None else 0,
+    }
+    if retrieval_stats["embed_calls"] > 1:
+        print(f"[Retrieval] query embedded {retrieval_stats['embed_calls']} times in one request")
+
+    source_files: list[dict] = []
+    if session_id is not None:
+        fallback_filenames = [
+            source.get("filename")
+            for source in sources
+            if isinstance(source.get("filename"), str)
+        ]
+        source_files = await _fetch_source_files(
+            db=db,
+            session_id=session_id,
+            file_ids=file_ids,
+            fallback_filenames=fallback_filenames,
+        )
+
+    return _GenerationPlan(
+        prompt=prompt,
+        session_id=session_id,
+        sources=sources,
+        packed_items=bounded_row_items,
+        source_files=source_files,
+        n_flashcards=n_flashcards,
+        llm_prompt=llm_prompt,
+        target_tokens=target_tokens,
+        retrieval_s=retrieval_s,
+        retrieval_stats=retrieval_stats,
     )
 
-    model_used: str | None = None
+
+_GENERATION_TIMEOUT_DETAIL = (
+    "Flashcard generation timed out. "
+    "Try fewer files or a smaller selection."
+)
+
+
+async def _complete(
+    llm_prompt: str,
+    target_tokens: int,
+    *,
+    n_flashcards: int = 0,
+    reject_when_full: bool = True,
+) -> tuple[str, str]:
+    """One blocking LLM completion; returns (content, model_used).
+
+    Waits for a scheduler slot first (see services/llm_scheduler.py); the
+    generation timeout only starts once the slot is held. ``n_flashcards``
+    is the deck size the slot is prioritized by.
+    """
+    async with llm_slot(LLM_BACKEND, n_flashcards, reject_when_full=reject_when_full):
+        return await _complete_now(llm_prompt, target_tokens)
+
+
+async def _complete_now(llm_prompt: str, target_tokens: int) -> tuple[str, str]:
     try:
         if USE_OPENROUTER:
-            content, model_used = await wait_for(
-                run_in_threadpool(
-                    _openrouter_chat,
-                    llm_prompt,
-                    target_tokens,
-                ),
+            return await wait_for(
+                _openrouter_chat(llm_prompt, target_tokens),
                 timeout=FLASHCARD_LLM_TIMEOUT_SECONDS,
             )
-        else:
-            import ollama  # imported lazily: only the ollama backend needs it
-
+        with track_ollama_call("chat"):
             resp = await wait_for(
-                run_in_threadpool(
-                    ollama.chat,
+                get_ollama_async_client().chat(
                     model=FLASHCARD_LLM_MODEL,
                     messages=[{"role": "user", "content": llm_prompt}],
                     options={
@@ -1045,20 +1582,157 @@ async def generate_flashcards(
                 ),
                 timeout=FLASHCARD_LLM_TIMEOUT_SECONDS,
             )
-            content = resp["message"]["content"]
-            model_used = FLASHCARD_LLM_MODEL
+        return resp["message"]["content"], FLASHCARD_LLM_MODEL
     except AsyncTimeoutError as exc:
-        raise HTTPException(
-            status_code=504,
-            detail=(
-                "Flashcard generation timed out. "
-                "Try fewer files or a smaller selection."
-            ),
-        ) from exc
+        raise HTTPException(status_code=504, detail=_GENERATION_TIMEOUT_DETAIL) from exc
 
-    flashcards = None
-    saved_count = 0
-    active_deck: FlashcardDecks | None = None
+
+def _target_tokens(n_flashcards: int) -> int:
+    """Completion token budget for a deck of ``n_flashcards``."""
+    return min(
+        FLASHCARD_LLM_MAX_TOKENS,
+        max(128, n_flashcards * FLASHCARD_MAX_TOKENS_PER_CARD),
+    )
+
+
+async def _complete_sharded(
+    plan: _GenerationPlan, shards: list[Shard], *, reject_when_full: bool = True
+) -> tuple[str, str | None, list[dict]]:
+    """Map-reduce generation: one completion per shard, cards merged in shard order.
+
+    Returns (raw outputs joined per shard, model_used, merged cards with global
+    source tags). Any shard failing cancels the others and fails the whole
+    request with that shard's error, like a single call.
+
+    The request is admitted once: the first shard takes its slot under the
+    caller's ``reject_when_full``, and only then do the other shards queue,
+    exempt from 429/503, so finished shards are never thrown away because a
+    later one was turned away.
+    """
+    semaphore = asyncio.Semaphore(FLASHCARD_SHARD_CONCURRENCY)
+    admitted = asyncio.Event()
+
+    async def run(shard: Shard, *, first: bool) -> tuple[str, str]:
+        llm_prompt = FLASHCARD_PROMPT.format(
+            context=shard.context, n_flashcards=shard.n_flashcards
+        )
+        target_tokens = _target_tokens(shard.n_flashcards)
+        if first:
+            async with semaphore, llm_slot(
+                LLM_BACKEND, plan.n_flashcards, reject_when_full=reject_when_full
+            ):
+                admitted.set()
+                return await _complete_now(llm_prompt, target_tokens)
+        await admitted.wait()
+        async with semaphore:
+            return await _complete(
+                llm_prompt,
+                target_tokens,
+                n_flashcards=plan.n_flashcards,
+                reject_when_full=False,
+            )
+
+    # A TaskGroup cancels the sibling shards as soon as one fails, so they stop
+    # holding LLM scheduler slots for a request that has already failed.
+    try:
+        async with asyncio.TaskGroup() as group:
+            tasks = [
+                group.create_task(run(shard, first=index == 0))
+                for index, shard in enumerate(shards)
+            ]
+    except ExceptionGroup as exc:
+        raise exc.exceptions[0] from None
+    results = [task.result() for task in tasks]
+    print(
+        f"[Generation] map-reduce over {len(shards)} shards "
+        f"(concurrency {FLASHCARD_SHARD_CONCURRENCY})"
+    )
+    cards = merge_shard_cards(shards, [_parse_flashcards(content) for content, _ in results])
+    raw = "\n\n".join(
+        f"--- shard {index} ---\n{content}" for index, (content, _) in enumerate(results)
+    )
+    model_used = next((model for _, model in results if model), None)
+    return raw, model_used, cards
+
+
+def _generation_shards(plan: _GenerationPlan) -> list[Shard] | None:
+    """Shards for map-reduce mode, or None when one completion should do."""
+    if FLASHCARD_GENERATION_MODE != "map_reduce" or plan.n_flashcards == 0:
+        return None
+    shards = build_shards(
+        plan.packed_items,
+        n_flashcards=plan.n_flashcards,
+        max_chars=FLASHCARD_SHARD_MAX_CHARS,
+    )
+    return shards if len(shards) > 1 else None
+
+
+def _generation_cache_key(plan: _GenerationPlan) -> str | None:
+    """Cache key for the plan's completion, or None when it isn't reproducible."""
+    if FLASHCARD_LLM_TEMPERATURE != 0 or plan.n_flashcards == 0:
+        return None
+    mode = FLASHCARD_GENERATION_MODE
+    if mode == "map_reduce":
+        mode = f"{mode}:{FLASHCARD_SHARD_MAX_CHARS}"
+    return generation_cache_key(
+        plan.llm_prompt,
+        backend=LLM_BACKEND,
+        model=OPENROUTER_MODEL if USE_OPENROUTER else FLASHCARD_LLM_MODEL,
+        temperature=FLASHCARD_LLM_TEMPERATURE,
+        max_tokens=plan.target_tokens,
+        mode=mode,
+    )
+
+
+async def _ollama_chat_stream(
+    prompt: str,
+    target_tokens: int,
+) -> AsyncIterator[tuple[str, str | None]]:
+    with track_ollama_call("chat_stream"):
+        stream = await get_ollama_async_client().chat(
+            model=FLASHCARD_LLM_MODEL,
+            messages=[{"role": "user", "content": prompt}],
+            options={
+                "num_predict": target_tokens,
+                "temperature": FLASHCARD_LLM_TEMPERATURE,
+            },
+            keep_alive=FLASHCARD_LLM_KEEP_ALIVE,
+            stream=True,
+        )
+        async for chunk in stream:
+            yield chunk["message"]["content"] or "", FLASHCARD_LLM_MODEL
+
+
+async def _stream_completion(
+    plan: _GenerationPlan,
+) -> AsyncIterator[tuple[str, str | None]]:
+    """Stream (text delta, model) pairs; the whole stream shares one deadline.
+
+    The stream holds a scheduler slot throughout; the deadline starts once
+    the slot is acquired.
+    """
+    async with llm_slot(LLM_BACKEND, plan.n_flashcards):
+        if USE_OPENROUTER:
+            stream = _openrouter_chat_stream(plan.llm_prompt, plan.target_tokens)
+        else:
+            stream = _ollama_chat_stream(plan.llm_prompt, plan.target_tokens)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + FLASHCARD_LLM_TIMEOUT_SECONDS
+        try:
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise AsyncTimeoutError()
+                try:
+                    item = await wait_for(stream.__anext__(), timeout=remaining)
+                except StopAsyncIteration:
+                    return
+                yield item
+        finally:
+            await stream.aclose()
+
+
+def _parse_completion(content: str) -> list[dict]:
     parsed = _parse_flashcards(content)
     if not parsed and content.strip() and content.strip().upper() != "NONE":
         parsed = [
@@ -1068,115 +1742,432 @@ async def generate_flashcards(
                 "source_tag": None,
             }
         ]
+    return parsed
 
-    source_chunks = [
-        {
-            "tag": source.get("tag"),
-            "filename": source.get("filename"),
-            "chunk_index": source.get("chunk_index"),
-        }
-        for source in sources
-    ]
-    fallback_filenames = [
-        source.get("filename")
-        for source in sources
-        if isinstance(source.get("filename"), str)
-    ]
-    source_files: list[dict] = []
-    if session_id is not None:
-        source_files = _fetch_source_files(
+
+def _attach_source(card: dict, by_tag: dict) -> dict:
+    """Normalize a card's source_tag to an int and attach its source entry."""
+    tag = card.get("source_tag")
+    if isinstance(tag, str):
+        match = re.search(r"\d+", tag)
+        tag = int(match.group(0)) if match else None
+        card["source_tag"] = tag
+    if tag in by_tag:
+        card["source"] = by_tag[tag]
+    return card
+
+
+def _card_row(card: dict, by_tag: dict) -> dict[str, str] | None:
+    question = card.get("question")
+    answer = card.get("answer")
+    if not question or not answer:
+        return None
+    tag = card.get("source_tag")
+    filename = None
+    if tag in by_tag:
+        filename = by_tag[tag].get("filename")
+    return {
+        "filename": filename or "unknown",
+        "question": question,
+        "answer": answer,
+    }
+
+
+def _deck_payload(deck: FlashcardDecks | None) -> dict | None:
+    if deck is None:
+        return None
+    return {
+        "id": deck.id,
+        "session_id": deck.session_id,
+        "title": deck.title,
+        "source_label": deck.source_label,
+        "card_count": deck.card_count,
+        "note_count": deck.note_count,
+        "created_at": deck.created_at.isoformat() if deck.created_at else None,
+    }
+
+
+async def _finalize_generation(
+    plan: _GenerationPlan,
+    content: str,
+    model_used: str | None,
+    *,
+    generation_s: float,
+    replace: bool,
+    persist: bool,
+    db: AsyncSession,
+    parsed: list[dict] | None = None,
+    cached: bool = False,
+) -> dict:
+    """Parse the completion, persist the deck and build the response payload.
+
+    ``parsed`` skips parsing when the cards are already known (map-reduce,
+    cache hits). ``cached`` marks a response served from the generation cache.
+    """
+    saved_count = 0
+    active_deck: FlashcardDecks | None = None
+    if parsed is None:
+        parsed = _parse_completion(content)
+
+    by_tag = {s["tag"]: s for s in plan.sources}
+    for card in parsed:
+        _attach_source(card, by_tag)
+    if plan.session_id is not None and persist:
+        row_payloads = [row for row in (_card_row(card, by_tag) for card in parsed) if row]
+
+        active_deck = await _persist_flashcard_deck(
             db=db,
-            session_id=session_id,
-            file_ids=file_ids,
-            fallback_filenames=fallback_filenames,
+            session_id=plan.session_id,
+            source_files=plan.source_files,
+            source_chunks=plan.source_chunks,
+            card_count=len(row_payloads),
         )
 
-    # Attach file source info when source_tag is provided
-    if isinstance(parsed, list):
-        by_tag = {s["tag"]: s for s in sources}
-        for card in parsed:
-            tag = card.get("source_tag")
-            if isinstance(tag, str):
-                match = re.search(r"\d+", tag)
-                tag = int(match.group(0)) if match else None
-                card["source_tag"] = tag
-            if tag in by_tag:
-                card["source"] = by_tag[tag]
-        if session_id is not None and persist:
-            row_payloads: list[dict[str, str]] = []
-            for card in parsed:
-                question = card.get("question")
-                answer = card.get("answer")
-                if not question or not answer:
-                    continue
-                tag = card.get("source_tag")
-                filename = None
-                if tag in by_tag:
-                    filename = by_tag[tag].get("filename")
-                if not filename:
-                    filename = "unknown"
-                row_payloads.append(
-                    {
-                        "filename": filename,
-                        "question": question,
-                        "answer": answer,
-                    }
-                )
-
-            active_deck = _persist_flashcard_deck(
-                db=db,
-                session_id=session_id,
-                source_files=source_files,
-                source_chunks=source_chunks,
-                card_count=len(row_payloads),
+        if replace:
+            await db.execute(
+                sql_text("DELETE FROM flashcards WHERE deck_id = :deck_id"),
+                {"deck_id": active_deck.id},
             )
 
-            if replace:
-                db.execute(
-                    sql_text("DELETE FROM flashcards WHERE deck_id = :deck_id"),
-                    {"deck_id": active_deck.id},
-                )
-
-            if row_payloads:
-                db.add_all(
-                    [
-                        Flashcard(
-                            session_id=session_id,
-                            deck_id=active_deck.id,
-                            filename=item["filename"],
-                            question=item["question"],
-                            answer=item["answer"],
-                        )
-                        for item in row_payloads
-                    ]
-                )
-                db.commit()
-                saved_count = len(row_payloads)
-    flashcards = parsed if parsed else None
-
-    deck_payload = None
-    if active_deck is not None:
-        deck_payload = {
-            "id": active_deck.id,
-            "session_id": active_deck.session_id,
-            "title": active_deck.title,
-            "source_label": active_deck.source_label,
-            "card_count": active_deck.card_count,
-            "note_count": active_deck.note_count,
-            "created_at": active_deck.created_at.isoformat() if active_deck.created_at else None,
-        }
+        if row_payloads:
+            db.add_all(
+                [
+                    Flashcard(
+                        session_id=plan.session_id,
+                        deck_id=active_deck.id,
+                        filename=item["filename"],
+                        question=item["question"],
+                        answer=item["answer"],
+                    )
+                    for item in row_payloads
+                ]
+            )
+            await db.commit()
+            saved_count = len(row_payloads)
 
     return {
-        "prompt": prompt,
-        "flashcards": flashcards,
-        "sources": sources,
+        "prompt": plan.prompt,
+        "flashcards": parsed if parsed else None,
+        "sources": plan.sources,
         "raw": content,
         "saved_count": saved_count,
         "model_used": model_used,
-        "deck": deck_payload,
+        "deck": _deck_payload(active_deck),
+        "cached": cached,
+        "timings": {
+            "retrieval_s": round(plan.retrieval_s, 4),
+            "generation_s": round(generation_s, 4),
+        },
+        "retrieval_stats": plan.retrieval_stats,
+    }
+
+
+async def generate_flashcards(
+    prompt: str | None,
+    k: int | None,
+    session_id: UUID | None,
+    file_ids: list[int] | None,
+    replace: bool,
+    flashcard_amount: str | None,
+    db: AsyncSession,
+    persist: bool = True,
+    include_context: bool = False,
+    reject_when_full: bool = True,
+):
+    """
+    Retrieve chunks via hybrid BM25 + pgvector and ask llm to generate flashcards.
+
+    When ``persist`` is False the generated deck/flashcards are not written to the
+    database (used by the benchmark harness so runs don't pollute the DB). The
+    full result — flashcards, sources, raw output, model_used — is still returned.
+
+    When ``include_context`` is True each ``sources`` entry also carries the raw
+    chunk ``content``. Off by default so the production API payload stays lean;
+    the benchmark harness turns it on so LLM-judge scorers (e.g. RAGAS
+    faithfulness) can see the context the cards were generated from.
+
+    ``reject_when_full=False`` waits in the LLM queue however long it takes
+    instead of failing with 429/503 (used by generation jobs).
+    """
+    plan = await _prepare_generation(
+        prompt=prompt,
+        k=k,
+        session_id=session_id,
+        file_ids=file_ids,
+        flashcard_amount=flashcard_amount,
+        db=db,
+        include_context=include_context,
+    )
+    generation_started = time.perf_counter()
+    cache_key = _generation_cache_key(plan)
+    hit = get_cached_generation(cache_key) if cache_key is not None else None
+    if hit is not None:
+        content, model_used, parsed = hit.content, hit.model_used, hit.cards
+    else:
+        shards = _generation_shards(plan)
+        if shards is not None:
+            content, model_used, parsed = await _complete_sharded(
+                plan, shards, reject_when_full=reject_when_full
+            )
+        else:
+            content, model_used = await _complete(
+                plan.llm_prompt,
+                plan.target_tokens,
+                n_flashcards=plan.n_flashcards,
+                reject_when_full=reject_when_full,
+            )
+            parsed = _parse_completion(content)
+        if cache_key is not None and parsed:
+            store_generation(
+                cache_key,
+                plan.session_id,
+                content=content,
+                model_used=model_used,
+                cards=parsed,
+            )
+    return await _finalize_generation(
+        plan,
+        content,
+        model_used,
+        generation_s=time.perf_counter() - generation_started,
+        replace=replace,
+        persist=persist,
+        db=db,
+        parsed=parsed,
+        cached=hit is not None,
+    )
+
+
+async def stream_flashcards(
+    prompt: str | None,
+    k: int | None,
+    session_id: UUID | None,
+    file_ids: list[int] | None,
+    flashcard_amount: str | None,
+    db: AsyncSession,
+    persist: bool = True,
+) -> AsyncIterator[dict]:
+    """Generate flashcards like ``generate_flashcards``, yielding progress events.
+
+    Events, in order: ``retrieved`` (sources and target card count), ``deck``
+    (the deck row, created empty up front when persisting), one ``card`` per
+    flashcard as soon as the LLM finishes writing it — each card is committed
+    before it is yielded — then ``done`` with the final counts and timings.
+    Failures raise; if no card was saved the empty deck is removed first.
+    """
+    plan = await _prepare_generation(
+        prompt=prompt,
+        k=k,
+        session_id=session_id,
+        file_ids=file_ids,
+        flashcard_amount=flashcard_amount,
+        db=db,
+        include_context=False,
+    )
+    yield {
+        "status": "retrieved",
+        "n_flashcards": plan.n_flashcards,
+        "sources": plan.sources,
+        "timings": {"retrieval_s": round(plan.retrieval_s, 4)},
+        "retrieval_stats": plan.retrieval_stats,
     }
 
+    deck: FlashcardDecks | None = None
+    if plan.session_id is not None and persist:
+        deck = await _persist_flashcard_deck(
+            db=db,
+            session_id=plan.session_id,
+            source_files=plan.source_files,
+            source_chunks=plan.source_chunks,
+            card_count=0,
+        )
+        yield {"status": "deck", "deck": _deck_payload(deck)}
+
+    by_tag = {s["tag"]: s for s in plan.sources}
+    emitted = 0
+    saved_count = 0
+
+    async def emit(card: dict) -> dict:
+        nonlocal emitted, saved_count
+        _attach_source(card, by_tag)
+        row = _card_row(card, by_tag) if deck is not None else None
+        if row is not None:
+            db.add(
+                Flashcard(
+                    session_id=plan.session_id,
+                    deck_id=deck.id,
+                    filename=row["filename"],
+                    question=row["question"],
+                    answer=row["answer"],
+                )
+            )
+            deck.card_count = saved_count + 1
+            await db.commit()
+            saved_count += 1
+        event = {"status": "card", "index": emitted, "card": card}
+        emitted += 1
+        return event
+
+    parser = _FlashcardStreamParser()
+    pieces: list[str] = []
+    model_used: str | None = None
+    first_card_s: float | None = None
+    generation_started = time.perf_counter()
+    try:
+        try:
+            async for text, model in _stream_completion(plan):
+                model_used = model or model_used
+                pieces.append(text)
+                for card in parser.feed(text):
+                    if first_card_s is None:
+                        first_card_s = time.perf_counter() - generation_started
+                    yield await emit(card)
+        except AsyncTimeoutError as exc:
+            raise HTTPException(status_code=504, detail=_GENERATION_TIMEOUT_DETAIL) from exc
+        content = "".join(pieces)
+        remaining = parser.finish()
+        if not emitted and not remaining:
+            # Not in the Q/A/Source format (JSON, "Question — Answer" lines…):
+            # parse the whole completion the way the blocking endpoint does.
+            remaining = _parse_completion(content)
+        for card in remaining:
+            yield await emit(card)
+    except BaseException:
+        if deck is not None and saved_count == 0:
+            try:
+                await db.rollback()
+                await db.delete(deck)
+                await db.commit()
+            except Exception:
+                pass
+        raise
+
+    yield {
+        "status": "done",
+        "card_count": emitted,
+        "saved_count": saved_count,
+        "model_used": model_used or (OPENROUTER_MODEL if USE_OPENROUTER else FLASHCARD_LLM_MODEL),
+        "deck": _deck_payload(deck),
+        "raw": content,
+        "timings": {
+            "retrieval_s": round(plan.retrieval_s, 4),
+            "first_card_s": round(first_card_s, 4) if first_card_s is not None else None,
+            "generation_s": round(time.perf_counter() - generation_started, 4),
+        },
+    }
+
+
+def stream_flashcard_generation(
+    *,
+    prompt: str | None,
+    k: int | None,
+    session_id: UUID | None,
+    file_ids: list[int] | None,
+    flashcard_amount: str | None,
+) -> StreamingResponse:
+    """SSE wrapper around ``stream_flashcards``, framed like the upload stream."""
+    _require_prompt_or_session(prompt, session_id)
+
+    async def event_stream():
+        # The stream outlives the request's dependencies, so it owns its session.
+        db = AsyncSessionLocal()
+        try:
+            async for event in stream_flashcards(
+                prompt=prompt,
+                k=k,
+                session_id=session_id,
+                file_ids=file_ids,
+                flashcard_amount=flashcard_amount,
+                db=db,
+            ):
+                yield f"data: {json.dumps(event, default=str)}\n\n"
+            yield "data: [DONE]\n\n"
+        except HTTPException as exc:
+            payload = {"status": "error", "status_code": exc.status_code, "detail": exc.detail}
+            yield f"data: {json.dumps(payload, default=str)}\n\n"
+        except Exception:
+            traceback.print_exc()
+            payload = {
+                "status": "error",
+                "status_code": 500,
+                "detail": "Flashcard generation failed unexpectedly.",
+            }
+            yield f"data: {json.dumps(payload)}\n\n"
+        finally:
+            await db.close()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",
+        },
+    )
+
+
+FLASHCARD_GENERATION_JOB = "flashcards.generate"
+
+
+async def _run_generation_job(payload: dict) -> dict:
+    """Job handler: run ``generate_flashcards`` with its own DB session.
+
+    A job was already accepted, so it waits in the LLM queue for its turn
+    instead of being turned away when the queue is full or slow.
+    """
+    session_id = payload.get("session_id")
+    async with AsyncSessionLocal() as db:
+        return await generate_flashcards(
+            prompt=payload.get("prompt"),
+            k=payload.get("k"),
+            session_id=UUID(session_id) if session_id else None,
+            file_ids=payload.get("file_ids"),
+            replace=bool(payload.get("replace")),
+            flashcard_amount=payload.get("flashcard_amount"),
+            db=db,
+            reject_when_full=False,
+        )
+
+
+register_job_handler(FLASHCARD_GENERATION_JOB, _run_generation_job)
+
+
+async def enqueue_flashcard_generation(
+    *,
+    prompt: str | None,
+    k: int | None,
+    session_id: UUID | None,
+    file_ids: list[int] | None,
+    replace: bool,
+    flashcard_amount: str | None,
+    db: AsyncSession,
+) -> dict:
+    """Queue a generation job; the result is read back with ``get_generation_job``."""
+    _require_prompt_or_session(prompt, session_id)
+    if session_id is not None and await db.get(Sessions, session_id) is None:
+        raise HTTPException(status_code=404, detail="session_id not found")
+    job = await enqueue_job(
+        db,
+        FLASHCARD_GENERATION_JOB,
+        {
+            "prompt": prompt,
+            "k": k,
+            "session_id": session_id,
+            "file_ids": file_ids,
+            "replace": replace,
+            "flashcard_amount": flashcard_amount,
+        },
+        session_id=session_id,
+    )
+    return job_payload(job, position=await queue_position(db, job))
+
 
+async def get_generation_job(job_id: UUID, db: AsyncSession) -> dict:
+    job = await get_job(db, job_id)
+    if job is None or job.kind != FLASHCARD_GENERATION_JOB:
+        raise HTTPException(status_code=404, detail="job not found")
+    return job_payload(job, position=await queue_position(db, job))
 
 
 def get_flashcards(session_id: UUID, deck_id: int | None, db: Session):
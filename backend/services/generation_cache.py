@@ -0,0 +1,106 @@
+import copy
+import hashlib
+import os
+import threading
+from dataclasses import dataclass
+from uuid import UUID
+
+from utils.lru import TTLCache
+
+# Per-worker cache of finished generations. The key is a hash of the final LLM
+# prompt plus everything else that decides the completion (backend, model,
+# temperature, token budget, generation mode), and the prompt embeds every
+# packed chunk's filename, index and text - so a changed chunk changes the key
+# and can never be served a stale deck. Callers only use it for deterministic
+# (temperature 0) settings, where a rerun would produce the same cards anyway.
+# Entries of a session are also dropped whenever its chunks are rewritten, so
+# superseded decks don't sit in the LRU until they age out.
+FLASHCARD_GENERATION_CACHE_SIZE = int(os.getenv("FLASHCARD_GENERATION_CACHE_SIZE", "256"))
+FLASHCARD_GENERATION_CACHE_TTL_SECONDS = float(
+    os.getenv("FLASHCARD_GENERATION_CACHE_TTL_SECONDS", "3600")
+)
+
+
+@dataclass
+class CachedGeneration:
+    content: str
+    model_used: str | None
+    # Parsed cards (question, answer, source_tag) before sources are attached.
+    cards: list[dict]
+
+
+_cache = TTLCache(FLASHCARD_GENERATION_CACHE_SIZE, FLASHCARD_GENERATION_CACHE_TTL_SECONDS)
+_session_keys: dict[UUID, set[str]] = {}
+_session_keys_lock = threading.Lock()
+_invalidations = 0
+
+
+def generation_cache_key(
+    llm_prompt: str,
+    *,
+    backend: str,
+    model: str,
+    temperature: float,
+    max_tokens: int,
+    mode: str,
+) -> str:
+    raw = "\x1f".join(
+        [backend, model, repr(float(temperature)), str(max_tokens), mode, llm_prompt]
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def get_cached_generation(key: str) -> CachedGeneration | None:
+    """Return a copy of the cached generation, safe for the caller to mutate."""
+    entry = _cache.get(key)
+    if entry is None:
+        return None
+    return copy.deepcopy(entry)
+
+
+def store_generation(
+    key: str,
+    session_id: UUID | None,
+    *,
+    content: str,
+    model_used: str | None,
+    cards: list[dict],
+) -> None:
+    entry = CachedGeneration(
+        content=content,
+        model_used=model_used,
+        cards=[
+            {
+                "question": card.get("question"),
+                "answer": card.get("answer"),
+                "source_tag": card.get("source_tag"),
+            }
+            for card in cards
+        ],
+    )
+    _cache.set(key, entry)
+    if session_id is None:
+        return
+    with _session_keys_lock:
+        keys = _session_keys.setdefault(session_id, set())
+        keys.add(key)
+        if len(keys) > max(1, FLASHCARD_GENERATION_CACHE_SIZE):
+            # Forget keys the LRU already evicted.
+            _session_keys[session_id] = {k for k in keys if k in _cache}
+
+
+def invalidate_session_generations(session_id: UUID) -> None:
+    """Drop cached generations of a session whose chunks just changed."""
+    global _invalidations
+    with _session_keys_lock:
+        keys = _session_keys.pop(session_id, set())
+        _invalidations += 1
+    for key in keys:
+        _cache.pop(key)
+
+
+def generation_cache_stats() -> dict:
+    with _session_keys_lock:
+        sessions = len(_session_keys)
+        invalidations = _invalidations
+    return {**_cache.stats(), "sessions": sessions, "invalidations": invalidations}
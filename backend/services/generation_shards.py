@@ -0,0 +1,144 @@
+import math
+import re
+from dataclasses import dataclass, field
+
+from utils.obsidian import format_context_content_for_llm, is_code_block_content
+
+# Map-reduce generation: split the packed context into shards that each get
+# their own LLM call, then merge the cards. Chunks are grouped by file and kept
+# in chunk order, so a shard sees whole notes (or runs of adjacent sections of
+# one note) rather than an interleaving of unrelated chunks. Each shard numbers
+# its context 0..n-1 like a normal prompt; cards are mapped back to the global
+# source tags afterwards.
+
+
+@dataclass
+class Shard:
+    # Global source tag of each local context entry, by local index.
+    tags: list[int] = field(default_factory=list)
+    lines: list[str] = field(default_factory=list)
+    chars: int = 0
+    code_items: int = 0
+    n_flashcards: int = 0
+
+    @property
+    def context(self) -> str:
+        return "\n\n".join(self.lines)
+
+
+def build_shards(
+    items: list[tuple[str, int, str]],
+    *,
+    n_flashcards: int,
+    max_chars: int,
+) -> list[Shard]:
+    """Pack (filename, chunk_index, content) items into file-local shards.
+
+    ``items`` are in source-tag order (item i has tag i). Files are taken in
+    order of first appearance; a file that doesn't fit in the current shard
+    starts a new one, and a file bigger than ``max_chars`` spills over several.
+    The deck's ``n_flashcards`` is split by context size (see
+    ``split_card_budget``), with every shard getting at least one card and at
+    least one per code chunk it holds.
+    """
+    by_file: dict[str, list[tuple[int, int, str]]] = {}
+    for tag, (filename, chunk_index, content) in enumerate(items):
+        by_file.setdefault(filename, []).append((chunk_index, tag, content))
+
+    shards: list[Shard] = []
+    current = Shard()
+    for filename, entries in by_file.items():
+        entries.sort()
+        prepared = [
+            (tag, format_context_content_for_llm(content), chunk_index, is_code_block_content(content))
+            for chunk_index, tag, content in entries
+        ]
+        file_chars = sum(len(formatted) for _, formatted, _, _ in prepared)
+        if current.lines and current.chars + file_chars > max_chars:
+            shards.append(current)
+            current = Shard()
+        for tag, formatted, chunk_index, is_code in prepared:
+            line = f"[{len(current.lines)}] {filename} (chunk {chunk_index}): {formatted}"
+            if current.lines and current.chars + len(line) + 2 > max_chars:
+                shards.append(current)
+                current = Shard()
+                line = f"[0] {filename} (chunk {chunk_index}): {formatted}"
+            current.tags.append(tag)
+            current.lines.append(line)
+            current.chars += len(line) + 2
+            current.code_items += int(is_code)
+    if current.lines:
+        shards.append(current)
+
+    budgets = split_card_budget(
+        n_flashcards,
+        [shard.chars for shard in shards],
+        [max(1, shard.code_items) for shard in shards],
+    )
+    for shard, budget in zip(shards, budgets):
+        shard.n_flashcards = budget
+    return shards
+
+
+def split_card_budget(total: int, weights: list[int], minimums: list[int]) -> list[int]:
+    """Split ``total`` cards proportionally to ``weights``, summing to ``total``.
+
+    Largest-remainder rounding gives the proportional split; shards below
+    their minimum are then topped up, taking the difference back from the
+    shards with the most to spare. The sum only exceeds ``total`` when the
+    minimums alone do.
+    """
+    if not weights:
+        return []
+    if sum(weights) <= 0:
+        weights = [1] * len(weights)
+    weight_sum = sum(weights)
+    exact = [total * weight / weight_sum for weight in weights]
+    budgets = [math.floor(share) for share in exact]
+    by_remainder = sorted(
+        range(len(weights)), key=lambda i: (exact[i] - budgets[i], -i), reverse=True
+    )
+    for i in by_remainder[: total - sum(budgets)]:
+        budgets[i] += 1
+
+    budgets = [max(budget, minimum) for budget, minimum in zip(budgets, minimums)]
+    excess = sum(budgets) - total
+    while excess > 0:
+        spare = max(range(len(budgets)), key=lambda i: (budgets[i] - minimums[i], -i))
+        if budgets[spare] <= minimums[spare]:
+            break
+        budgets[spare] -= 1
+        excess -= 1
+    return budgets
+
+
+def _question_key(question: str) -> str:
+    return re.sub(r"[\W_]+", " ", question.lower()).strip()
+
+
+def merge_shard_cards(shards: list[Shard], shard_cards: list[list[dict]]) -> list[dict]:
+    """Concatenate per-shard cards in shard order with global source tags.
+
+    Local tags are mapped through the shard's tag table (out-of-range tags
+    become None). Cards whose normalized question was already seen are
+    dropped, so overlapping shards don't produce duplicate cards.
+    """
+    merged: list[dict] = []
+    seen: set[str] = set()
+    for shard, cards in zip(shards, shard_cards):
+        for card in cards:
+            question = card.get("question")
+            if isinstance(question, str):
+                key = _question_key(question)
+                if key and key in seen:
+                    continue
+                seen.add(key)
+            tag = card.get("source_tag")
+            if isinstance(tag, str):
+                match = re.search(r"\d+", tag)
+                tag = int(match.group(0)) if match else None
+            card["source_tag"] = (
+                shard.tags[tag] if isinstance(tag, int) and 0 <= tag < len(shard.tags) else None
+            )
+            merged.append(card)
+    return merged
@@ -0,0 +1,89 @@
+import asyncio
+import importlib.util
+import os
+import threading
+import weakref
+
+import httpx
+
+# Shared, pooled HTTP clients for outbound API calls (OpenRouter embeddings and
+# chat). Reusing one client keeps TCP/TLS connections alive between calls and,
+# with HTTP/2, multiplexes concurrent requests over a single connection.
+#
+# Base URLs come from the callers' settings (e.g. OPENROUTER_BASE_URL), so
+# pointing them at a local stand-in server exercises the same code path.
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "10"))
+HTTP_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("HTTP_KEEPALIVE_EXPIRY_SECONDS", "60"))
+# HTTP/2 needs the `h2` package (httpx[http2]); fall back to HTTP/1.1 without it.
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "1").strip().lower() not in {
+    "0",
+    "false",
+    "no",
+} and importlib.util.find_spec("h2") is not None
+
+_CONNECT_TIMEOUT_SECONDS = 10.0
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_SECONDS,
+    )
+
+
+def _timeout() -> httpx.Timeout:
+    # Callers pass a per-request timeout; this is only the fallback.
+    return httpx.Timeout(60.0, connect=_CONNECT_TIMEOUT_SECONDS)
+
+
+# An AsyncClient's pool is bound to the loop it first ran on, so keep one per
+# loop (the app has one; scripts and tests may spin up several).
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = (
+    weakref.WeakKeyDictionary()
+)
+_sync_client: httpx.Client | None = None
+_sync_lock = threading.Lock()
+
+
+def get_async_client() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            http2=HTTP2_ENABLED,
+            limits=_limits(),
+            timeout=_timeout(),
+        )
+        _async_clients[loop] = client
+    return client
+
+
+def get_sync_client() -> httpx.Client:
+    """Pooled client for callers that run outside the event loop (threads, scripts)."""
+    global _sync_client
+    with _sync_lock:
+        if _sync_client is None or _sync_client.is_closed:
+            _sync_client = httpx.Client(
+                http2=HTTP2_ENABLED,
+                limits=_limits(),
+                timeout=_timeout(),
+            )
+        return _sync_client
+
+
+async def close_http_clients() -> None:
+    """Close pooled clients; called from the app's shutdown hook."""
+    global _sync_client
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    client = _async_clients.pop(loop, None) if loop is not None else None
+    if client is not None:
+        await client.aclose()
+    with _sync_lock:
+        sync_client, _sync_client = _sync_client, None
+    if sync_client is not None:
+        sync_client.close()
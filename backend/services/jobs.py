@@ -0,0 +1,406 @@
+import asyncio
+import json
+import os
+import socket
+import threading
+import traceback
+import uuid
+from datetime import timedelta
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable
+from uuid import UUID
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import Interval, func, literal, or_, select, update
+from sqlalchemy import text as sql_text
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.models import Jobs
+from db.session import AsyncSessionLocal
+
+# Postgres-backed job queue. Producers insert a `jobs` row and return its id;
+# workers claim the oldest runnable row of the kinds they handle with
+# FOR UPDATE SKIP LOCKED, so API processes and `python -m worker` processes can
+# share one table without double-running a job. Each handler gets the job's
+# JSON payload and returns a JSON-able result; a raised exception marks the job
+# failed. Running jobs heartbeat `updated_at`; one whose worker died is
+# reclaimed once the heartbeat is JOB_STALE_SECONDS old, up to JOB_MAX_ATTEMPTS.
+#
+# Request concurrency and job concurrency are decoupled: the API only inserts
+# and reads rows, and each kind gets its own pool of workers per process (its
+# registered concurrency, JOB_WORKER_CONCURRENCY by default), so a backlog of
+# slow jobs of one kind never delays another kind.
+
+# Run workers inside the API process. Turn off when separate worker processes
+# (`python -m worker`) drain the queue.
+JOB_WORKERS_IN_PROCESS = os.getenv("JOB_WORKERS_IN_PROCESS", "1").strip().lower() not in {
+    "0",
+    "false",
+    "no",
+}
+# Default workers per job kind per process.
+JOB_WORKER_CONCURRENCY = max(1, int(os.getenv("JOB_WORKER_CONCURRENCY", "2")))
+# Idle poll interval. Jobs enqueued by this process wake its workers at once.
+JOB_POLL_INTERVAL_SECONDS = float(os.getenv("JOB_POLL_INTERVAL_SECONDS", "1.0"))
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "15"))
+# Must comfortably exceed JOB_HEARTBEAT_SECONDS.
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "120"))
+JOB_MAX_ATTEMPTS = max(1, int(os.getenv("JOB_MAX_ATTEMPTS", "3")))
+# How often a progress subscriber polls the job row for new events.
+JOB_EVENTS_POLL_SECONDS = float(os.getenv("JOB_EVENTS_POLL_SECONDS", "0.5"))
+
+JOB_TERMINAL_STATUSES = frozenset({"succeeded", "failed"})
+
+JobHandler = Callable[[dict], Awaitable[Any]]
+
+_handlers: dict[str, JobHandler] = {}
+_concurrency: dict[str, int] = {}
+# Wake-up event of each running pool, with the kinds it drains.
+_wakeups: dict[asyncio.Event, frozenset[str]] = {}
+_stats_lock = threading.Lock()
+_stats = {"enqueued": 0, "claimed": 0, "succeeded": 0, "failed": 0, "reclaimed": 0, "running": 0}
+
+
+def _bump(counter: str, delta: int = 1) -> None:
+    with _stats_lock:
+        _stats[counter] += delta
+
+
+def register_job_handler(
+    kind: str, handler: JobHandler, *, concurrency: int | None = None
+) -> None:
+    """Register the coroutine that runs jobs of ``kind`` (at import time).
+
+    ``concurrency`` is the size of the kind's worker pool in each process
+    (JOB_WORKER_CONCURRENCY when omitted).
+    """
+    _handlers[kind] = handler
+    _concurrency[kind] = max(1, concurrency or JOB_WORKER_CONCURRENCY)
+
+
+def job_kinds() -> list[str]:
+    return sorted(_handlers)
+
+
+async def enqueue_job(
+    db: AsyncSession,
+    kind: str,
+    payload: dict,
+    *,
+    session_id: UUID | None = None,
+    events: list[dict] | None = None,
+    job_id: UUID | None = None,
+) -> Jobs:
+    """Insert a queued job and commit. ``payload`` and ``events`` must be JSON-able.
+
+    ``events`` seeds the progress log (e.g. with what the producer already
+    decided), so subscribers see them before the worker's own. ``job_id`` lets
+    the producer reference the job from those events.
+    """
+    job = Jobs(
+        id=job_id or uuid.uuid4(),
+        kind=kind,
+        status="queued",
+        session_id=session_id,
+        payload=jsonable_encoder(payload),
+        events=jsonable_encoder(events or []),
+    )
+    db.add(job)
+    await db.commit()
+    _bump("enqueued")
+    for wakeup, kinds in list(_wakeups.items()):
+        if kind in kinds:
+            wakeup.set()
+    return job
+
+
+async def get_job(db: AsyncSession, job_id: UUID) -> Jobs | None:
+    return await db.get(Jobs, job_id, populate_existing=True)
+
+
+async def queue_position(db: AsyncSession, job: Jobs) -> int | None:
+    """Number of queued jobs of the same kind ahead of ``job`` (None unless queued)."""
+    if job.status != "queued":
+        return None
+    ahead = await db.execute(
+        select(func.count())
+        .select_from(Jobs)
+        .where(
+            Jobs.kind == job.kind,
+            Jobs.status == "queued",
+            Jobs.created_at < job.created_at,
+        )
+    )
+    return int(ahead.scalar() or 0)
+
+
+def job_payload(job: Jobs, *, position: int | None = None) -> dict:
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "session_id": job.session_id,
+        "queue_position": position,
+        "attempts": job.attempts,
+        "result": job.result,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+async def _claim_job(db: AsyncSession, kinds: list[str], worker_id: str):
+    stale_before = func.now() - literal(timedelta(seconds=JOB_STALE_SECONDS), Interval())
+    candidate = (
+        select(Jobs.id)
+        .where(
+            Jobs.kind.in_(kinds),
+            or_(
+                Jobs.status == "queued",
+                (Jobs.status == "running") & (Jobs.updated_at < stale_before),
+            ),
+        )
+        .order_by(Jobs.created_at)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    result = await db.execute(
+        update(Jobs)
+        .where(Jobs.id == candidate)
+        .values(
+            status="running",
+            attempts=Jobs.attempts + 1,
+            worker_id=worker_id,
+            started_at=func.now(),
+            updated_at=func.now(),
+        )
+        .returning(Jobs.id, Jobs.kind, Jobs.payload, Jobs.attempts)
+        .execution_options(synchronize_session=False)
+    )
+    row = result.first()
+    await db.commit()
+    return row
+
+
+async def _finish_job(
+    job_id: UUID, *, status: str, result: Any = None, error: str | None = None
+) -> None:
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            update(Jobs)
+            .where(Jobs.id == job_id)
+            .values(
+                status=status,
+                result=jsonable_encoder(result) if result is not None else None,
+                error=error,
+                updated_at=func.now(),
+                finished_at=func.now(),
+            )
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+
+
+async def touch_job(job_id: UUID) -> None:
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            update(Jobs)
+            .where(Jobs.id == job_id, Jobs.status == "running")
+            .values(updated_at=func.now())
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+
+
+async def append_job_event(job_id: UUID, event: dict) -> None:
+    """Append a progress event to the job's log; also counts as a heartbeat."""
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            sql_text(
+                "UPDATE jobs SET events = events || jsonb_build_array(CAST(:event AS jsonb)), "
+                "updated_at = now() WHERE id = :id"
+            ),
+            {"id": job_id, "event": json.dumps(jsonable_encoder(event))},
+        )
+        await db.commit()
+
+
+@dataclass
+class JobProgress:
+    status: str
+    error: str | None
+    # (index in the job's log, event) for events past the subscriber's offset.
+    events: list[tuple[int, dict]]
+
+    @property
+    def finished(self) -> bool:
+        return self.status in JOB_TERMINAL_STATUSES
+
+
+async def watch_job(job_id: UUID, *, after: int = 0) -> AsyncIterator[JobProgress]:
+    """Poll a job and yield its new events until it has finished.
+
+    ``after`` is the number of events the subscriber already has, so a client
+    that reconnects with its last seen index resumes where it left off. Yields
+    once per poll, even with no new events (callers can send keep-alives);
+    the last snapshot has ``finished`` set. Ends immediately if the job is gone.
+    """
+    offset = max(0, after)
+    while True:
+        async with AsyncSessionLocal() as db:
+            row = (
+                await db.execute(
+                    sql_text(
+                        "SELECT status, error, "
+                        "(SELECT coalesce(jsonb_agg(e ORDER BY i), '[]'::jsonb) "
+                        " FROM jsonb_array_elements(events) WITH ORDINALITY AS t(e, i) "
+                        " WHERE i > :after) AS new_events "
+                        "FROM jobs WHERE id = :id"
+                    ).columns(new_events=JSONB()),
+                    {"id": job_id, "after": offset},
+                )
+            ).first()
+        if row is None:
+            return
+        new_events = list(enumerate(row.new_events or [], start=offset))
+        offset += len(new_events)
+        progress = JobProgress(status=row.status, error=row.error, events=new_events)
+        yield progress
+        if progress.finished:
+            return
+        await asyncio.sleep(JOB_EVENTS_POLL_SECONDS)
+
+
+async def _heartbeat(job_id: UUID) -> None:
+    while True:
+        await asyncio.sleep(JOB_HEARTBEAT_SECONDS)
+        try:
+            await touch_job(job_id)
+        except Exception as exc:
+            print(f"[Jobs] heartbeat for {job_id} failed: {exc}")
+
+
+def _error_detail(exc: Exception) -> str:
+    if isinstance(exc, HTTPException):
+        return str(exc.detail)
+    return f"{type(exc).__name__}: {exc}"
+
+
+async def _run_claimed(row) -> None:
+    if row.attempts > JOB_MAX_ATTEMPTS:
+        # Reclaimed from dead workers too often; don't try again.
+        _bump("failed")
+        await _finish_job(row.id, status="failed", error="Job abandoned by its worker too many times.")
+        return
+    if row.attempts > 1:
+        _bump("reclaimed")
+    handler = _handlers.get(row.kind)
+    if handler is None:
+        _bump("failed")
+        await _finish_job(row.id, status="failed", error=f"No handler for job kind {row.kind!r}.")
+        return
+    heartbeat = asyncio.create_task(_heartbeat(row.id))
+    _bump("running")
+    try:
+        result = await handler({**(row.payload or {}), "job_id": str(row.id)})
+    except Exception as exc:
+        if not isinstance(exc, HTTPException):
+            traceback.print_exc()
+        _bump("failed")
+        await _finish_job(row.id, status="failed", error=_error_detail(exc))
+    else:
+        _bump("succeeded")
+        await _finish_job(row.id, status="succeeded", result=result)
+    finally:
+        # On cancellation (shutdown) the row stays running for another
+        # worker to reclaim once its heartbeat goes stale.
+        _bump("running", -1)
+        heartbeat.cancel()
+
+
+async def _worker_loop(worker_id: str, kinds: list[str], wakeup: asyncio.Event) -> None:
+    while True:
+        row = None
+        try:
+            async with AsyncSessionLocal() as db:
+                row = await _claim_job(db, kinds, worker_id)
+        except Exception as exc:
+            print(f"[Jobs] {worker_id} claim failed: {exc}")
+        if row is None:
+            wakeup.clear()
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout=JOB_POLL_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        _bump("claimed")
+        await _run_claimed(row)
+
+
+class JobWorkerPool:
+    """``concurrency`` asyncio workers draining the queue for ``kinds``."""
+
+    def __init__(self, *, kinds: list[str], concurrency: int = JOB_WORKER_CONCURRENCY) -> None:
+        self.concurrency = max(1, concurrency)
+        self.kinds = list(kinds)
+        self._tasks: list[asyncio.Task] = []
+        self._wakeup = asyncio.Event()
+
+    def start(self) -> None:
+        if not self.kinds or self._tasks:
+            return
+        prefix = f"{socket.gethostname()}:{os.getpid()}:{'+'.join(self.kinds)}"
+        _wakeups[self._wakeup] = frozenset(self.kinds)
+        self._tasks = [
+            asyncio.create_task(_worker_loop(f"{prefix}:{index}", self.kinds, self._wakeup))
+            for index in range(self.concurrency)
+        ]
+        print(f"[Jobs] {self.concurrency} workers for {', '.join(self.kinds)}")
+
+    async def stop(self) -> None:
+        _wakeups.pop(self._wakeup, None)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def wait(self) -> None:
+        await asyncio.gather(*self._tasks)
+
+
+def start_job_workers(kinds: list[str] | None = None) -> list[JobWorkerPool]:
+    """Start one pool per job kind (all registered kinds by default)."""
+    pools = [
+        JobWorkerPool(kinds=[kind], concurrency=_concurrency.get(kind, JOB_WORKER_CONCURRENCY))
+        for kind in (kinds or job_kinds())
+    ]
+    for pool in pools:
+        pool.start()
+    return pools
+
+
+async def stop_job_workers(pools: list[JobWorkerPool]) -> None:
+    await asyncio.gather(*(pool.stop() for pool in pools))
+
+
+async def run_job_workers(kinds: list[str] | None = None) -> None:
+    """Run the worker pools until cancelled (standalone worker processes)."""
+    pools = start_job_workers(kinds)
+    try:
+        await asyncio.gather(*(pool.wait() for pool in pools))
+    finally:
+        await stop_job_workers(pools)
+
+
+def job_stats() -> dict:
+    with _stats_lock:
+        counters = dict(_stats)
+    return {
+        "in_process": JOB_WORKERS_IN_PROCESS,
+        "concurrency": {kind: _concurrency[kind] for kind in job_kinds()},
+        **counters,
+    }
@@ -0,0 +1,232 @@
+import math
+import os
+import threading
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from uuid import UUID
+
+from sqlalchemy import text as sql_text
+from sqlalchemy.orm import Session
+
+from services.embedding_service import EMBEDDING_TABLE
+
+# Per-session BM25 keyword index. Term statistics are built when chunks are
+# written (upload / lazy backfill) and kept per file, so a re-upload only
+# re-tokenizes the file that changed and a /llm call scores the whole vault
+# with a postings lookup instead of rebuilding a BM25Retriever from scratch.
+#
+# Scoring mirrors rank_bm25.BM25Okapi (the engine behind BM25Retriever) with
+# the same whitespace tokenizer, so switching over doesn't shift rankings.
+BM25_K1 = 1.5
+BM25_B = 0.75
+BM25_EPSILON = 0.25
+# Indexes are per worker process; cap how many sessions stay resident.
+KEYWORD_INDEX_MAX_SESSIONS = int(os.getenv("KEYWORD_INDEX_MAX_SESSIONS", "64"))
+
+
+def tokenize(text: str) -> list[str]:
+    # Same as BM25Retriever's default_preprocessing_func.
+    return text.split()
+
+
+@dataclass
+class IndexedChunk:
+    files_id: int
+    filename: str
+    chunk_index: int
+    content: str
+    length: int
+    term_freqs: Counter
+
+
+class SessionKeywordIndex:
+    """Incrementally maintained BM25 statistics for one session's chunks."""
+
+    def __init__(self) -> None:
+        self._chunks: dict[tuple[int, int], IndexedChunk] = {}
+        self._file_keys: dict[int, list[tuple[int, int]]] = {}
+        # (chunk count, max embeddings.id) per file, as last seen in the DB.
+        self._fingerprints: dict[int, tuple[int, int]] = {}
+        self._postings: dict[str, dict[tuple[int, int], int]] = {}
+        self._total_length = 0
+        self._average_idf: float | None = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._chunks)
+
+    def fingerprints(self) -> dict[int, tuple[int, int]]:
+        with self._lock:
+            return dict(self._fingerprints)
+
+    def replace_file(
+        self,
+        files_id: int,
+        rows: list[tuple[int, str, int, str]],
+    ) -> None:
+        """Swap in a file's chunks; ``rows`` are (id, filename, chunk_index, content)."""
+        prepared: list[IndexedChunk] = []
+        for _, filename, chunk_index, content in rows:
+            tokens = tokenize(content)
+            prepared.append(
+                IndexedChunk(
+                    files_id=files_id,
+                    filename=filename,
+                    chunk_index=chunk_index,
+                    content=content,
+                    length=len(tokens),
+                    term_freqs=Counter(tokens),
+                )
+            )
+        with self._lock:
+            self._remove_file_locked(files_id)
+            keys: list[tuple[int, int]] = []
+            for chunk in prepared:
+                key = (files_id, chunk.chunk_index)
+                self._chunks[key] = chunk
+                self._total_length += chunk.length
+                for term, freq in chunk.term_freqs.items():
+                    self._postings.setdefault(term, {})[key] = freq
+                keys.append(key)
+            if keys:
+                self._file_keys[files_id] = keys
+                self._fingerprints[files_id] = (len(rows), max(row[0] for row in rows))
+            self._average_idf = None
+
+    def remove_file(self, files_id: int) -> None:
+        with self._lock:
+            self._remove_file_locked(files_id)
+            self._average_idf = None
+
+    def _remove_file_locked(self, files_id: int) -> None:
+        for key in self._file_keys.pop(files_id, []):
+            chunk = self._chunks.pop(key, None)
+            if chunk is None:
+                continue
+            self._total_length -= chunk.length
+            for term in chunk.term_freqs:
+                postings = self._postings.get(term)
+                if postings is None:
+                    continue
+                postings.pop(key, None)
+                if not postings:
+                    del self._postings[term]
+        self._fingerprints.pop(files_id, None)
+
+    def _idf(self, doc_freq: int, corpus_size: int) -> float:
+        return math.log(corpus_size - doc_freq + 0.5) - math.log(doc_freq + 0.5)
+
+    def _average_idf_locked(self, corpus_size: int) -> float:
+        # BM25Okapi floors negative idfs at epsilon * mean idf over the vocabulary.
+        if self._average_idf is None:
+            total = sum(
+                self._idf(len(postings), corpus_size)
+                for postings in self._postings.values()
+            )
+            self._average_idf = total / len(self._postings) if self._postings else 0.0
+        return self._average_idf
+
+    def search(
+        self,
+        query: str,
+        *,
+        limit: int,
+        file_ids: list[int] | None = None,
+    ) -> list[IndexedChunk]:
+        allowed = set(file_ids) if file_ids else None
+        with self._lock:
+            corpus_size = len(self._chunks)
+            if not corpus_size or limit <= 0:
+                return []
+            avgdl = self._total_length / corpus_size
+            floor = BM25_EPSILON * self._average_idf_locked(corpus_size)
+            scores: dict[tuple[int, int], float] = {}
+            for term in tokenize(query):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = self._idf(len(postings), corpus_size)
+                if idf < 0:
+                    idf = floor
+                for key, freq in postings.items():
+                    if allowed is not None and key[0] not in allowed:
+                        continue
+                    length = self._chunks[key].length
+                    denom = freq + BM25_K1 * (1 - BM25_B + BM25_B * length / avgdl)
+                    scores[key] = scores.get(key, 0.0) + idf * freq * (BM25_K1 + 1) / denom
+            ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+            return [self._chunks[key] for key, _ in ranked]
+
+
+_INDEXES: "OrderedDict[UUID, SessionKeywordIndex]" = OrderedDict()
+_INDEXES_LOCK = threading.Lock()
+
+
+def _get_or_create(session_id: UUID) -> SessionKeywordIndex:
+    with _INDEXES_LOCK:
+        index = _INDEXES.get(session_id)
+        if index is None:
+            index = SessionKeywordIndex()
+            _INDEXES[session_id] = index
+            while len(_INDEXES) > KEYWORD_INDEX_MAX_SESSIONS:
+                _INDEXES.popitem(last=False)
+        else:
+            _INDEXES.move_to_end(session_id)
+        return index
+
+
+def index_file_chunks(
+    session_id: UUID,
+    files_id: int,
+    rows: list[tuple[int, str, int, str]],
+) -> None:
+    """Record freshly written chunks for one file (called by the writers)."""
+    _get_or_create(session_id).replace_file(files_id, rows)
+
+
+def invalidate_file(session_id: UUID, files_id: int) -> None:
+    with _INDEXES_LOCK:
+        index = _INDEXES.get(session_id)
+    if index is not None:
+        index.remove_file(files_id)
+
+
+def get_session_index(db: Session, session_id: UUID) -> SessionKeywordIndex:
+    """Return the session's index, reconciled against the embeddings table.
+
+    Other workers may have written chunks this process never saw, so each call
+    compares a per-file (count, max id) fingerprint and reloads only the files
+    that differ.
+    """
+    index = _get_or_create(session_id)
+    rows = db.execute(
+        sql_text(
+            "SELECT files_id, count(*) AS n, max(id) AS max_id "
+            f"FROM {EMBEDDING_TABLE} WHERE session_id = :sid GROUP BY files_id"
+        ),
+        {"sid": session_id},
+    ).fetchall()
+    current = {row.files_id: (int(row.n), int(row.max_id)) for row in rows}
+    known = index.fingerprints()
+
+    for files_id in known.keys() - current.keys():
+        index.remove_file(files_id)
+    stale = [fid for fid, fp in current.items() if known.get(fid) != fp]
+    if stale:
+        chunk_rows = db.execute(
+            sql_text(
+                "SELECT id, files_id, filename, chunk_index, content "
+                f"FROM {EMBEDDING_TABLE} "
+                "WHERE session_id = :sid AND files_id = ANY(:file_ids) "
+                "ORDER BY files_id, chunk_index"
+            ),
+            {"sid": session_id, "file_ids": stale},
+        ).fetchall()
+        by_file: dict[int, list[tuple[int, str, int, str]]] = {fid: [] for fid in stale}
+        for row in chunk_rows:
+            by_file[row.files_id].append(
+                (row.id, row.filename, row.chunk_index, row.content)
+            )
+        for files_id, file_rows in by_file.items():
+            index.replace_file(files_id, file_rows)
+    return index
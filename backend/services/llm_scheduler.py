@@ -0,0 +1,206 @@
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import threading
+import weakref
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator
+
+from fastapi import HTTPException
+
+# Admission control for generation calls. Each LLM backend gets a concurrency
+# cap; callers beyond it wait in a bounded queue, and callers beyond the queue
+# are turned away at once with 429 + Retry-After instead of piling onto the
+# model (one local Ollama model serializes or thrashes under parallel chats).
+# The queue is ordered by a virtual deadline, enqueue time plus
+# LLM_PRIORITY_SECONDS_PER_CARD per requested card, so small decks overtake
+# big ones without starving them. Callers start their generation timeout only
+# once they hold a slot, so time spent queued never counts against it.
+#
+# Caps are per worker process (and event loop); with several API or job
+# worker processes sharing one Ollama host, divide the cap between them.
+LLM_MAX_CONCURRENCY_OLLAMA = max(1, int(os.getenv("LLM_MAX_CONCURRENCY_OLLAMA", "1")))
+LLM_MAX_CONCURRENCY_OPENROUTER = max(1, int(os.getenv("LLM_MAX_CONCURRENCY_OPENROUTER", "8")))
+# Waiting callers per backend; 0 rejects whenever every slot is busy.
+LLM_QUEUE_MAX = max(0, int(os.getenv("LLM_QUEUE_MAX", "16")))
+# Longest a caller waits for a slot before giving up with 503.
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "120"))
+LLM_PRIORITY_SECONDS_PER_CARD = float(os.getenv("LLM_PRIORITY_SECONDS_PER_CARD", "2.0"))
+
+_CONCURRENCY = {
+    "ollama": LLM_MAX_CONCURRENCY_OLLAMA,
+    "openrouter": LLM_MAX_CONCURRENCY_OPENROUTER,
+}
+# Retry-After guess before any call has finished.
+_DEFAULT_HOLD_S = 30.0
+
+
+@dataclass(order=True)
+class _Waiter:
+    deadline: float
+    seq: int
+    future: asyncio.Future = field(compare=False)
+
+
+class LLMScheduler:
+    """Concurrency cap plus bounded priority queue for one backend on one loop."""
+
+    def __init__(self, backend: str, *, concurrency: int, max_queue: int) -> None:
+        self.backend = backend
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self._running = 0
+        # Heap of waiters; cancelled ones stay until popped.
+        self._heap: list[_Waiter] = []
+        self._queued = 0
+        self._seq = itertools.count()
+        self._hold_avg_s: float | None = None
+        self.stats = {
+            "admitted": 0,
+            "queued": 0,
+            "rejected": 0,
+            "queue_timeouts": 0,
+            "wait_s_total": 0.0,
+            "wait_s_max": 0.0,
+        }
+
+    def _retry_after_s(self) -> int:
+        hold_s = self._hold_avg_s or _DEFAULT_HOLD_S
+        return max(1, math.ceil(hold_s * (self._queued + 1) / self.concurrency))
+
+    def _release(self) -> None:
+        # Hand the slot straight to the most urgent live waiter, if any.
+        while self._heap:
+            waiter = heapq.heappop(self._heap)
+            if waiter.future.done():
+                continue
+            self._queued -= 1
+            waiter.future.set_result(None)
+            return
+        self._running -= 1
+
+    def _record_hold(self, held_s: float) -> None:
+        if self._hold_avg_s is None:
+            self._hold_avg_s = held_s
+        else:
+            self._hold_avg_s = 0.8 * self._hold_avg_s + 0.2 * held_s
+
+    @asynccontextmanager
+    async def slot(
+        self, n_flashcards: int = 0, *, reject_when_full: bool = True
+    ) -> AsyncIterator[None]:
+        """Hold one of the backend's slots for the duration of the block.
+
+        Raises 429 when the queue is full and 503 when no slot frees up
+        within LLM_QUEUE_TIMEOUT_SECONDS. Work that was already accepted (a
+        queued job, the later shards of an admitted request) passes
+        ``reject_when_full=False``: it joins the queue even when it is full
+        and waits for its turn without a timeout.
+        """
+        loop = asyncio.get_running_loop()
+        queued_at = loop.time()
+        if self._running < self.concurrency and self._queued == 0:
+            self._running += 1
+        else:
+            if reject_when_full and self._queued >= self.max_queue:
+                self.stats["rejected"] += 1
+                retry_after = self._retry_after_s()
+                raise HTTPException(
+                    status_code=429,
+                    detail=(
+                        f"Flashcard generation is busy ({self._queued} requests queued). "
+                        f"Retry in about {retry_after}s."
+                    ),
+                    headers={"Retry-After": str(retry_after)},
+                )
+            waiter = _Waiter(
+                queued_at + max(0, n_flashcards) * LLM_PRIORITY_SECONDS_PER_CARD,
+                next(self._seq),
+                loop.create_future(),
+            )
+            heapq.heappush(self._heap, waiter)
+            self._queued += 1
+            self.stats["queued"] += 1
+            try:
+                await asyncio.wait_for(
+                    waiter.future,
+                    timeout=LLM_QUEUE_TIMEOUT_SECONDS if reject_when_full else None,
+                )
+            except BaseException as exc:
+                if waiter.future.done() and not waiter.future.cancelled():
+                    # The slot was handed over just as we gave up: pass it on.
+                    self._release()
+                else:
+                    waiter.future.cancel()
+                    self._queued -= 1
+                if isinstance(exc, asyncio.TimeoutError):
+                    self.stats["queue_timeouts"] += 1
+                    raise HTTPException(
+                        status_code=503,
+                        detail="Flashcard generation is overloaded. Try again shortly.",
+                        headers={"Retry-After": str(self._retry_after_s())},
+                    ) from exc
+                raise
+        waited = loop.time() - queued_at
+        self.stats["admitted"] += 1
+        self.stats["wait_s_total"] += waited
+        self.stats["wait_s_max"] = max(self.stats["wait_s_max"], waited)
+        started = loop.time()
+        try:
+            yield
+        finally:
+            self._record_hold(loop.time() - started)
+            self._release()
+
+    def snapshot(self) -> dict:
+        admitted = self.stats["admitted"]
+        return {
+            "concurrency": self.concurrency,
+            "max_queue": self.max_queue,
+            "running": self._running,
+            "waiting": self._queued,
+            **self.stats,
+            "wait_s_avg": (self.stats["wait_s_total"] / admitted) if admitted else 0.0,
+            "hold_s_avg": self._hold_avg_s,
+        }
+
+
+# Futures are bound to the loop they were created on, so keep one set of
+# schedulers per loop (the API and a job worker each run one).
+_schedulers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[str, LLMScheduler]]" = (
+    weakref.WeakKeyDictionary()
+)
+_schedulers_lock = threading.Lock()
+
+
+def get_llm_scheduler(backend: str) -> LLMScheduler:
+    loop = asyncio.get_running_loop()
+    with _schedulers_lock:
+        by_backend = _schedulers.setdefault(loop, {})
+        scheduler = by_backend.get(backend)
+        if scheduler is None:
+            scheduler = LLMScheduler(
+                backend,
+                concurrency=_CONCURRENCY.get(backend, 1),
+                max_queue=LLM_QUEUE_MAX,
+            )
+            by_backend[backend] = scheduler
+    return scheduler
+
+
+def llm_slot(backend: str, n_flashcards: int = 0, *, reject_when_full: bool = True):
+    """``async with llm_slot(backend, n):`` around one generation call."""
+    return get_llm_scheduler(backend).slot(n_flashcards, reject_when_full=reject_when_full)
+
+
+def llm_scheduler_stats() -> dict:
+    with _schedulers_lock:
+        schedulers = [s for by_backend in _schedulers.values() for s in by_backend.values()]
+    return {
+        "queue_timeout_s": LLM_QUEUE_TIMEOUT_SECONDS,
+        "priority_s_per_card": LLM_PRIORITY_SECONDS_PER_CARD,
+        "backends": {s.backend: s.snapshot() for s in schedulers},
+    }
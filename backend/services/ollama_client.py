@@ -0,0 +1,128 @@
+import asyncio
+import os
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+# Shared Ollama clients for embedding and generation. `ollama.Client` wraps a
+# pooled httpx client, so building one per call throws away keep-alive
+# connections; these are created once (at startup via `init_ollama_clients`,
+# or lazily on first use) and reused by every request.
+#
+# `ollama` is imported lazily so prod deployments that only talk to OpenRouter
+# never load it.
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+
+_sync_client = None
+_sync_lock = threading.Lock()
+# AsyncClient connection pools are bound to the loop they first ran on.
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, object]" = (
+    weakref.WeakKeyDictionary()
+)
+
+_stats_lock = threading.Lock()
+_stats: dict[str, dict] = {}
+_health = {"last_ok_at": None, "last_error_at": None, "last_error": None}
+
+
+def get_ollama_client():
+    global _sync_client
+    with _sync_lock:
+        if _sync_client is None:
+            import ollama as _ollama
+
+            _sync_client = _ollama.Client(host=OLLAMA_HOST)
+        return _sync_client
+
+
+def get_ollama_async_client():
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        import ollama as _ollama
+
+        client = _ollama.AsyncClient(host=OLLAMA_HOST)
+        _async_clients[loop] = client
+    return client
+
+
+def init_ollama_clients() -> None:
+    """Create the clients up front so the first request doesn't pay for it."""
+    get_ollama_client()
+    get_ollama_async_client()
+
+
+async def close_ollama_clients() -> None:
+    """Close pooled clients; called from the app's and worker's shutdown hooks.
+
+    Only this loop's async client can be closed here; clients of other loops
+    are dropped with their loop.
+    """
+    global _sync_client
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    client = _async_clients.pop(loop, None) if loop is not None else None
+    if client is not None:
+        # ollama keeps its httpx client on `_client` and has no public close.
+        await client._client.aclose()
+    with _sync_lock:
+        sync_client, _sync_client = _sync_client, None
+    if sync_client is not None:
+        sync_client._client.close()
+
+
+@contextmanager
+def track_ollama_call(operation: str):
+    """Record call count, errors and latency for one Ollama request.
+
+    Catches BaseException so a streaming call that is cancelled or closed
+    mid-stream (CancelledError, GeneratorExit) counts as an error rather than
+    a success.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException as exc:
+        elapsed = time.perf_counter() - started
+        with _stats_lock:
+            entry = _stats.setdefault(operation, _new_entry())
+            entry["calls"] += 1
+            entry["errors"] += 1
+            entry["total_s"] += elapsed
+            _health["last_error_at"] = time.time()
+            _health["last_error"] = f"{operation}: {str(exc) or type(exc).__name__}"
+        raise
+    elapsed = time.perf_counter() - started
+    with _stats_lock:
+        entry = _stats.setdefault(operation, _new_entry())
+        entry["calls"] += 1
+        entry["total_s"] += elapsed
+        entry["last_s"] = elapsed
+        entry["max_s"] = max(entry["max_s"], elapsed)
+        _health["last_ok_at"] = time.time()
+
+
+def _new_entry() -> dict:
+    return {"calls": 0, "errors": 0, "total_s": 0.0, "last_s": None, "max_s": 0.0}
+
+
+def ollama_client_stats() -> dict:
+    with _stats_lock:
+        operations = {}
+        for operation, entry in _stats.items():
+            stats = dict(entry)
+            succeeded = stats["calls"] - stats["errors"]
+            stats["avg_s"] = (stats["total_s"] / stats["calls"]) if stats["calls"] else 0.0
+            stats["succeeded"] = succeeded
+            operations[operation] = stats
+        health = dict(_health)
+    return {
+        "host": OLLAMA_HOST,
+        "sync_client": _sync_client is not None,
+        "async_clients": len(_async_clients),
+        "operations": operations,
+        **health,
+    }
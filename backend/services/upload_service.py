@@ -1,13 +1,31 @@
+import hashlib
 import json
-from typing import List
+import os
+import uuid
+from dataclasses import dataclass
+from typing import AsyncIterator, Awaitable, Callable, List
 from uuid import UUID
 from fastapi import HTTPException, UploadFile
 from fastapi.responses import StreamingResponse
 from langchain_text_splitters import RecursiveCharacterTextSplitter
+from sqlalchemy import delete, select, update
 from sqlalchemy import text as sql_text
-from db.models import Embeddings, Files, Sessions
-from db.session import SessionLocal
-from services.embedding_service import EMBEDDING_TABLE, embed_chunks
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.models import Files, Sessions
+from db.session import AsyncSessionLocal
+from services.embedding_batcher import BatchedFile, EmbeddingBatcher
+from services.embedding_service import EMBEDDING_TABLE
+from services.embedding_writer import write_file_embeddings
+from services.generation_cache import invalidate_session_generations
+from services.jobs import (
+    JOB_EVENTS_POLL_SECONDS,
+    append_job_event,
+    enqueue_job,
+    get_job,
+    register_job_handler,
+    watch_job,
+)
+from services.keyword_index import index_file_chunks, invalidate_file
 from services.obsidian_service import build_obsidian_context, split_text_with_context
 
 
@@ -15,15 +33,394 @@ def _json_dumps(payload: dict) -> str:
     return json.dumps(payload, default=str)
 
 
+def _sha256_hex(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+# Uploads are ingested by the job queue (services/jobs.py): the upload request
+# only stores the notes' bytes in `Files` rows and enqueues one ingestion job,
+# whose worker parses, chunks, embeds (batched) and writes the vectors. Progress
+# events go to the job's log, and the upload's SSE response is a subscription
+# to that log - a client that disconnects can re-attach with
+# GET /upload-files/{job_id}/events, and the ingestion carries on meanwhile.
+# Ingestion can then be scaled with worker processes (`python -m worker`)
+# instead of API processes.
+UPLOAD_INGEST_JOB = "uploads.ingest"
+# Ingestion workers per process, separate from the generation pool.
+UPLOAD_INGEST_CONCURRENCY = max(1, int(os.getenv("UPLOAD_INGEST_CONCURRENCY", "2")))
+# Idle SSE subscribers get a comment line this often so proxies keep them open.
+UPLOAD_EVENTS_KEEPALIVE_SECONDS = 15.0
+
+
+@dataclass
+class _EmbedTarget:
+    file_id: int
+    filename: str
+    content_type: str | None
+    embedding_hash: str | None
+    # Stored note outside the upload, re-embedded because its backlinks moved.
+    reindex: bool = False
+
+
+def _embed_error_event(target: _EmbedTarget, error: BaseException) -> dict:
+    # Notes outside the upload get their own status so clients don't count
+    # them among the uploaded files.
+    if target.reindex:
+        return {
+            "status": "reindex_error",
+            "filename": target.filename,
+            "detail": f"failed to refresh backlinks: {error}",
+        }
+    return {"status": "error", "filename": target.filename, "detail": str(error)}
+
+
+async def _persist_embedded(db: AsyncSession, session_id: UUID, done: BatchedFile) -> dict:
+    """Write one file's finished vectors and return its SSE payload."""
+    target: _EmbedTarget = done.key
+    if done.error is not None:
+        return _embed_error_event(target, done.error)
+    try:
+        # The file's previous chunks (if any) stay searchable until the new
+        # ones replace them in this transaction.
+        await db.execute(
+            sql_text(
+                f"DELETE FROM {EMBEDDING_TABLE} "
+                "WHERE session_id = :sid AND files_id = :fid"
+            ),
+            {"sid": session_id, "fid": target.file_id},
+        )
+        indexed_rows = await write_file_embeddings(
+            db,
+            session_id=session_id,
+            files_id=target.file_id,
+            filename=target.filename,
+            content_type=target.content_type,
+            chunks=done.chunks,
+            vectors=done.result(),
+        )
+        await db.execute(
+            update(Files)
+            .where(Files.id == target.file_id)
+            .values(embedding_hash=target.embedding_hash)
+        )
+        # Commit per file so a retried job only redoes the unfinished files.
+        await db.commit()
+    except Exception as e:
+        try:
+            await db.rollback()
+        except Exception:
+            pass
+        return _embed_error_event(target, e)
+    index_file_chunks(session_id, target.file_id, indexed_rows)
+    invalidate_session_generations(session_id)
+    status = "reindexed" if target.reindex else "embedded"
+    return {"status": status, "filename": target.filename, "file_id": target.file_id}
+
+
+async def _store_uploaded_files(
+    db: AsyncSession,
+    session_id: UUID,
+    prepared_files: list[tuple[str, bytes, str | None]],
+) -> tuple[list[int], list[dict]]:
+    """Upsert one `Files` row per uploaded note and commit.
+
+    Returns the stored file ids in upload order plus the events for files that
+    were not stored (empty ones). Embeddings are left alone: the ingestion job
+    compares each note's embedded text with its ``embedding_hash`` and swaps
+    out chunks only where it moved.
+    """
+    file_ids: list[int] = []
+    events: list[dict] = []
+    for filename, raw_bytes, content_type in prepared_files:
+        if not raw_bytes:
+            events.append({"status": "skipped", "filename": filename, "detail": "empty file"})
+            continue
+        content_hash = _sha256_hex(raw_bytes)
+        existing_result = await db.execute(
+            select(Files)
+            .where(Files.session_id == session_id, Files.filename == filename)
+            .order_by(Files.id.asc())
+        )
+        existing_rows = existing_result.scalars().all()
+        file_row = existing_rows[0] if existing_rows else None
+        duplicate_rows = existing_rows[1:]
+
+        # Keep only one note row per (session_id, filename) and remove stale duplicates.
+        if duplicate_rows:
+            duplicate_ids = [row.id for row in duplicate_rows]
+            await db.execute(
+                sql_text(
+                    f"DELETE FROM {EMBEDDING_TABLE} "
+                    "WHERE session_id = :sid AND files_id = ANY(:file_ids)"
+                ),
+                {"sid": session_id, "file_ids": duplicate_ids},
+            )
+            await db.execute(
+                delete(Files)
+                .where(Files.id.in_(duplicate_ids))
+                .execution_options(synchronize_session=False)
+            )
+            for duplicate_id in duplicate_ids:
+                invalidate_file(session_id, duplicate_id)
+            invalidate_session_generations(session_id)
+
+        if file_row is None:
+            file_row = Files(
+                session_id=session_id,
+                filename=filename,
+                content_type=content_type or "text/plain",
+                raw_content=raw_bytes,
+                content_hash=content_hash,
+            )
+            db.add(file_row)
+        elif file_row.content_hash != content_hash:
+            file_row.content_type = content_type or "text/plain"
+            file_row.raw_content = raw_bytes
+            file_row.content_hash = content_hash
+        await db.flush()
+        file_ids.append(file_row.id)
+    await db.commit()
+    return file_ids, events
+
+
+async def _ingest_files(
+    db: AsyncSession,
+    session_id: UUID,
+    file_ids: list[int],
+    emit: Callable[[dict], Awaitable[None]],
+) -> None:
+    """Embed the stored notes ``file_ids`` and refresh backlinks of the rest.
+
+    Each file's outcome is passed to ``emit`` as it is decided. Safe to rerun:
+    notes whose embedded text matches their ``embedding_hash`` are reported
+    as unchanged instead of re-embedded (the job handler drops the repeat
+    events).
+    """
+    # Need to tune
+    splitter = RecursiveCharacterTextSplitter(chunk_size=512)
+    stored_result = await db.execute(
+        select(
+            Files.id,
+            Files.filename,
+            Files.content_type,
+            Files.raw_content,
+            Files.embedding_hash,
+        )
+        .where(Files.session_id == session_id)
+        .order_by(Files.id.asc())
+    )
+    rows_by_id = {row.id: row for row in stored_result.all()}
+    uploaded = [rows_by_id[file_id] for file_id in file_ids if file_id in rows_by_id]
+    uploaded_ids = {row.id for row in uploaded}
+
+    decoded_files: list[dict] = []
+    decode_errors: dict[int, str] = {}
+    for row in uploaded:
+        try:
+            text = (row.raw_content or b"").decode("utf-8")
+        except UnicodeDecodeError:
+            decode_errors[row.id] = "file is not valid utf-8 text"
+            continue
+        decoded_files.append(
+            {"filename": row.filename, "content_type": row.content_type or "text/plain", "text": text}
+        )
+
+    # Notes already stored in the session but absent from this upload
+    # still link to (and are linked from) the uploaded ones. Include
+    # them so baked-in backlinks reflect the whole vault, and so we can
+    # tell which of them need re-embedding because their backlinks moved.
+    uploaded_names = {row.filename for row in uploaded}
+    stored_notes: list[tuple[int, str, str | None, str | None]] = []
+    seen_stored: set[str] = set()
+    for row in rows_by_id.values():
+        if not row.filename or not row.raw_content or row.id in uploaded_ids:
+            continue
+        if row.filename in uploaded_names or row.filename in seen_stored:
+            continue
+        try:
+            note_text = row.raw_content.decode("utf-8")
+        except UnicodeDecodeError:
+            continue
+        seen_stored.add(row.filename)
+        decoded_files.append(
+            {"filename": row.filename, "content_type": row.content_type or "text/plain", "text": note_text}
+        )
+        stored_notes.append((row.id, row.filename, row.content_type, row.embedding_hash))
+
+    obsidian_context = build_obsidian_context(decoded_files)
+    counts_result = await db.execute(
+        sql_text(
+            f"SELECT files_id, count(*) AS n FROM {EMBEDDING_TABLE} "
+            "WHERE session_id = :sid GROUP BY files_id"
+        ),
+        {"sid": session_id},
+    )
+    embedded_counts = {row.files_id: row.n for row in counts_result.fetchall()}
+
+    # Chunks from consecutive files are packed into shared embedding
+    # requests; each file is written and reported once its vectors land.
+    batcher = EmbeddingBatcher(db)
+
+    async def drain(final: bool = False) -> None:
+        async for done in batcher.drain(final=final):
+            await emit(await _persist_embedded(db, session_id, done))
+
+    for row in uploaded:
+        if row.id in decode_errors:
+            await emit({"status": "error", "filename": row.filename, "detail": decode_errors[row.id]})
+            continue
+        text = obsidian_context.get(row.filename, {}).get("embedding_text")
+        if text is None:
+            text = row.raw_content.decode("utf-8")
+        embedding_hash = _sha256_hex(text.encode("utf-8"))
+        if row.embedding_hash == embedding_hash and embedded_counts.get(row.id):
+            # Embedded text (incl. backlinks) hasn't moved: its chunks and
+            # vectors are still valid.
+            await emit(
+                {"status": "embedded", "filename": row.filename, "file_id": row.id, "unchanged": True}
+            )
+            continue
+        chunks = split_text_with_context(
+            text=text,
+            filename=row.filename,
+            content_type=row.content_type,
+            splitter=splitter,
+        )
+        if not chunks:
+            await emit({"status": "skipped", "filename": row.filename, "detail": "no text chunks produced"})
+            continue
+        batcher.add(
+            _EmbedTarget(
+                file_id=row.id,
+                filename=row.filename,
+                content_type=row.content_type,
+                embedding_hash=embedding_hash,
+            ),
+            chunks,
+        )
+        await drain()
+
+    # Stored notes outside this upload: re-embed only those whose
+    # embedded text changed, i.e. whose backlink set moved. Notes never
+    # embedded by this pipeline (no embedding_hash) are left to the lazy
+    # backfill in generate_flashcards.
+    for note_id, note_filename, note_type, note_embedding_hash in stored_notes:
+        if note_embedding_hash is None:
+            continue
+        note_text = obsidian_context.get(note_filename, {}).get("embedding_text")
+        if note_text is None:
+            continue
+        note_hash = _sha256_hex(note_text.encode("utf-8"))
+        if note_hash == note_embedding_hash:
+            continue
+        chunks = split_text_with_context(
+            text=note_text,
+            filename=note_filename,
+            content_type=note_type,
+            splitter=splitter,
+        )
+        if not chunks:
+            continue
+        batcher.add(
+            _EmbedTarget(
+                file_id=note_id,
+                filename=note_filename,
+                content_type=note_type,
+                embedding_hash=note_hash,
+                reindex=True,
+            ),
+            chunks,
+        )
+        await drain()
+
+    await drain(final=True)
+
+
+async def _run_ingestion_job(payload: dict) -> dict:
+    """Job handler: ingest an upload's stored notes, logging per-file events.
+
+    A reclaimed job reruns the whole ingestion, but attached clients count
+    every per-file event as a finished file, so files an earlier attempt
+    already reported are not logged again.
+    """
+    job_id = UUID(payload["job_id"])
+    session_id = UUID(payload["session_id"])
+    counts: dict[str, int] = {}
+    reported: set[str] = set()
+
+    async def emit(event: dict) -> None:
+        counts[event["status"]] = counts.get(event["status"], 0) + 1
+        if event["filename"] in reported:
+            return
+        reported.add(event["filename"])
+        await append_job_event(job_id, event)
+
+    async with AsyncSessionLocal() as db:
+        job = await get_job(db, job_id)
+        if job is not None:
+            reported.update(
+                event["filename"] for event in job.events or [] if event.get("filename")
+            )
+        await _ingest_files(db, session_id, [int(i) for i in payload["file_ids"]], emit)
+    return counts
+
+
+register_job_handler(
+    UPLOAD_INGEST_JOB, _run_ingestion_job, concurrency=UPLOAD_INGEST_CONCURRENCY
+)
+
+
+async def _progress_events(job_id: UUID, after: int) -> AsyncIterator[str]:
+    """SSE frames for an ingestion job's log from event ``after`` on.
+
+    Each event carries its log index as the SSE ``id``; reconnect with
+    ``after`` set to the last id + 1. The stream ends with ``[DONE]`` once the
+    job has succeeded, or with an error event if it failed.
+    """
+    idle_s = 0.0
+    async for progress in watch_job(job_id, after=after):
+        for index, event in progress.events:
+            yield f"id: {index}\ndata: {_json_dumps(event)}\n\n"
+        if progress.finished:
+            if progress.status == "succeeded":
+                yield "data: [DONE]\n\n"
+            else:
+                payload = {"status": "error", "detail": progress.error or "ingestion failed"}
+                yield f"data: {_json_dumps(payload)}\n\n"
+            return
+        idle_s = 0.0 if progress.events else idle_s + JOB_EVENTS_POLL_SECONDS
+        if idle_s >= UPLOAD_EVENTS_KEEPALIVE_SECONDS:
+            idle_s = 0.0
+            yield ": keep-alive\n\n"
+
+
+def _event_stream_response(stream: AsyncIterator[str]) -> StreamingResponse:
+    return StreamingResponse(
+        stream,
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",
+        },
+    )
+
+
 async def stream_document_upload(
     files: List[UploadFile],
     session_id: UUID | None,
 ) -> StreamingResponse:
+    """Store the uploaded notes, queue their ingestion and stream its progress.
+
+    The first event is ``session`` (with the ``job_id`` to re-attach with);
+    per-file ``embedded`` / ``skipped`` / ``error`` events for the uploaded
+    notes, ``reindexed`` / ``reindex_error`` ones for stored notes whose
+    backlinks moved, and the closing ``[DONE]`` follow as the ingestion job
+    produces them.
+    """
     if not files:
         raise HTTPException(status_code=400, detail="No files provided")
 
-    # Need to tune
-    splitter = RecursiveCharacterTextSplitter(chunk_size=512)
     # Read all uploads while the request context is active to avoid empty reads in the stream.
     prepared_files: list[tuple[str, bytes, str | None]] = []
     for uploaded in files:
@@ -32,191 +429,47 @@ async def stream_document_upload(
         prepared_files.append((uploaded.filename, raw_bytes, uploaded.content_type))
         await uploaded.close()
 
-    async def event_stream():
-        db = SessionLocal()
+    async with AsyncSessionLocal() as db:
         try:
             active_session_id = session_id
             if active_session_id is not None:
-                session_row = db.get(Sessions, active_session_id)
+                session_row = await db.get(Sessions, active_session_id)
                 if session_row is None:
-                    session_row = Sessions(id=active_session_id)
-                    db.add(session_row)
-                    db.commit()
-                    db.refresh(session_row)
+                    db.add(Sessions(id=active_session_id))
+                    await db.commit()
             else:
                 session_row = Sessions()
                 db.add(session_row)
-                db.commit()
-                db.refresh(session_row)
+                await db.commit()
+                await db.refresh(session_row)
                 active_session_id = session_row.id
 
-            yield f"data: {_json_dumps({'status': 'session', 'session_id': active_session_id})}\n\n"
-
-            decoded_files: list[dict] = []
-            decode_errors: dict[str, str] = {}
-            for filename, raw_bytes, content_type in prepared_files:
-                if not raw_bytes:
-                    continue
-                try:
-                    decoded_files.append(
-                        {
-                            "filename": filename,
-                            "content_type": content_type or "text/plain",
-                            "text": raw_bytes.decode("utf-8"),
-                        }
-                    )
-                except UnicodeDecodeError:
-                    decode_errors[filename] = "file is not valid utf-8 text"
-
-            obsidian_context = build_obsidian_context(decoded_files)
-
-            for filename, raw_bytes, content_type in prepared_files:
-                if not raw_bytes:
-                    payload = {
-                        "status": "skipped",
-                        "filename": filename,
-                        "detail": "empty file",
-                    }
-                    yield f"data: {_json_dumps(payload)}\n\n"
-                    continue
-
-                try:
-                    existing_rows = (
-                        db.query(Files)
-                        .filter(
-                            Files.session_id == active_session_id,
-                            Files.filename == filename,
-                        )
-                        .order_by(Files.id.asc())
-                        .all()
-                    )
-                    file_row = existing_rows[0] if existing_rows else None
-                    duplicate_rows = existing_rows[1:] if len(existing_rows) > 1 else []
-
-                    # Keep only one note row per (session_id, filename) and remove stale duplicates.
-                    if duplicate_rows:
-                        duplicate_ids = [row.id for row in duplicate_rows]
-                        db.execute(
-                            sql_text(
-                                f"DELETE FROM {EMBEDDING_TABLE} "
-                                "WHERE session_id = :sid AND files_id = ANY(:file_ids)"
-                            ),
-                            {"sid": active_session_id, "file_ids": duplicate_ids},
-                        )
-                        db.query(Files).filter(Files.id.in_(duplicate_ids)).delete(synchronize_session=False)
-
-                    if file_row is None:
-                        file_row = Files(
-                            session_id=active_session_id,
-                            filename=filename,
-                            content_type=content_type or "text/plain",
-                            raw_content=raw_bytes,
-                        )
-                        db.add(file_row)
-                    else:
-                        file_row.content_type = content_type or "text/plain"
-                        file_row.raw_content = raw_bytes
-
-                        # Overwrite means old embeddings are invalid once content changes.
-                        db.execute(
-                            sql_text(
-                                f"DELETE FROM {EMBEDDING_TABLE} "
-                                "WHERE session_id = :sid AND files_id = :fid"
-                            ),
-                            {"sid": active_session_id, "fid": file_row.id},
-                        )
-                    db.commit()
-                    db.refresh(file_row)
-                except Exception as e:
-                    try:
-                        db.rollback()
-                    except Exception:
-                        pass
-                    payload = {
-                        "status": "error",
-                        "filename": filename,
-                        "detail": f"failed to save file: {e}",
-                    }
-                    yield f"data: {_json_dumps(payload)}\n\n"
-                    continue
-
-                if filename in decode_errors:
-                    payload = {
-                        "status": "error",
-                        "filename": filename,
-                        "detail": decode_errors[filename],
-                    }
-                    yield f"data: {_json_dumps(payload)}\n\n"
-                    continue
-
-                text = obsidian_context.get(filename, {}).get("embedding_text")
-                if text is None:
-                    text = raw_bytes.decode("utf-8")
-
-                chunks = split_text_with_context(
-                    text=text,
-                    filename=filename,
-                    content_type=content_type,
-                    splitter=splitter,
-                )
-                if not chunks:
-                    payload = {
-                        "status": "skipped",
-                        "filename": filename,
-                        "detail": "no text chunks produced",
-                    }
-                    yield f"data: {_json_dumps(payload)}\n\n"
-                    continue
-                try:
-                    # non-blocking
-                    vectors = await embed_chunks(chunks)
-
-                    db.add_all([
-                        Embeddings(
-                            files_id=file_row.id,
-                            session_id=active_session_id,
-                            filename=filename,
-                            content_type=content_type or "text/plain",
-                            chunk_index=i,
-                            content=chunk,
-                            embedding=vec.tolist(),
-                        )
-                        for i, (chunk, vec) in enumerate(zip(chunks, vectors))
-                    ])
-                    # Commit per file so embeddings persist even if the stream is interrupted.
-                    db.commit()
-
-                    payload = {"status": "embedded", "filename": filename, "file_id": file_row.id}
-                    yield f"data: {_json_dumps(payload)}\n\n"
-                except Exception as e:
-                    try:
-                        db.rollback()
-                    except Exception:
-                        pass
-                    payload = {
-                        "status": "error",
-                        "filename": filename,
-                        "detail": str(e),
-                    }
-                    yield f"data: {_json_dumps(payload)}\n\n"
-
-            yield "data: [DONE]\n\n"
-        except Exception as e:
+            file_ids, events = await _store_uploaded_files(db, active_session_id, prepared_files)
+            job_id = uuid.uuid4()
+            job = await enqueue_job(
+                db,
+                UPLOAD_INGEST_JOB,
+                {"session_id": active_session_id, "file_ids": file_ids},
+                session_id=active_session_id,
+                job_id=job_id,
+                events=[
+                    {"status": "session", "session_id": active_session_id, "job_id": job_id},
+                    *events,
+                ],
+            )
+        except Exception as exc:
             try:
-                db.rollback()
+                await db.rollback()
             except Exception:
                 pass
-            payload = {"status": "error", "detail": str(e)}
-            yield f"data: {_json_dumps(payload)}\n\n"
-        finally:
-            db.close()
+            raise HTTPException(status_code=500, detail=f"failed to save files: {exc}") from exc
+    return _event_stream_response(_progress_events(job.id, 0))
 
-    return StreamingResponse(
-        event_stream(),
-        media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "X-Accel-Buffering": "no",
-        },
-    )
+
+async def stream_ingestion_progress(job_id: UUID, after: int = 0) -> StreamingResponse:
+    """Re-attach to an upload's ingestion progress from event ``after`` on."""
+    async with AsyncSessionLocal() as db:
+        job = await get_job(db, job_id)
+    if job is None or job.kind != UPLOAD_INGEST_JOB:
+        raise HTTPException(status_code=404, detail="upload job not found")
+    return _event_stream_response(_progress_events(job_id, after))
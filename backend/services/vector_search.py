@@ -0,0 +1,179 @@
+import os
+import threading
+from uuid import UUID
+
+from sqlalchemy import text as sql_text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from services.embedding_service import (
+    EMBEDDING_COARSE_SEARCH,
+    EMBEDDING_RERANK_MULTIPLIER,
+    EMBEDDING_TABLE,
+    coarse_distance_sql,
+    rerank_multiplier,
+)
+from utils.lru import TTLCache
+
+# Plans session-scoped KNN over `embeddings`. Every vector query filters on
+# session_id (and optionally files_id); on a shared table a global HNSW scan
+# either post-filters down to too few rows or the planner gives up on it and
+# scores the whole table. Two plans keep per-session latency flat as the
+# table grows:
+#
+#   exact - fetch the scope through the (session_id, files_id) btree into a
+#           MATERIALIZED CTE and sort it. Cost tracks the session, not the
+#           table, and recall is perfect. Right for typical vault sizes.
+#   ann   - shortlist on the compact HNSW index (EMBEDDING_COARSE_SEARCH)
+#           with pgvector's iterative index scan (0.8+), which keeps walking
+#           the graph until the filter has produced enough rows, then re-rank
+#           the shortlist by exact distance. Right for sessions too big to
+#           sort per query.
+#
+# Both run inside the session's hash partition (embeddings is partitioned by
+# session_id), so the btree and HNSW graph they use are partition-sized.
+# VECTOR_SEARCH_STRATEGY=auto picks per scope by row count.
+VECTOR_SEARCH_STRATEGY = os.getenv("VECTOR_SEARCH_STRATEGY", "auto").strip().lower()
+if VECTOR_SEARCH_STRATEGY not in {"auto", "exact", "ann"}:
+    VECTOR_SEARCH_STRATEGY = "auto"
+# Scopes up to this many chunks are searched exactly under `auto`.
+VECTOR_EXACT_SEARCH_MAX_ROWS = int(os.getenv("VECTOR_EXACT_SEARCH_MAX_ROWS", "20000"))
+# Scope sizes are cached per worker. A stale count only affects which plan is
+# used, never the rows returned, so there is no invalidation beyond the TTL.
+VECTOR_SCOPE_COUNT_TTL_SECONDS = float(os.getenv("VECTOR_SCOPE_COUNT_TTL_SECONDS", "300"))
+# HNSW query-time candidate list (pgvector `hnsw.ef_search`, default 40). Higher
+# = better recall, slower KNN; pick with benchmarks/ann_recall.py. Raised to the
+# shortlist size per query, since the index scan never returns more than
+# ef_search rows.
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "40"))
+# pgvector rejects hnsw.ef_search above this. Larger shortlists still fill up:
+# the strict_order iterative scan keeps returning rows past ef_search.
+HNSW_EF_SEARCH_MAX = 1000
+
+# Name of the CTE both plans read from instead of the table.
+SCOPED_CTE = "scoped"
+
+_scope_counts = TTLCache(4096, VECTOR_SCOPE_COUNT_TTL_SECONDS)
+_stats_lock = threading.Lock()
+_stats = {"exact": 0, "ann": 0}
+
+
+def shortlist_size(limit: int | None, coarse: str | None = None) -> int | None:
+    """Candidates the ``ann`` plan pulls from the compact index for ``limit`` rows."""
+    if limit is None:
+        return None
+    return limit * rerank_multiplier(coarse or EMBEDDING_COARSE_SEARCH)
+
+
+def build_embedding_filters(session_id: UUID | None, file_ids: list[int] | None):
+    clauses: list[str] = []
+    params: dict[str, object] = {}
+    if session_id is not None:
+        clauses.append("session_id = :sid")
+        params["sid"] = session_id
+    if file_ids:
+        clauses.append("files_id = ANY(:file_ids)")
+        params["file_ids"] = file_ids
+    return clauses, params
+
+
+async def _scope_row_count(
+    db: AsyncSession, session_id: UUID, file_ids: list[int] | None
+) -> int:
+    key = (session_id, tuple(sorted(file_ids)) if file_ids else None)
+    count = _scope_counts.get(key)
+    if count is None:
+        clauses, params = build_embedding_filters(session_id, file_ids)
+        result = await db.execute(
+            sql_text(
+                f"SELECT count(*) FROM {EMBEDDING_TABLE} WHERE " + " AND ".join(clauses)
+            ),
+            params,
+        )
+        count = int(result.scalar() or 0)
+        _scope_counts.set(key, count)
+    return count
+
+
+async def choose_vector_search(
+    db: AsyncSession,
+    session_id: UUID | None,
+    file_ids: list[int] | None,
+    *,
+    limit: int | None,
+    coarse: str | None = None,
+) -> str:
+    """Pick ``exact`` or ``ann`` for this scope and prepare the transaction for it.
+
+    Unscoped searches always use the index. For ``ann`` the HNSW settings are
+    applied transaction-locally, so call this in the same transaction as the
+    query it plans. ``coarse`` overrides EMBEDDING_COARSE_SEARCH and must be
+    passed to ``scoped_cte`` as well.
+    """
+    if session_id is None:
+        strategy = "ann"
+    elif VECTOR_SEARCH_STRATEGY != "auto":
+        strategy = VECTOR_SEARCH_STRATEGY
+    else:
+        count = await _scope_row_count(db, session_id, file_ids)
+        strategy = "exact" if count <= VECTOR_EXACT_SEARCH_MAX_ROWS else "ann"
+    with _stats_lock:
+        _stats[strategy] += 1
+    if strategy == "ann":
+        # set_config(..., true) is transaction-local, like SET LOCAL, but bindable.
+        # strict_order keeps iterative-scan results sorted by distance.
+        ef_search = min(
+            HNSW_EF_SEARCH_MAX, max(HNSW_EF_SEARCH, shortlist_size(limit, coarse) or 0)
+        )
+        await db.execute(
+            sql_text(
+                "SELECT set_config('hnsw.ef_search', :ef_search, true), "
+                "set_config('hnsw.iterative_scan', 'strict_order', true)"
+            ),
+            {"ef_search": str(ef_search)},
+        )
+    return strategy
+
+
+def scoped_cte(
+    strategy: str,
+    clauses: list[str],
+    columns: str,
+    *,
+    qvec_sql: str,
+    limit: int | None,
+    coarse: str | None = None,
+) -> tuple[str, str]:
+    """Return (cte, source) for a KNN over the filtered embeddings.
+
+    The outer query reads ``source`` (the CTE) and orders it by exact distance.
+    For ``exact`` the CTE is the whole scope, MATERIALIZED so the planner
+    sorts just the rows it read through the btree. For ``ann`` it is the
+    compact-index shortlist (``shortlist_size(limit, coarse)`` rows) that the
+    outer ORDER BY re-ranks. ``columns`` must cover everything the outer query reads.
+    """
+    where = ("WHERE " + " AND ".join(clauses) + " ") if clauses else ""
+    if strategy != "exact":
+        order = coarse_distance_sql(qvec_sql, coarse or EMBEDDING_COARSE_SEARCH)
+        shortlist = shortlist_size(limit, coarse)
+        limit_sql = f" LIMIT {int(shortlist)}" if shortlist is not None else ""
+        cte = (
+            f"{SCOPED_CTE} AS MATERIALIZED (SELECT {columns} FROM {EMBEDDING_TABLE} "
+            f"{where}ORDER BY {order}{limit_sql})"
+        )
+        return cte, SCOPED_CTE
+    cte = f"{SCOPED_CTE} AS MATERIALIZED (SELECT {columns} FROM {EMBEDDING_TABLE} {where})"
+    return cte, SCOPED_CTE
+
+
+def vector_search_stats() -> dict:
+    with _stats_lock:
+        plans = dict(_stats)
+    return {
+        "strategy": VECTOR_SEARCH_STRATEGY,
+        "exact_max_rows": VECTOR_EXACT_SEARCH_MAX_ROWS,
+        "hnsw_ef_search": HNSW_EF_SEARCH,
+        "coarse_search": EMBEDDING_COARSE_SEARCH,
+        "rerank_multiplier": EMBEDDING_RERANK_MULTIPLIER,
+        "plans": plans,
+        "scope_counts": _scope_counts.stats(),
+    }
@@ -0,0 +1,94 @@
+import asyncio
+import uuid
+
+import numpy as np
+import pytest
+
+from services import embedding_writer
+from services.embedding_service import EMBEDDING_DIM
+from tests.conftest import pg_session, requires_postgres
+
+
+async def _seed_note(db) -> tuple[uuid.UUID, int]:
+    from db.models import Files, Sessions
+
+    session = Sessions(id=uuid.uuid4())
+    db.add(session)
+    await db.flush()
+    note = Files(session_id=session.id, filename="note.md", content_type="text/markdown")
+    db.add(note)
+    await db.flush()
+    return session.id, note.id
+
+
+def _vectors(n: int) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    return rng.standard_normal((n, EMBEDDING_DIM)).astype(np.float32)
+
+
+@requires_postgres
+def test_copy_path_is_used_without_orm_fallback(monkeypatch):
+    async def no_fallback(*args, **kwargs):
+        raise AssertionError("COPY failed and fell back to the ORM insert")
+
+    monkeypatch.setattr(embedding_writer, "EMBEDDING_COPY_WRITES", True)
+    monkeypatch.setattr(embedding_writer, "_add_file_embeddings", no_fallback)
+    chunks = ["first chunk", "second chunk", "third chunk"]
+
+    async def run():
+        async with pg_session() as db:
+            session_id, files_id = await _seed_note(db)
+            rows = await embedding_writer.write_file_embeddings(
+                db,
+                session_id=session_id,
+                files_id=files_id,
+                filename="note.md",
+                content_type="text/markdown",
+                chunks=chunks,
+                vectors=_vectors(len(chunks)),
+            )
+            assert [(row[2], row[3]) for row in rows] == list(enumerate(chunks))
+            assert all(isinstance(row[0], int) for row in rows)
+
+    asyncio.run(run())
+
+
+@requires_postgres
+def test_encode_copy_rows_round_trips_through_copy():
+    from sqlalchemy import select
+
+    from db.models import Embeddings
+
+    # Characters the text COPY format would need escaping for, plus non-ASCII.
+    chunks = ["plain", "tab\there\nnewline \\N backslash", "ünïcödé ∑ 🧠", ""]
+    vectors = _vectors(len(chunks))
+
+    async def run():
+        async with pg_session() as db:
+            session_id, files_id = await _seed_note(db)
+            payload = embedding_writer.encode_copy_rows(
+                files_id=files_id,
+                session_id=session_id,
+                filename="nötes/lecture 1.md",
+                content_type="text/markdown",
+                chunks=chunks,
+                vectors=vectors,
+            )
+            await embedding_writer._copy_file_embeddings(db, payload)
+            result = await db.execute(
+                select(Embeddings)
+                .where(Embeddings.session_id == session_id)
+                .order_by(Embeddings.chunk_index)
+            )
+            stored = result.scalars().all()
+
+            assert [row.chunk_index for row in stored] == list(range(len(chunks)))
+            assert [row.content for row in stored] == chunks
+            for row in stored:
+                assert (row.files_id, row.session_id) == (files_id, session_id)
+                assert (row.filename, row.content_type) == ("nötes/lecture 1.md", "text/markdown")
+            np.testing.assert_array_equal(
+                np.array([row.embedding for row in stored], dtype=np.float32), vectors
+            )
+
+    asyncio.run(run())
@@ -0,0 +1,90 @@
+import random
+
+import pytest
+
+from services.flashcards_service import _FlashcardStreamParser, _parse_qa_blocks
+
+COMPLETION = """Q: What does HNSW stand for?
+A: Hierarchical Navigable Small World.
+Source: [2]
+
+Q: How do you reverse a list in Python?
+A:
+```python
+def rev(xs):
+    return xs[::-1]
+```
+Source: 3
+
+1. Question: What is a heap?
+Answer: A tree-shaped priority queue.
+It keeps the minimum at the root.
+"""
+
+EXPECTED = [
+    {
+        "question": "What does HNSW stand for?",
+        "answer": "Hierarchical Navigable Small World.",
+        "source_tag": 2,
+    },
+    {
+        "question": "How do you reverse a list in Python?",
+        "answer": "```python\ndef rev(xs):\n    return xs[::-1]\n```",
+        "source_tag": 3,
+    },
+    {
+        "question": "What is a heap?",
+        "answer": "A tree-shaped priority queue.\nIt keeps the minimum at the root.",
+        "source_tag": None,
+    },
+]
+
+
+def _feed_all(pieces: list[str]) -> list[dict]:
+    parser = _FlashcardStreamParser()
+    cards: list[dict] = []
+    for piece in pieces:
+        cards.extend(parser.feed(piece))
+    return cards + parser.finish()
+
+
+def _random_split(text: str, rng: random.Random) -> list[str]:
+    pieces, i = [], 0
+    while i < len(text):
+        step = rng.randint(1, 12)
+        pieces.append(text[i : i + step])
+        i += step
+    return pieces
+
+
+def test_whole_completion_matches_batch_parser():
+    assert _feed_all([COMPLETION]) == EXPECTED
+    assert _parse_qa_blocks(COMPLETION) == EXPECTED
+
+
+def test_single_character_tokens():
+    assert _feed_all(list(COMPLETION)) == EXPECTED
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_token_splits(seed):
+    assert _feed_all(_random_split(COMPLETION, random.Random(seed))) == EXPECTED
+
+
+def test_card_is_emitted_once_its_source_line_ends():
+    parser = _FlashcardStreamParser()
+    assert parser.feed("Q: What is 2+2?\nA: 4\nSource: [1") == []
+    assert parser.feed("]\n") == [{"question": "What is 2+2?", "answer": "4", "source_tag": 1}]
+
+
+def test_finish_flushes_unterminated_last_line():
+    parser = _FlashcardStreamParser()
+    assert parser.feed("Q: Capital of France?\nA: Paris") == []
+    assert parser.finish() == [
+        {"question": "Capital of France?", "answer": "Paris", "source_tag": None}
+    ]
+    assert parser.finish() == []
+
+
+def test_question_without_answer_is_dropped():
+    assert _feed_all(["Q: Dangling question?\n", "Source: 1\n"]) == []
@@ -0,0 +1,54 @@
+from services.generation_shards import build_shards, merge_shard_cards, split_card_budget
+
+
+def test_budget_sums_to_total():
+    assert split_card_budget(4, [100, 100, 100], [1, 1, 1]) == [2, 1, 1]
+    assert sum(split_card_budget(10, [3, 5, 7, 11], [1, 1, 1, 1])) == 10
+
+
+def test_budget_is_proportional():
+    assert split_card_budget(10, [800, 200], [1, 1]) == [8, 2]
+
+
+def test_budget_minimums_take_from_largest_share():
+    # The code-heavy small shard needs 3; the big shard gives them up.
+    assert split_card_budget(6, [900, 100], [1, 3]) == [3, 3]
+
+
+def test_budget_exceeds_total_only_for_minimums():
+    assert split_card_budget(2, [1, 1, 1], [1, 1, 1]) == [1, 1, 1]
+
+
+def test_build_shards_keeps_files_together_and_splits_budget():
+    items = [
+        ("a.md", 0, "a" * 300),
+        ("b.md", 0, "b" * 300),
+        ("a.md", 1, "a" * 300),
+        ("b.md", 1, "b" * 300),
+    ]
+    shards = build_shards(items, n_flashcards=5, max_chars=800)
+    assert [shard.tags for shard in shards] == [[0, 2], [1, 3]]
+    assert sum(shard.n_flashcards for shard in shards) == 5
+    assert shards[1].context.startswith("[0] b.md (chunk 0): ")
+
+
+def test_merge_remaps_tags_and_drops_duplicates():
+    items = [("a.md", 0, "alpha"), ("b.md", 0, "beta")]
+    shards = build_shards(items, n_flashcards=2, max_chars=20)
+    assert len(shards) == 2
+    merged = merge_shard_cards(
+        shards,
+        [
+            [{"question": "What is alpha?", "answer": "A", "source_tag": "0"}],
+            [
+                {"question": "what is alpha", "answer": "dup", "source_tag": 0},
+                {"question": "What is beta?", "answer": "B", "source_tag": 0},
+                {"question": "Unknown?", "answer": "C", "source_tag": 5},
+            ],
+        ],
+    )
+    assert [(card["question"], card["source_tag"]) for card in merged] == [
+        ("What is alpha?", 0),
+        ("What is beta?", 1),
+        ("Unknown?", None),
+    ]
@@ -0,0 +1,162 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from services import llm_scheduler
+from services.llm_scheduler import LLMScheduler
+
+
+def _scheduler(concurrency: int = 1, max_queue: int = 4) -> LLMScheduler:
+    return LLMScheduler("test", concurrency=concurrency, max_queue=max_queue)
+
+
+async def _settle() -> None:
+    # Let queued tasks run until they block again.
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_full_queue_is_rejected_with_retry_after():
+    async def run():
+        scheduler = _scheduler(concurrency=1, max_queue=0)
+        async with scheduler.slot():
+            with pytest.raises(HTTPException) as exc_info:
+                async with scheduler.slot():
+                    pass
+        assert exc_info.value.status_code == 429
+        assert int(exc_info.value.headers["Retry-After"]) >= 1
+        assert scheduler.stats["rejected"] == 1
+        assert scheduler.snapshot()["running"] == 0
+
+    asyncio.run(run())
+
+
+def test_queue_timeout_is_503_and_frees_the_queue(monkeypatch):
+    monkeypatch.setattr(llm_scheduler, "LLM_QUEUE_TIMEOUT_SECONDS", 0.05)
+
+    async def run():
+        scheduler = _scheduler()
+        async with scheduler.slot():
+            with pytest.raises(HTTPException) as exc_info:
+                async with scheduler.slot():
+                    pass
+            assert scheduler.snapshot()["waiting"] == 0
+        assert exc_info.value.status_code == 503
+        assert "Retry-After" in exc_info.value.headers
+        assert scheduler.stats["queue_timeouts"] == 1
+        assert scheduler.snapshot()["running"] == 0
+
+    asyncio.run(run())
+
+
+def test_accepted_work_skips_rejection_and_timeout(monkeypatch):
+    monkeypatch.setattr(llm_scheduler, "LLM_QUEUE_TIMEOUT_SECONDS", 0.01)
+
+    async def run():
+        scheduler = _scheduler(concurrency=1, max_queue=0)
+        entered = asyncio.Event()
+
+        async def waiter():
+            async with scheduler.slot(reject_when_full=False):
+                entered.set()
+
+        async with scheduler.slot():
+            task = asyncio.create_task(waiter())
+            await asyncio.sleep(0.05)
+            assert not entered.is_set()
+            assert scheduler.snapshot()["waiting"] == 1
+        await task
+        assert entered.is_set()
+        assert scheduler.snapshot()["running"] == 0
+
+    asyncio.run(run())
+
+
+def test_release_hands_the_slot_to_a_waiter():
+    async def run():
+        scheduler = _scheduler()
+        order: list[str] = []
+
+        async def waiter(name: str):
+            async with scheduler.slot():
+                order.append(name)
+                assert scheduler.snapshot()["running"] == 1
+
+        async with scheduler.slot():
+            tasks = [asyncio.create_task(waiter(name)) for name in ("a", "b")]
+            await _settle()
+            assert scheduler.snapshot()["waiting"] == 2
+        await asyncio.gather(*tasks)
+        assert order == ["a", "b"]
+        snapshot = scheduler.snapshot()
+        assert (snapshot["running"], snapshot["waiting"], snapshot["admitted"]) == (0, 0, 3)
+
+    asyncio.run(run())
+
+
+def test_small_decks_overtake_large_ones():
+    async def run():
+        scheduler = _scheduler()
+        order: list[int] = []
+
+        async def waiter(n_flashcards: int):
+            async with scheduler.slot(n_flashcards):
+                order.append(n_flashcards)
+
+        async with scheduler.slot():
+            tasks = []
+            for n_flashcards in (40, 20, 1):
+                tasks.append(asyncio.create_task(waiter(n_flashcards)))
+                await _settle()
+        await asyncio.gather(*tasks)
+        assert order == [1, 20, 40]
+
+    asyncio.run(run())
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def run():
+        scheduler = _scheduler()
+
+        async def waiter():
+            async with scheduler.slot():
+                pass
+
+        async with scheduler.slot():
+            task = asyncio.create_task(waiter())
+            await _settle()
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            assert scheduler.snapshot()["waiting"] == 0
+        assert scheduler.snapshot()["running"] == 0
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("reject_when_full", [True, False])
+def test_slot_handed_to_a_cancelled_waiter_is_passed_on(reject_when_full):
+    async def run():
+        scheduler = _scheduler()
+        entered: list[str] = []
+
+        async def waiter(name: str):
+            async with scheduler.slot(reject_when_full=reject_when_full):
+                entered.append(name)
+
+        async with scheduler.slot():
+            first = asyncio.create_task(waiter("first"))
+            await _settle()
+            second = asyncio.create_task(waiter("second"))
+            await _settle()
+        # The holder's release has handed the slot to `first`, which has not
+        # resumed yet; cancelling it now must not leak the slot.
+        first.cancel()
+        await asyncio.gather(first, return_exceptions=True)
+        await asyncio.wait_for(second, timeout=1)
+        assert "second" in entered
+        snapshot = scheduler.snapshot()
+        assert (snapshot["running"], snapshot["waiting"]) == (0, 0)
+
+    asyncio.run(run())
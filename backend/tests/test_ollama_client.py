@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+
+from services import ollama_client
+from services.ollama_client import ollama_client_stats, track_ollama_call
+
+
+@pytest.fixture(autouse=True)
+def _fresh_stats(monkeypatch):
+    monkeypatch.setattr(ollama_client, "_stats", {})
+    monkeypatch.setattr(
+        ollama_client, "_health", {"last_ok_at": None, "last_error_at": None, "last_error": None}
+    )
+
+
+async def _tracked_stream(n: int):
+    with track_ollama_call("chat_stream"):
+        for i in range(n):
+            yield i
+
+
+def _stream_stats() -> dict:
+    return ollama_client_stats()["operations"]["chat_stream"]
+
+
+def test_consumed_stream_counts_as_success():
+    async def consume():
+        return [token async for token in _tracked_stream(3)]
+
+    assert asyncio.run(consume()) == [0, 1, 2]
+    stats = _stream_stats()
+    assert (stats["calls"], stats["errors"]) == (1, 0)
+
+
+def test_closed_stream_counts_as_error():
+    async def abandon():
+        stream = _tracked_stream(3)
+        await stream.__anext__()
+        await stream.aclose()
+
+    asyncio.run(abandon())
+    stats = _stream_stats()
+    assert (stats["calls"], stats["errors"]) == (1, 1)
+    assert ollama_client_stats()["last_error"] == "chat_stream: GeneratorExit"
+
+
+def test_cancelled_stream_counts_as_error():
+    async def slow_stream():
+        with track_ollama_call("chat_stream"):
+            yield 0
+            await asyncio.sleep(10)
+            yield 1
+
+    async def cancel():
+        async def consume():
+            async for _ in slow_stream():
+                pass
+
+        task = asyncio.create_task(consume())
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel())
+    stats = _stream_stats()
+    assert (stats["calls"], stats["errors"]) == (1, 1)
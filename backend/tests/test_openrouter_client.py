@@ -0,0 +1,136 @@
+import asyncio
+import json
+
+import httpx
+import numpy as np
+import pytest
+from fastapi import HTTPException
+
+from services import embedding_service, flashcards_service
+
+STUB_BASE_URL = "http://openrouter.stub/api/v1"
+
+
+class _Stub:
+    """Stand-in for OpenRouter: records requests and replays one canned response."""
+
+    def __init__(self) -> None:
+        self.requests: list[httpx.Request] = []
+        self.response = httpx.Response(500)
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        return self.response
+
+    def client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(transport=httpx.MockTransport(self.handler))
+
+    @property
+    def sent(self) -> dict:
+        return json.loads(self.requests[-1].content)
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    stub = _Stub()
+    for module in (flashcards_service, embedding_service):
+        monkeypatch.setattr(module, "OPENROUTER_BASE_URL", STUB_BASE_URL)
+        monkeypatch.setattr(module, "OPENROUTER_API_KEY", "test-key")
+        monkeypatch.setattr(module, "get_async_client", stub.client)
+    return stub
+
+
+def _sse(*events: str) -> httpx.Response:
+    body = "".join(f"{event}\n\n" for event in events)
+    return httpx.Response(200, text=body, headers={"Content-Type": "text/event-stream"})
+
+
+def _delta(text: str, model: str = "stub/model") -> str:
+    return "data: " + json.dumps({"model": model, "choices": [{"delta": {"content": text}}]})
+
+
+async def _collect(stream) -> list:
+    return [item async for item in stream]
+
+
+def test_chat_returns_content_and_model(stub):
+    stub.response = httpx.Response(
+        200,
+        json={"model": "stub/model", "choices": [{"message": {"content": "Q: a\nA: b"}}]},
+    )
+    content, model = asyncio.run(flashcards_service._openrouter_chat("prompt", 256))
+
+    assert (content, model) == ("Q: a\nA: b", "stub/model")
+    request = stub.requests[-1]
+    assert str(request.url) == f"{STUB_BASE_URL}/chat/completions"
+    assert request.headers["Authorization"] == "Bearer test-key"
+    assert stub.sent["max_tokens"] == 256
+    assert stub.sent["messages"] == [{"role": "user", "content": "prompt"}]
+
+
+def test_chat_maps_auth_failure_to_401(stub):
+    stub.response = httpx.Response(403, json={"error": {"message": "bad key"}})
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(flashcards_service._openrouter_chat("prompt", 256))
+    assert exc_info.value.status_code == 401
+
+
+def test_chat_surfaces_error_payload_as_503(stub):
+    stub.response = httpx.Response(200, json={"error": {"message": "model overloaded"}})
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(flashcards_service._openrouter_chat("prompt", 256))
+    assert exc_info.value.status_code == 503
+    assert "model overloaded" in exc_info.value.detail
+
+
+def test_chat_stream_yields_deltas_until_done(stub):
+    stub.response = _sse(
+        ": OPENROUTER PROCESSING",
+        _delta("Q: a"),
+        "data: not json",
+        _delta("\nA: b"),
+        "data: [DONE]",
+        _delta("after done"),
+    )
+    chunks = asyncio.run(_collect(flashcards_service._openrouter_chat_stream("prompt", 256)))
+
+    assert chunks == [("Q: a", "stub/model"), ("\nA: b", "stub/model")]
+    assert stub.sent["stream"] is True
+
+
+@pytest.mark.parametrize(
+    ("upstream_status", "expected_status"),
+    [(401, 401), (403, 401), (400, 503), (429, 503)],
+)
+def test_chat_stream_maps_4xx_to_http_exception(stub, upstream_status, expected_status):
+    stub.response = httpx.Response(upstream_status, json={"error": {"message": "nope"}})
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(_collect(flashcards_service._openrouter_chat_stream("prompt", 256)))
+    assert exc_info.value.status_code == expected_status
+
+
+def test_chat_stream_raises_on_mid_stream_error(stub):
+    stub.response = _sse(_delta("Q: a"), 'data: {"error": {"message": "upstream died"}}')
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(_collect(flashcards_service._openrouter_chat_stream("prompt", 256)))
+    assert "upstream died" in exc_info.value.detail
+
+
+def test_embed_returns_float32_matrix(stub):
+    dim = embedding_service.EMBEDDING_DIM
+    stub.response = httpx.Response(
+        200, json={"data": [{"embedding": [0.5] * dim}, {"embedding": [0.25] * dim}]}
+    )
+    vectors = asyncio.run(embedding_service._openrouter_embed(["first", "second"]))
+
+    assert vectors.dtype == np.float32
+    assert vectors.shape == (2, dim)
+    assert str(stub.requests[-1].url) == f"{STUB_BASE_URL}/embeddings"
+    assert stub.sent["input"] == ["first", "second"]
+    assert stub.sent["dimensions"] == dim
+
+
+def test_embed_raises_on_error_status(stub):
+    stub.response = httpx.Response(500, text="internal error")
+    with pytest.raises(RuntimeError, match="internal error"):
+        asyncio.run(embedding_service._openrouter_embed(["text"]))
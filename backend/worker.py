@@ -0,0 +1,45 @@
+"""Standalone job worker: drains the `jobs` table outside the API process.
+
+Run one or more next to the API (which can then set JOB_WORKERS_IN_PROCESS=0)
+to scale LLM work separately from request handling:
+
+  python -m worker                        # every job kind
+  python -m worker --kinds uploads.ingest # only upload ingestion
+
+Each process runs a separate pool per job kind (JOB_WORKER_CONCURRENCY,
+UPLOAD_INGEST_CONCURRENCY); workers on any host share the queue through
+FOR UPDATE SKIP LOCKED.
+"""
+
+import argparse
+import asyncio
+
+from db.session import async_engine
+from services.embedding_service import EMBEDDING_BACKEND
+# Importing the services registers their job handlers.
+from services.flashcards_service import USE_OPENROUTER
+from services.http_client import close_http_clients
+from services.jobs import job_kinds, run_job_workers
+from services.ollama_client import close_ollama_clients, init_ollama_clients
+import services.upload_service  # noqa: F401
+
+
+async def main(kinds: list[str] | None) -> None:
+    if EMBEDDING_BACKEND.lower() == "ollama" or not USE_OPENROUTER:
+        init_ollama_clients()
+    try:
+        await run_job_workers(kinds)
+    finally:
+        await close_http_clients()
+        await close_ollama_clients()
+        await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run background job workers.")
+    parser.add_argument("--kinds", nargs="+", choices=job_kinds(), default=None)
+    args = parser.parse_args()
+    try:
+        asyncio.run(main(args.kinds))
+    except KeyboardInterrupt:
+        pass